@@ -0,0 +1,185 @@
+"""End-to-end throughput benchmarks against the fake 4D server.
+
+The server runs in a separate process (python -m fourd.mockserver) so
+that its work does not share the interpreter with the driver. Each
+benchmark reports rows/sec, bytes/sec, the recv and send calls made by
+the driver, and the allocations measured in a separate tracemalloc pass.
+
+    python benchmarks/bench_fourd.py --rows 100000 --json results.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fourd
+from fourd.bulk import bulk_load
+from fourd.mockserver import DEFAULT_COLUMNS
+
+
+class MockServerProcess:
+
+    def __init__(self, rows, columns, width, latency):
+        self.args = [sys.executable, '-m', 'fourd.mockserver', '--rows', str(rows),
+            '--columns', columns, '--width', str(width), '--latency', str(latency)]
+
+    def __enter__(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [sys.path[0], env.get('PYTHONPATH')]))
+        self.process = subprocess.Popen(self.args, stdout=subprocess.PIPE, text=True, env=env)
+        self.port = int(self.process.stdout.readline())
+        return self
+
+    def __exit__(self, ex_type, ex_val, tb):
+        self.process.terminate()
+        self.process.wait()
+
+    def connect(self, **kwargs):
+        return fourd.connect(host='127.0.0.1', port=self.port, user='bench',
+            password='bench', **kwargs)
+
+
+def io_counters(connection):
+    fourdconn = connection.fourdconn
+    return dict(recv_calls=fourdconn.reader.recv_calls,
+        bytes_received=fourdconn.reader.bytes_received,
+        send_calls=fourdconn.send_calls, bytes_sent=fourdconn.bytes_sent)
+
+
+def measure(run, repeat):
+    """Best wall time of repeat runs, then one run under tracemalloc"""
+    best = None
+    for i in range(repeat):
+        started = perf_counter()
+        result = run()
+        elapsed = perf_counter()-started
+        if best is None or elapsed<best[0]:
+            best = (elapsed, result)
+    tracemalloc.start()
+    run()
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+    elapsed, result = best
+    result.update(seconds=elapsed, peak_bytes=peak, live_blocks=blocks)
+    return result
+
+
+def bench_fetchall(server, args):
+    connection = server.connect(**args.connect_kwargs)
+    cursor = connection.cursor()
+
+    def run():
+        before = io_counters(connection)
+        cursor.execute("SELECT * FROM bench")
+        rows = len(cursor.fetchall())
+        after = io_counters(connection)
+        result = dict((key, after[key]-before[key]) for key in after)
+        result['rows'] = rows
+        return result
+    result = measure(run, args.repeat)
+    connection.close()
+    return result
+
+
+def bench_executemany(server, args):
+    connection = server.connect(**args.connect_kwargs)
+    cursor = connection.cursor()
+    params = [(i, 'name %d'%i, i*1.5) for i in range(args.insert_rows)]
+
+    def run():
+        before = io_counters(connection)
+        cursor.executemany("INSERT INTO bench VALUES (%s, %s, %s)", params)
+        after = io_counters(connection)
+        result = dict((key, after[key]-before[key]) for key in after)
+        result['rows'] = cursor.rowcount
+        return result
+    result = measure(run, args.repeat)
+    connection.close()
+    return result
+
+
+def bench_bulk(server, args):
+    connection = server.connect(**args.connect_kwargs)
+    params = [(i, 'name %d'%i, i*1.5) for i in range(args.insert_rows)]
+
+    def run():
+        before = io_counters(connection)
+        stats = bulk_load(connection, 'bench', ['id', 'name', 'amount'], params)
+        after = io_counters(connection)
+        result = dict((key, after[key]-before[key]) for key in after)
+        result['rows'] = stats.rows
+        return result
+    result = measure(run, args.repeat)
+    connection.close()
+    return result
+
+
+def bench_connect(server, args):
+
+    def run():
+        result = dict(rows=0, recv_calls=0, send_calls=0, bytes_received=0, bytes_sent=0)
+        for i in range(args.connections):
+            connection = server.connect(**args.connect_kwargs)
+            for key, value in io_counters(connection).items():
+                result[key] += value
+            connection.close()
+        result['rows'] = args.connections
+        return result
+    return measure(run, args.repeat)
+
+
+BENCHMARKS = dict(fetchall=bench_fetchall, executemany=bench_executemany,
+    bulk=bench_bulk, connect=bench_connect)
+
+
+def report(name, result):
+    seconds = result['seconds']
+    result['rows_per_sec'] = result['rows']/seconds if seconds else 0
+    result['bytes_per_sec'] = (result['bytes_received']+result['bytes_sent'])/seconds if seconds else 0
+    print('{:<12} {:>10} rows {:>9.3f}s {:>12.0f} rows/s {:>8.1f} MB/s '
+          'recv {:>7} send {:>7} peak {:>8.1f} KB blocks {:>8}'.format(
+        name, result['rows'], seconds, result['rows_per_sec'],
+        result['bytes_per_sec']/1e6, result['recv_calls'], result['send_calls'],
+        result['peak_bytes']/1024, result['live_blocks']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="fourd driver benchmarks")
+    parser.add_argument('benchmarks', nargs='*', default=list(BENCHMARKS))
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--columns', default=','.join(dtype for name, dtype in DEFAULT_COLUMNS))
+    parser.add_argument('--width', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--insert-rows', type=int, default=10000)
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=None)
+    parser.add_argument('--prefetch', type=int, default=0)
+    parser.add_argument('--row-format', default=None)
+    parser.add_argument('--pipeline-login', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args(argv)
+    args.connect_kwargs = dict(prefetch=args.prefetch, row_format=args.row_format,
+        pipeline_login=args.pipeline_login)
+    if args.page_size:
+        args.connect_kwargs['res_size'] = args.page_size
+    results = {}
+    with MockServerProcess(args.rows, args.columns, args.width, args.latency) as server:
+        for name in args.benchmarks:
+            results[name] = BENCHMARKS[name](server, args)
+            report(name, results[name])
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
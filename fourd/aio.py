@@ -0,0 +1,570 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from time import monotonic, perf_counter
+from .lib import FourD, FourDResponse, FourDWireReader, FourDExecuteStatement, \
+    FourDExecuteStatementPlain, FourDCloseStatement, FourDLogout, FourDQuit, bCRLF, \
+    tune_socket
+from .fourd import FourD_cursor, connect_arguments, FourDNumpyColumns
+from .exceptions import *
+
+
+class FourDIncompleteRead(Exception):
+    """Raised by FourDBufferReader when the buffered data runs out"""
+
+
+class FourDBufferReader(FourDWireReader):
+    """Wire reader fed by an asyncio stream instead of a blocking socket.
+
+    Decoding runs on the buffered bytes only; running out of data raises
+    FourDIncompleteRead so the caller can rewind, await more and retry.
+    """
+
+    def __init__(self, chunk_size=None):
+        super().__init__(None, chunk_size)
+
+    def _fill(self, size):
+        raise FourDIncompleteRead()
+
+    def feed(self, data):
+        self._reserve(self.end-self.start+len(data))
+        self.view[self.end:self.end+len(data)] = data
+        self.end += len(data)
+        self.bytes_received += len(data)
+
+    def has_header(self):
+        return self.buffer.find(2*bCRLF, self.start, self.end) != -1
+
+
+class AsyncFourDResponse(FourDResponse):
+    """FourDResponse whose initial page is read by the async connection"""
+
+    def _initialize(self):
+        self._rows_deque = deque()
+
+
+class AsyncFourD(FourD):
+    """asyncio counterpart of FourD, one command in flight at a time.
+
+    Commands are serialized with the same FourDCommand classes and the
+    responses decoded by FourDResponse; only the transport differs.
+    Statements are sent with EXECUTE-STATEMENT directly, without a
+    separate PREPARE-STATEMENT round trip.
+
+    A command cancelled before its response was read, e.g. by a
+    wait_for timeout, leaves that response on the wire: the connection
+    is closed then, and its later commands raise OperationalError.
+    """
+    # set once a cancelled command left the stream out of sync
+    _aborted = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prefetch = 0
+        self.page_sizer = None
+        self.lob_threshold = None
+        self._lock = asyncio.Lock()
+        self._stream = None
+        self._writer = None
+
+    async def connect(self):
+        if self.connected:
+            return
+        self._stream, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.connect_timeout)
+        tune_socket(self._writer.get_extra_info('socket'), **self.socket_options)
+        self.reader = FourDBufferReader()
+        self.tracer = self.tracer
+        if self.pipeline_login:
+            self._login_cmd = self._login_command()
+            self._deferred.insert(0, self._login_cmd)
+        else:
+            await self.fourd_send(self._login_command())
+        self.connected=True
+
+    def is_alive(self):
+        return (self.connected and not self._writer.is_closing()
+            and not self.reader.available)
+
+    def _abort(self):
+        """Close a connection left out of sync by a command cut short"""
+        self._aborted = True
+        self.connected = False
+        self._writer.close()
+
+    def _check_sync(self):
+        if self._aborted:
+            raise OperationalError("Connection closed after a cancelled command")
+
+    def prepare_statement(self, statement, statement_params=None):
+        raise NotSupportedError("asyncio connections execute statements without PREPARE")
+
+    def close_statement(self, statement_id):
+        # statements are released with the next command, see release_statement
+        raise NotSupportedError("close_statement is not supported by asyncio connections")
+
+    def execute_statements(self, statements, *args, **kwargs):
+        raise NotSupportedError("execute_statements is not supported by asyncio connections")
+
+    def _socket_send(self, bytes_value):
+        if not isinstance(bytes_value, (bytes, bytearray)):
+            bytes_value = bytes(bytes_value)
+        self._writer.write(bytes_value)
+
+    async def _receive(self):
+        if self.reader.clock is not None:
+            started = perf_counter()
+            data = await self._stream.read(self.reader.chunk_size)
+            self.reader.wait_time += perf_counter()-started
+        else:
+            data = await self._stream.read(self.reader.chunk_size)
+        if not data:
+            raise OperationalError("Connection closed by the server")
+        self.reader.feed(data)
+
+    async def _read(self, function, *args):
+        """Call a decoding function, awaiting more data until it completes"""
+        while True:
+            mark = self.reader.start
+            try:
+                return function(*args)
+            except FourDIncompleteRead:
+                self.reader.start = mark
+                await self._receive()
+
+    async def _read_header(self):
+        while not self.reader.has_header():
+            await self._receive()
+
+    async def _read_rows(self, response, count):
+        rows = []
+        reader = self.reader
+        while len(rows)<count:
+            mark = reader.start
+            try:
+                rows.append(response._read_row())
+            except FourDIncompleteRead:
+                reader.start = mark
+                response.row_count_received -= 1
+                await self._receive()
+        return rows
+
+    async def _response(self, command):
+        await self._read_header()
+        response = AsyncFourDResponse(command=command, connection=self)
+        if isinstance(command, (FourDExecuteStatement, FourDExecuteStatementPlain)):
+            if response.is_result_set:
+                response.columns
+                rows = await self._read_rows(response, response.initial_row_count_sent)
+                response._rows_cache.extend(rows)
+            elif response.is_update_count:
+                response._update_count = await self._read(response._read_update_count)
+            response._release_if_complete()
+        return response
+
+    async def _read_deferred(self, commands):
+        error = None
+        for command in commands:
+            try:
+                await self._response(command)
+            except FourDException as e:
+                if not isinstance(command, FourDCloseStatement):
+                    command.error = e
+                    error = error or e
+        return error
+
+    async def fourd_send(self, command, response_factory=None):
+        async with self._lock:
+            self._check_sync()
+            try:
+                return await self._exchange(command)
+            except FourDException:
+                raise
+            except BaseException:
+                # cancelled or failed half way: responses are left unread
+                self._abort()
+                raise
+
+    async def _exchange(self, command):
+        if self._guards(command):
+            deferred, deferred_bytes = self._take_deferred()
+            self._socket_send(deferred_bytes)
+            await self._writer.drain()
+            error = await self._read_deferred(deferred)
+            if error is not None:
+                raise error
+        deferred, deferred_bytes = self._take_deferred()
+        self._socket_send(deferred_bytes+bytes(command) if deferred else command)
+        await self._writer.drain()
+        error = await self._read_deferred(deferred)
+        try:
+            response = await self._response(command)
+        except FourDException:
+            if error is None:
+                raise
+            response = None
+        if error is not None:
+            if response is not None:
+                response.close()
+            raise error
+        return response
+
+    async def execute_statement(self, statement, statement_params=None, first_page_size=0,
+            row_format=None):
+        statement_cmd = self._execute_command(statement, statement_params, first_page_size,
+            row_format)
+        with self.trace('execute', statement) as trace:
+            response = await self.fourd_send(statement_cmd)
+            trace.set_response(response)
+        return response
+
+    async def fetch_page(self, response):
+        """Fetch the next page of a result set and return its rows"""
+        async with self._lock:
+            self._check_sync()
+            try:
+                with self.trace('fetch', response=response):
+                    response._send_fetch(*response._next_page())
+                    await self._writer.drain()
+                    await self._read_header()
+                    first_row, last_row = response._receive_fetch()
+                    rows = await self._read_rows(response, last_row-first_row+1)
+            except FourDException:
+                raise
+            except BaseException:
+                self._abort()
+                raise
+            response._release_if_complete()
+            return rows
+
+    async def close(self):
+        logged_in = not self.cancel_deferred(self._login_cmd)
+        self._deferred = []
+        try:
+            if self.connected and logged_in:
+                await self.fourd_send(FourDLogout())
+                await self.fourd_send(FourDQuit())
+        finally:
+            self.connected=False
+            self._writer.close()
+            self.statement_cache.clear()
+
+
+class AsyncFourD_cursor(FourD_cursor):
+    """Cursor of an AsyncFourD_connection; execute and fetch are coroutines"""
+
+    async def execute(self, query, params=None, describe=True):
+        self._check_connection()
+        self._rowcount = None
+        query, params = self._bind_query(query, params)
+        if not self.connection.in_transaction:
+            await self.connection._start_transaction()
+        self._release_result()
+        self.result = await self.fourdconn.execute_statement(query,
+                        statement_params=params,
+                        first_page_size= self.pagesize or self.fourdconn.res_size,
+                        row_format=self.row_format)
+        if describe:
+            self._describe()
+
+    async def executemany(self, query, params):
+        rowcount = 0
+        for execution_params in params:
+            await self.execute(query, execution_params, describe=False)
+            rowcount += self.result.update_count or 0
+        self._describe()
+        self._release_result()
+        self._rowcount = rowcount
+
+    async def pages(self):
+        """Iterate over the remaining rows one page at a time"""
+        self.check_fetch()
+        result = self.result
+        if result.is_update_count:
+            return
+        if result._rows_cache:
+            page = list(result._rows_cache)
+            result._rows_cache.clear()
+            result.row_number += len(page)
+            yield page
+        while result.row_number<result.row_count:
+            page = await self.fourdconn.fetch_page(result)
+            result.row_number += len(page)
+            yield page
+
+    async def fetchone(self):
+        self.check_fetch()
+        result = self.result
+        if result.is_update_count or result.row_number>=result.row_count:
+            return None
+        if not result._rows_cache:
+            result._rows_cache.extend(await self.fourdconn.fetch_page(result))
+        result.row_number += 1
+        return result._rows_cache.popleft()
+
+    async def fetchmany(self, size=FourD_cursor.arraysize):
+        rows = []
+        for i in range(size):
+            row = await self.fetchone()
+            if row is None:
+                break
+            rows.append(row)
+        return rows
+
+    async def fetchall(self):
+        rows = []
+        async for page in self.pages():
+            rows.extend(page)
+        return rows
+
+    async def fetch_columns(self):
+        """Fetch the remaining rows as a dict of column name -> list of values"""
+        self.check_fetch()
+        result = self.result
+        if result.is_update_count:
+            return {}
+        data = [[] for c in result.columns]
+        async for page in self.pages():
+            for values, page_values in zip(data, result._row_columns(page)):
+                values.extend(page_values)
+        return dict(zip([c.name for c in result.columns], data))
+
+    async def fetchnumpy(self):
+        """Fetch the remaining rows as a dict of column name -> numpy masked array"""
+        try:
+            import numpy
+        except ImportError:
+            raise NotSupportedError("fetchnumpy requires numpy")
+        self.check_fetch()
+        result = self.result
+        if result.is_update_count:
+            return {}
+        arrays = FourDNumpyColumns(numpy, result.columns, result.row_count-result.row_number)
+        async for page in self.pages():
+            arrays.add_page(result._row_columns(page))
+        return arrays.arrays()
+
+    def export(self, path, format=None, **options):
+        # the blocking export reads pages straight from the socket
+        raise NotSupportedError("export is not supported by asyncio cursors")
+
+    def __next__(self):
+        raise NotSupportedError("asyncio cursors are iterated with async for")
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        row = await self.fetchone()
+        if row is None:
+            raise StopAsyncIteration
+        return row
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, ex_type, ex_val, tb):
+        self.close()
+
+
+class AsyncFourD_connection:
+
+    _in_transaction = False
+    _begin_cmd = None
+
+    @property
+    def in_transaction(self):
+        # a START TRANSACTION that failed leaves no transaction to join
+        return self._in_transaction and getattr(self._begin_cmd, 'error', None) is None
+
+    @in_transaction.setter
+    def in_transaction(self, in_transaction):
+        self._in_transaction = in_transaction
+
+    def __init__(self, fourdconn, cursor_factory=None):
+        self.cursor_factory = cursor_factory or AsyncFourD_cursor
+        self.cursors = []
+        self.fourdconn = fourdconn
+        self.connected = fourdconn.connected
+
+    async def _start_transaction(self):
+        if self.in_transaction:
+            return
+        self.in_transaction = True
+        self._begin_cmd = self.fourdconn.defer_statement("START TRANSACTION;", guarded=True)
+
+    async def _end_transaction(self, statement):
+        self.in_transaction = False
+        if self.fourdconn.cancel_deferred(self._begin_cmd):
+            return
+        if getattr(self._begin_cmd, 'error', None) is None:
+            (await self.fourdconn.execute_statement(statement)).close()
+
+    async def close(self):
+        # nothing to roll back on a connection aborted by a cancelled command
+        if self.in_transaction and self.fourdconn.connected:
+            await self.rollback()
+        self.in_transaction = False
+        if self.connected:
+            await self.fourdconn.close()
+        self.connected = False
+
+    async def commit(self):
+        if self.in_transaction:
+            await self._end_transaction("COMMIT;")
+        self.in_transaction = False
+
+    async def rollback(self):
+        if self.in_transaction:
+            await self._end_transaction("ROLLBACK;")
+        self.in_transaction = False
+
+    def cursor(self, cursor_factory=None):
+        cursor = (cursor_factory or self.cursor_factory)(self, self.fourdconn)
+        self.cursors.append(cursor)
+        return cursor
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, ex_type, ex_val, tb):
+        if self.in_transaction:
+            if ex_type is not None:
+                await self.rollback()
+            else:
+                await self.commit()
+
+
+async def connect(dsn=None, host=None, port=None, user=None, password=None,
+    database=None, cursor_factory=None, **kwargs):
+    connect_kw = connect_arguments(dsn=dsn, host=host, port=port, user=user,
+        password=password, database=database, **kwargs)
+    fourdconn = AsyncFourD(**connect_kw)
+    await fourdconn.connect()
+    return AsyncFourD_connection(fourdconn, cursor_factory=cursor_factory)
+
+
+class AsyncFourDPool:
+    """asyncio pool of AsyncFourD_connection objects.
+
+    Opens minconn connections on open() and up to maxconn on demand;
+    connections are checked on acquire and rolled back on release.
+    Remaining keyword arguments are passed to fourd.aio.connect.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=30, **connect_kwargs):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.connect_kwargs = connect_kwargs
+        self._condition = asyncio.Condition()
+        self._idle = deque()
+        self._size = 0
+        self._closed = False
+        self.checkouts = 0
+        self.wait_time = 0.0
+
+    async def open(self):
+        for i in range(self.minconn-self._size):
+            self._size += 1
+            try:
+                self._idle.append(await connect(**self.connect_kwargs))
+            except Exception:
+                self._size -= 1
+                raise
+        return self
+
+    async def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = monotonic()
+        async with self._condition:
+            while True:
+                if self._closed:
+                    raise InterfaceError("Connection pool closed")
+                while self._idle:
+                    connection = self._idle.pop()
+                    if connection.connected and connection.fourdconn.is_alive():
+                        self.checkouts += 1
+                        self.wait_time += monotonic()-started
+                        return connection
+                    self._size -= 1
+                if self._size<self.maxconn:
+                    self._size += 1
+                    break
+                remaining = started+timeout-monotonic()
+                if remaining<=0:
+                    raise OperationalError("Timed out waiting for a pooled connection")
+                try:
+                    await asyncio.wait_for(self._condition.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+        try:
+            connection = await connect(**self.connect_kwargs)
+        except Exception:
+            async with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+        self.checkouts += 1
+        self.wait_time += monotonic()-started
+        return connection
+
+    async def release(self, connection, close=False):
+        if not close and connection.connected:
+            try:
+                # open result sets are released along with the rollback
+                for cursor in connection.cursors:
+                    cursor.close()
+                await connection.rollback()
+            except Exception:
+                close = True
+        connection.cursors = []
+        # a connection aborted by a cancelled command is never reused
+        if close or self._closed or not connection.connected or not connection.fourdconn.connected:
+            try:
+                await connection.close()
+            except Exception:
+                pass
+            connection = None
+        async with self._condition:
+            if connection is None:
+                self._size -= 1
+            else:
+                self._idle.append(connection)
+            self._condition.notify()
+
+    @asynccontextmanager
+    async def connection(self, timeout=None):
+        connection = await self.acquire(timeout)
+        try:
+            yield connection
+        except Exception:
+            await self.release(connection, close=not connection.connected)
+            raise
+        else:
+            await connection.commit()
+            await self.release(connection)
+
+    async def close(self):
+        async with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for connection in idle:
+            try:
+                await connection.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        return dict(size=self._size, idle=len(self._idle),
+            in_use=self._size-len(self._idle), maxconn=self.maxconn,
+            checkouts=self.checkouts, wait_time=self.wait_time)
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, ex_type, ex_val, tb):
+        await self.close()
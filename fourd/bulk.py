@@ -0,0 +1,362 @@
+import csv
+import queue
+import threading
+from collections import deque
+from itertools import islice
+from time import perf_counter
+from .cache import table_name
+from .lib import FourDParameters, bind_parameter_columns
+from .fourd import connect
+from .exceptions import *
+
+
+class FourDBulkStats:
+    """Progress of a bulk load, shared by the loaders of parallel_load"""
+
+    def __init__(self):
+        self.rows = 0
+        self.statements = 0
+        self.bytes = 0
+        self.commits = 0
+        self.started = perf_counter()
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+        self._reported = self.started
+
+    def _add(self, rows=0, statements=0, bytes=0, commits=0):
+        with self._lock:
+            self.rows += rows
+            self.statements += statements
+            self.bytes += bytes
+            self.commits += commits
+            self.elapsed = perf_counter()-self.started
+
+    def _due(self, interval):
+        """True at most once per interval seconds, for progress reports"""
+        with self._lock:
+            now = perf_counter()
+            if now-self._reported < interval:
+                return False
+            self._reported = now
+            return True
+
+    @property
+    def rows_per_sec(self):
+        return self.rows/self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bytes_per_sec(self):
+        return self.bytes/self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return '<FourDBulkStats {} rows {} statements {} commits {:.3f}s {:.0f} rows/s>'.format(
+            self.rows, self.statements, self.commits, self.elapsed, self.rows_per_sec)
+
+
+def _values(column):
+    if hasattr(column, 'to_pylist'):
+        return column.to_pylist()
+    if hasattr(column, 'tolist'):
+        return column.tolist()
+    return list(column)
+
+
+def row_chunks(rows, columns, size=1024):
+    """Split rows (sequences, or dicts keyed by column name) into chunks of column lists"""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        if isinstance(chunk[0], dict):
+            yield [[row.get(name) for row in chunk] for name in columns]
+        else:
+            yield [list(values) for values in zip(*chunk)]
+
+
+def column_chunks(data, columns, size=1024):
+    """Split columnar data into chunks of column lists.
+
+    data is a dict of column name -> list, NumPy or Arrow array, a
+    sequence of such columns in the order of columns, a NumPy structured
+    array, or a pyarrow Table or RecordBatch.
+    """
+    if hasattr(data, 'column_names'):
+        data = [data.column(name) for name in columns]
+    elif getattr(getattr(data, 'dtype', None), 'names', None):
+        data = [data[name] for name in columns]
+    elif isinstance(data, dict):
+        data = [data[name] for name in columns]
+    if not data:
+        return
+    row_count = len(data[0])
+    if any(len(column) != row_count for column in data):
+        raise ProgrammingError("Columns must have the same length")
+    for start in range(0, row_count, size):
+        yield [_values(column[start:start+size]) for column in data]
+
+
+def convert_rows(rows, types=None, null=''):
+    """Convert rows of strings, such as the rows of a csv.reader.
+
+    types is a sequence of one callable (or None to keep the string) per
+    column; fields equal to null are loaded as NULL.
+    """
+    for row in rows:
+        if types is None:
+            yield [None if value == null else value for value in row]
+        else:
+            yield [None if value == null else (convert(value) if convert is not None else value)
+                for value, convert in zip(row, types)]
+
+
+class FourDBulkLoader:
+    """Load rows into a table over one FourD_connection.
+
+    Rows are bound column by column, a chunk at a time, into multi-row
+    INSERT INTO table (columns) VALUES (?,...),(?,...) statements, each
+    holding as many rows as fit in statement_bytes of parameters, up to
+    max_rows. Row counts are powers of two, so that the statement texts
+    repeat. With multi_row off, every row is its own INSERT. Statements
+    are pipelined with FourD.execute_statements, batch_bytes of them per
+    write, and executed without a PREPARE-STATEMENT round trip.
+
+    The load runs in its own transactions, committed every commit_every
+    rows or once at the end; the connection must not be in a transaction
+    already. On error the rows since the last commit are rolled back,
+    and taken off stats.rows, and the exception, with row_index set to
+    the first row of the failing statement, raised. progress is called
+    with the FourDBulkStats at most every progress_interval seconds, and
+    once done.
+    """
+
+    def __init__(self, connection, table, columns, multi_row=True, statement_bytes=1 << 18,
+            max_rows=1024, batch_bytes=1 << 20, commit_every=None, progress=None,
+            progress_interval=1.0, stats=None):
+        self.connection = connection
+        self.table = table
+        self.columns = list(columns) if columns is not None else None
+        self.multi_row = multi_row
+        self.statement_bytes = statement_bytes
+        self.max_rows = max_rows
+        self.batch_bytes = batch_bytes
+        self.commit_every = commit_every
+        self.progress = progress
+        self.progress_interval = progress_interval
+        self.stats = stats or FourDBulkStats()
+        self._statements = {}
+
+    def statement(self, count):
+        """INSERT statement of count rows"""
+        sql = self._statements.get(count)
+        if sql is None:
+            row = '({})'.format(','.join('?'*len(self.columns)))
+            sql = self._statements[count] = 'INSERT INTO {} ({}) VALUES {}'.format(
+                self.table, ', '.join(self.columns), ','.join([row]*count))
+        return sql
+
+    def _split(self, params):
+        """Group the bound rows of a chunk into (row count, FourDParameters) statements"""
+        if not self.multi_row:
+            for row_params in params:
+                yield 1, row_params
+            return
+        sizes = [len(row_params.binary_data) for row_params in params]
+        start = 0
+        while start<len(params):
+            count = 1
+            size = sizes[start]
+            while count*2<=self.max_rows and start+count*2<=len(params):
+                more = sum(sizes[start+count:start+count*2])
+                if size+more>self.statement_bytes:
+                    break
+                size += more
+                count *= 2
+            group = params[start:start+count]
+            yield count, FourDParameters(' '.join([row_params.parameter_types for row_params in group]),
+                b''.join([row_params.binary_data for row_params in group]))
+            start += count
+
+    def _report(self, force=False):
+        if self.progress is not None and (force or self.stats._due(self.progress_interval)):
+            self.progress(self.stats)
+
+    def load_chunks(self, chunks):
+        """Load chunks of rows given as lists of column values; returns the FourDBulkStats"""
+        connection = self.connection
+        # committing at checkpoints would commit the work of the caller too
+        if connection.in_transaction:
+            raise ProgrammingError("Bulk loads run in their own transactions: "
+                "commit or roll back the pending one first")
+        if connection.result_cache is not None:
+            connection.result_cache.invalidate(self.table, connection.fourdconn)
+        chunks = iter(chunks)
+        first_row = 0
+        done = False
+        while not done:
+            sent = deque()
+            segment_start = first_row
+
+            def statements():
+                nonlocal done
+                rows = 0
+                for chunk in chunks:
+                    for count, params in self._split(bind_parameter_columns(chunk)):
+                        sent.append((count, len(params.binary_data)))
+                        yield self.statement(count), params
+                    rows += len(chunk[0]) if chunk else 0
+                    if self.commit_every and rows>=self.commit_every:
+                        return
+                done = True
+
+            connection._start_transaction()
+            if connection.result_cache is not None:
+                # invalidated again as each segment commits
+                connection._written_tables.add(table_name(self.table))
+            error = None
+            try:
+                responses = connection.fourdconn.execute_statements(statements(),
+                    batch_bytes=self.batch_bytes)
+                try:
+                    for response in responses:
+                        count, size = sent.popleft()
+                        if isinstance(response, FourDException):
+                            error = response
+                            error.row_index = first_row
+                            break
+                        response.close()
+                        first_row += count
+                        self.stats._add(rows=count, statements=1, bytes=size)
+                        self._report()
+                finally:
+                    responses.close()
+                if error is not None:
+                    raise error
+                connection.commit()
+            except BaseException:
+                # the rows of the segment are not loaded after all
+                self.stats._add(rows=segment_start-first_row)
+                if connection.connected:
+                    connection.rollback()
+                raise
+            if segment_start != first_row:
+                self.stats._add(commits=1)
+        self._report(force=True)
+        return self.stats
+
+    def load(self, rows, chunk_rows=None):
+        """Load an iterable of rows, sequences in column order or dicts"""
+        return self.load_chunks(row_chunks(rows, self.columns, chunk_rows or self.max_rows))
+
+    def load_columns(self, data, chunk_rows=None):
+        """Load columnar data, see column_chunks"""
+        return self.load_chunks(column_chunks(data, self.columns, chunk_rows or self.max_rows))
+
+    def load_csv(self, path, types=None, header=True, null='', encoding='utf-8', **fmtparams):
+        """Load a CSV file; the columns default to the names of its header row"""
+        with open(path, newline='', encoding=encoding) as f:
+            reader = csv.reader(f, **fmtparams)
+            if header:
+                names = next(reader, None)
+                if self.columns is None:
+                    self.columns = names
+            return self.load(convert_rows(reader, types, null))
+
+
+def bulk_load(connection, table, columns, rows=None, data=None, **options):
+    """Load rows, or columnar data, into table with a FourDBulkLoader"""
+    loader = FourDBulkLoader(connection, table, columns, **options)
+    if data is not None:
+        return loader.load_columns(data)
+    return loader.load(rows)
+
+
+def _load_worker(open_connection, close_connection, table, columns, chunks, stop, errors, options):
+    # each worker takes exactly one of the None put at the end
+    ended = []
+    # (first row in the source, row count) of the chunks taken
+    taken = []
+
+    def queued_chunks():
+        while True:
+            item = chunks.get()
+            if item is None:
+                ended.append(True)
+                return
+            first_row, chunk = item
+            taken.append((first_row, len(chunk[0]) if chunk else 0))
+            yield chunk
+    try:
+        connection = open_connection()
+        try:
+            FourDBulkLoader(connection, table, columns, **options).load_chunks(queued_chunks())
+        finally:
+            close_connection(connection)
+    except Exception as e:
+        row_index = getattr(e, 'row_index', None)
+        if row_index is not None:
+            for first_row, count in taken:
+                if row_index<count:
+                    e.row_index = first_row+row_index
+                    break
+                row_index -= count
+        errors.append(e)
+        stop.set()
+        # let the producer finish putting its chunks
+        while not ended and chunks.get() is not None:
+            pass
+
+
+def parallel_load(table, columns, rows=None, data=None, connections=4, pool=None,
+        queue_size=4, chunk_rows=1024, multi_row=True, statement_bytes=1 << 18, max_rows=1024,
+        batch_bytes=1 << 20, commit_every=None, progress=None, progress_interval=1.0,
+        **connect_kwargs):
+    """Load rows, or columnar data, into table over several connections.
+
+    Chunks of chunk_rows rows are read from the source in the calling
+    thread and spread over connections worker threads, each loading and
+    committing its share with a FourDBulkLoader; up to queue_size chunks
+    wait for them. Connections are taken from pool or opened with
+    connect_kwargs. Rows are committed per connection, so a failed load
+    may leave the checkpoints of the other connections committed. The
+    first error, its row_index counted from the start of the source, is
+    raised once all workers have stopped; progress may be
+    called from the worker threads. Returns the shared FourDBulkStats.
+    """
+    if pool is not None:
+        open_connection, close_connection = pool.getconn, pool.putconn
+    else:
+        open_connection = lambda: connect(**connect_kwargs)
+        close_connection = lambda connection: connection.close()
+    if data is not None:
+        source = column_chunks(data, columns, chunk_rows)
+    else:
+        source = row_chunks(rows, columns, chunk_rows)
+    stats = FourDBulkStats()
+    options = dict(multi_row=multi_row, statement_bytes=statement_bytes, max_rows=max_rows,
+        batch_bytes=batch_bytes, commit_every=commit_every, progress=progress,
+        progress_interval=progress_interval, stats=stats)
+    chunks = queue.Queue(queue_size)
+    stop = threading.Event()
+    errors = []
+    workers = [threading.Thread(target=_load_worker, daemon=True, args=(open_connection,
+        close_connection, table, columns, chunks, stop, errors, options)) for i in range(connections)]
+    for worker in workers:
+        worker.start()
+    try:
+        first_row = 0
+        for chunk in source:
+            if stop.is_set():
+                break
+            chunks.put((first_row, chunk))
+            first_row += len(chunk[0]) if chunk else 0
+    finally:
+        for worker in workers:
+            chunks.put(None)
+        for worker in workers:
+            worker.join()
+    if errors:
+        raise errors[0]
+    if progress is not None:
+        progress(stats)
+    return stats
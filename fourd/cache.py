@@ -0,0 +1,260 @@
+import re
+import sys
+import threading
+from collections import OrderedDict
+from time import monotonic
+from .lib import RESULT_SET
+
+NAME = r'\[[^\]]+\]|"[^"]+"|[\w.]+'
+SELECT_PATTERN = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+WRITE_PATTERN = re.compile(r'^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM|REPLACE\s+INTO'
+    r'|TRUNCATE(?:\s+TABLE)?|DROP\s+TABLE|ALTER\s+TABLE)\s+(' + NAME + ')', re.IGNORECASE)
+# an alias is any word but the keywords that can follow a table name
+ALIAS = r'(?:\s+(?:AS\s+)?(?!(?:JOIN|INNER|LEFT|RIGHT|FULL|CROSS|ON|WHERE|GROUP|ORDER|HAVING' \
+    r'|LIMIT|OFFSET|UNION|INTO|FOR)\b)\w+)?'
+TABLE_LIST_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+((?:' + NAME + ')' + ALIAS +
+    r'(?:\s*,\s*(?:' + NAME + ')' + ALIAS + r')*)', re.IGNORECASE)
+TABLE_PATTERN = re.compile(r'(?:^|,)\s*(' + NAME + ')')
+# types read as a FourDLob when the connection sets a lob_threshold
+LOB_TYPES = frozenset(('VK_BLOB', 'VK_TEXT', 'VK_IMAGE'))
+
+
+def table_name(name):
+    return name.strip('[]"').lower()
+
+
+def query_tables(query):
+    """Names of the tables a SELECT reads, lower case"""
+    tables = set()
+    for table_list in TABLE_LIST_PATTERN.findall(query):
+        tables.update(table_name(name) for name in TABLE_PATTERN.findall(table_list))
+    return frozenset(tables)
+
+
+def written_table(query):
+    """Name of the table an INSERT, UPDATE or DELETE statement changes, else None"""
+    match = WRITE_PATTERN.match(query)
+    return table_name(match.group(1)) if match else None
+
+
+def estimate_size(items):
+    """Approximate memory held by a list of rows or of values, measured on a sample"""
+    if not items:
+        return 0
+    step = max(len(items)//32, 1)
+    sample = items[::step]
+    size = 0
+    for item in sample:
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            item = item.values()
+        elif isinstance(item, (str, bytes, bytearray)) or not hasattr(item, '__iter__'):
+            continue
+        size += sum(sys.getsizeof(value) for value in item)
+    return size*len(items)//len(sample)+sys.getsizeof(items)
+
+
+def holds_lobs(response, fourdconn):
+    """True if the rows of response hold FourDLob values.
+
+    Those read from a file position of their own, so a single set of
+    them cannot be handed to every reader of a cache entry.
+    """
+    return fourdconn.lob_threshold is not None and \
+        any(column.dtype in LOB_TYPES for column in response.columns)
+
+
+def connection_identity(fourdconn):
+    """(host, port, database, user) of a FourD connection, None for no connection"""
+    if fourdconn is None:
+        return None
+    return (fourdconn.host, fourdconn.port, fourdconn.database, fourdconn.user)
+
+
+class FourDCachedRows:
+    """Rows of a result set read in full, kept by a FourDResultCache.
+
+    The rows are stored as the cursor returned them, or as one list of
+    values per column when they were read with fetch_columns.
+    """
+    __slots__ = ('columns', 'row_count', 'rows', 'column_values', 'make_row',
+        'tables', 'size', 'expires')
+
+    def __init__(self, response, rows=None, column_values=None):
+        self.columns = response.columns
+        self.row_count = response.row_count
+        self.make_row = response._make_row
+        self.rows = tuple(rows) if rows is not None else None
+        self.column_values = [list(values) for values in column_values] \
+            if column_values is not None else None
+        self.tables = frozenset()
+        self.expires = None
+        if self.rows is not None:
+            self.size = estimate_size(self.rows)
+        else:
+            self.size = sum(estimate_size(values) for values in self.column_values)
+
+
+class FourDCachedResult:
+    """Result set of a cursor served from FourDCachedRows instead of the server"""
+    result_type = RESULT_SET
+    is_result_set = True
+    is_update_count = False
+    update_count = None
+    statement_id = None
+
+    def __init__(self, cached):
+        self.cached = cached
+        self.columns = cached.columns
+        self.row_count = cached.row_count
+        self.row_number = 0
+
+    def _rows(self):
+        cached = self.cached
+        if cached.rows is not None:
+            return cached.rows
+        # built once, on the first read of the rows of a columnar entry
+        cached.rows = tuple(map(cached.make_row, zip(*cached.column_values)))
+        return cached.rows
+
+    def rows(self):
+        rows = self._rows()
+        while self.row_number<self.row_count:
+            row = rows[self.row_number]
+            self.row_number += 1
+            # dict rows are mutable: every read gets its own copy
+            yield dict(row) if type(row) is dict else row
+
+    def read_row(self):
+        return next(self.rows(), None)
+
+    def column_pages(self):
+        cached = self.cached
+        if self.row_number<self.row_count:
+            if cached.column_values is not None:
+                page = [values[self.row_number:] for values in cached.column_values]
+            else:
+                rows = cached.rows[self.row_number:]
+                if rows and type(rows[0]) is dict:
+                    rows = [row.values() for row in rows]
+                page = [list(values) for values in zip(*rows)]
+            self.row_number = self.row_count
+            yield page
+
+    def close(self):
+        pass
+
+
+class FourDResultCache:
+    """Opt-in cache of the rows of read-only queries.
+
+    Set it as the result_cache of one or more connections, e.g.
+    fourd.connect(..., result_cache=FourDResultCache(ttl=5)). SELECT
+    statements are looked up by SQL text, bound parameters, row format
+    and the server, database and user connected to, and a hit is served
+    without contacting the server. Rows are stored once a result set is
+    read in full with fetchall or fetch_columns, unless they hold values
+    spooled as FourDLob objects. Entries expire after ttl
+    seconds, and the least recently used ones are evicted beyond
+    max_bytes (estimated).
+
+    INSERT, UPDATE and DELETE statements run on a connection using the
+    cache invalidate the entries reading their table in the same
+    database, once before they run and again when their transaction
+    ends. Once its transaction has written, a connection neither reads
+    nor stores entries until it commits or rolls back, so uncommitted
+    rows never reach the cache. Changes made by other clients are only
+    seen once the entries expire.
+    """
+
+    def __init__(self, ttl=60, max_bytes=64 << 20):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, query, params=None, row_format=None, fourdconn=None):
+        """Cache key of a statement, None when it cannot be cached.
+
+        The key holds the server, database and user of fourdconn, so that
+        connections sharing the cache only see their own rows.
+        """
+        if not SELECT_PATTERN.match(query):
+            return None
+        key = (query.strip(), row_format, tuple((type(param), param) for param in params or ()),
+            connection_identity(fourdconn))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key):
+        with self._lock:
+            cached = self.entries.get(key)
+            if cached is not None and cached.expires is not None and cached.expires<=monotonic():
+                self._remove(key)
+                cached = None
+            if cached is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return cached
+
+    def put(self, key, cached):
+        if cached.size>self.max_bytes:
+            return
+        cached.tables = query_tables(key[0])
+        cached.expires = monotonic()+self.ttl if self.ttl is not None else None
+        with self._lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = cached
+            self.bytes += cached.size
+            while self.bytes>self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self.entries.pop(key).size
+
+    def invalidate(self, table=None, fourdconn=None):
+        """Drop the entries reading table, or every entry when table is None.
+
+        With fourdconn, only the entries read from its database, by any
+        user, are dropped.
+        """
+        identity = connection_identity(fourdconn)
+        with self._lock:
+            keys = [key for key, cached in self.entries.items()
+                if (table is None or table_name(table) in cached.tables)
+                and (identity is None or key[3] is None or key[3][:3] == identity[:3])]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+
+    def observe(self, query, fourdconn=None):
+        """Invalidate the entries of the table a statement about to run writes to.
+
+        Returns the name of that table, None for statements that write
+        nothing.
+        """
+        table = written_table(query)
+        if table is not None:
+            self.invalidate(table, fourdconn)
+        return table
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self):
+        with self._lock:
+            return dict(entries=len(self.entries), bytes=self.bytes,
+                max_bytes=self.max_bytes, hits=self.hits, misses=self.misses,
+                evictions=self.evictions, invalidations=self.invalidations)
@@ -0,0 +1,270 @@
+import base64
+import bz2
+import csv
+import gzip
+import io
+import json
+import lzma
+import os
+import queue
+import threading
+from .lib import FourDLob
+from .exceptions import *
+
+COMPRESSIONS = {'gzip': gzip.open, 'bz2': bz2.open, 'xz': lzma.open}
+COMPRESSION_SUFFIXES = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+FORMAT_SUFFIXES = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl',
+    '.arrow': 'arrow', '.feather': 'arrow', '.ipc': 'arrow', '.parquet': 'parquet'}
+
+# pyarrow type of each 4D column type, by pyarrow function and arguments
+ARROW_TYPES = {
+    "VK_BOOLEAN": ('bool_',),
+    "VK_BYTE": ('string',),
+    "VK_WORD": ('int16',),
+    "VK_LONG": ('int32',),
+    "VK_LONG8": ('int64',),
+    "VK_REAL": ('float64',),
+    "VK_FLOAT": ('float64',),
+    "VK_TIMESTAMP": ('timestamp', 'ms'),
+    "VK_TIME": ('timestamp', 'ms'),
+    "VK_DURATION": ('time64', 'us'),
+    "VK_STRING": ('string',),
+    "VK_TEXT": ('string',),
+    "VK_BLOB": ('binary',),
+    "VK_IMAGE": ('binary',),
+    "VK_UNKNOW": ('null',),
+}
+
+
+def path_format(path):
+    """(format, compression) guessed from the suffixes of a file name"""
+    root, suffix = os.path.splitext(os.fspath(path).lower())
+    compression = COMPRESSION_SUFFIXES.get(suffix)
+    if compression is not None:
+        root, suffix = os.path.splitext(root)
+    return FORMAT_SUFFIXES.get(suffix), compression
+
+
+def _lob_value(dtype):
+    if dtype == 'VK_TEXT':
+        return lambda value: value.text() if isinstance(value, FourDLob) else value
+    return lambda value: value.getvalue() if isinstance(value, FourDLob) else value
+
+
+def text_converter(dtype):
+    """Function converting the non null values of a column for a text format, or None"""
+    if dtype in ('VK_BLOB', 'VK_IMAGE'):
+        lob_value = _lob_value(dtype)
+        return lambda value: base64.b64encode(lob_value(value)).decode()
+    if dtype == 'VK_TEXT':
+        return _lob_value(dtype)
+    if dtype in ('VK_TIMESTAMP', 'VK_TIME', 'VK_DURATION'):
+        return lambda value: value.isoformat()
+    return None
+
+
+def convert_page(page, converters):
+    converted = []
+    for values, converter in zip(page, converters):
+        if converter is not None:
+            values = [None if value is None else converter(value) for value in values]
+        converted.append(values)
+    return converted
+
+
+class FourDExportWriter:
+    """Base class of the writers of export_result, fed one page of column values at a time"""
+    binary = False
+
+    def __init__(self, file, columns, compression=None):
+        self.columns = columns
+        self._owned = None
+        if hasattr(file, 'write'):
+            binary_file = file
+        else:
+            binary_file = self._owned = COMPRESSIONS.get(compression, open)(file, 'wb')
+        if self.binary:
+            self.file = binary_file
+        else:
+            self.file = io.TextIOWrapper(binary_file, encoding='utf-8', newline='')
+        self.converters = [text_converter(column.dtype) for column in columns]
+
+    def write_page(self, page):
+        raise NotImplementedError
+
+    def close(self):
+        try:
+            if not self.binary:
+                # leave the file of the caller open
+                self.file.flush()
+                self.file.detach()
+        finally:
+            if self._owned is not None:
+                self._owned.close()
+
+
+class FourDCSVWriter(FourDExportWriter):
+    """CSV with a header row; nulls are empty fields, binary values base64.
+
+    Remaining options are csv.writer format parameters.
+    """
+
+    def __init__(self, file, columns, compression=None, header=True, **fmtparams):
+        super().__init__(file, columns, compression)
+        self.writer = csv.writer(self.file, **fmtparams)
+        if header:
+            self.writer.writerow([column.name for column in columns])
+
+    def write_page(self, page):
+        self.writer.writerows(zip(*convert_page(page, self.converters)))
+
+
+class FourDJSONLWriter(FourDExportWriter):
+    """One JSON object per row, keyed by column name"""
+
+    def __init__(self, file, columns, compression=None, ensure_ascii=False):
+        super().__init__(file, columns, compression)
+        self.names = [column.name for column in columns]
+        self.encoder = json.JSONEncoder(ensure_ascii=ensure_ascii)
+
+    def write_page(self, page):
+        encode = self.encoder.encode
+        names = self.names
+        self.file.writelines([encode(dict(zip(names, row)))+'\n'
+            for row in zip(*convert_page(page, self.converters))])
+
+
+def arrow_schema(pyarrow, columns):
+    """pyarrow schema of a result set, mapping the 4D column types with ARROW_TYPES"""
+    fields = []
+    for column in columns:
+        name, *args = ARROW_TYPES.get(column.dtype, ('string',))
+        fields.append(pyarrow.field(column.name, getattr(pyarrow, name)(*args)))
+    return pyarrow.schema(fields)
+
+
+class FourDArrowWriter(FourDExportWriter):
+    """Arrow IPC file, one record batch per page; compression is 'lz4', 'zstd' or None"""
+    binary = True
+
+    def __init__(self, file, columns, compression=None):
+        self._open_arrow(file, columns)
+        options = self.pyarrow.ipc.IpcWriteOptions(compression=compression)
+        self.writer = self.pyarrow.ipc.new_file(self.file, self.schema, options=options)
+
+    def _open_arrow(self, file, columns):
+        self.pyarrow = _import_pyarrow()
+        super().__init__(file, columns)
+        self.schema = arrow_schema(self.pyarrow, columns)
+        # other values are converted by pyarrow itself
+        self.converters = [_lob_value(column.dtype) if column.dtype in ('VK_TEXT', 'VK_BLOB', 'VK_IMAGE')
+            else None for column in columns]
+
+    def write_page(self, page):
+        batch = self.pyarrow.record_batch(convert_page(page, self.converters), schema=self.schema)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        try:
+            self.writer.close()
+        finally:
+            super().close()
+
+
+class FourDParquetWriter(FourDArrowWriter):
+    """Parquet file, one row group per page; compression defaults to 'snappy'.
+
+    Remaining options are pyarrow.parquet.ParquetWriter arguments.
+    """
+
+    def __init__(self, file, columns, compression='snappy', **options):
+        self._open_arrow(file, columns)
+        import pyarrow.parquet
+        self.writer = pyarrow.parquet.ParquetWriter(self.file, self.schema,
+            compression=compression, **options)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        raise NotSupportedError("Arrow and Parquet export require pyarrow")
+    return pyarrow
+
+
+WRITERS = dict(csv=FourDCSVWriter, jsonl=FourDJSONLWriter, arrow=FourDArrowWriter,
+    parquet=FourDParquetWriter)
+
+
+def _write_pages(writer, pages, errors):
+    page = True
+    try:
+        while True:
+            page = pages.get()
+            if page is None:
+                break
+            writer.write_page(page)
+    except BaseException as e:
+        errors.append(e)
+        # unblock the producer until it stops
+        while page is not None:
+            page = pages.get()
+    finally:
+        # the file is closed after a failed write too
+        try:
+            writer.close()
+        except BaseException as e:
+            errors.append(e)
+
+
+def export_pages(pages, columns, path, format=None, compression=None, queue_size=2, **options):
+    """Write pages of column values (lists, one per column) to a file.
+
+    path is a file name or a binary file object. format is 'csv', 'jsonl',
+    'arrow' or 'parquet'. The text formats can be compressed with 'gzip',
+    'bz2' or 'xz'. Both are guessed from the file name when not given. Encoding,
+    compression and writing run on a background thread while the next
+    page is produced; at most queue_size pages wait for it, so memory is
+    bounded by the page size. Returns the number of rows written.
+    """
+    if not hasattr(path, 'write'):
+        guessed_format, path_compression = path_format(path)
+        format = format or guessed_format
+        if format in ('csv', 'jsonl'):
+            compression = compression or path_compression
+    writer_class = WRITERS.get(format)
+    if writer_class is None:
+        if format is None:
+            raise ProgrammingError("Export format not given nor known from the file name")
+        raise ProgrammingError("Unknown export format {!r}".format(format))
+    if compression is not None:
+        options['compression'] = compression
+    writer = writer_class(path, columns, **options)
+    queued = queue.Queue(queue_size)
+    errors = []
+    thread = threading.Thread(target=_write_pages, args=(writer, queued, errors), daemon=True)
+    thread.start()
+    rows = 0
+    try:
+        for page in pages:
+            if errors:
+                break
+            rows += len(page[0]) if page else 0
+            queued.put(page)
+    finally:
+        queued.put(None)
+        thread.join()
+    if errors:
+        raise errors[0]
+    return rows
+
+
+def export_result(result, path, format=None, **options):
+    """Stream the remaining rows of a result set to a file, page by page.
+
+    Takes the options of export_pages and writer classes.
+    """
+    if not result.is_result_set:
+        raise ProgrammingError("Only result sets can be exported")
+    return export_pages(result.column_pages(), result.columns, path, format, **options)
@@ -1,20 +1,155 @@
 import re
-from .lib import FourD, FOURD_DATA_TYPES
+from functools import lru_cache
+from .lib import FourD, FOURD_DATA_TYPES, bind_parameter_columns
+from .cache import FourDCachedRows, FourDCachedResult, holds_lobs
+from .export import export_result
 from .exceptions import *
 
 apilevel = " 2.0 "
-threadsafety = 0 
+threadsafety = 1
 paramstyle = "pyformat"
 
 #PERCENT_PATTERN = re.compile(r'%\(([^\)]+)\)s')
 PERCENT_PATTERN = re.compile(r'%\((\w+)\)s')
 COLON_PATTERN = re.compile(r':(\w+)')
 FORMAT_PATTERN = re.compile(r'%[A-Za-z]')
+NAMED_PATTERN = re.compile(r'%\((\w+)\)s|:(\w+)')
+IN_PATTERN = re.compile(r'\bIN\s*$', re.IGNORECASE)
+
+
+def in_list_size(count):
+    """Round an IN list length up to a standard size, so that it hits the statement cache"""
+    if count <= 1024:
+        size = 1
+        while size < count:
+            size *= 2
+        return size
+    return -(-count//1024)*1024
+
+
+class FourDQueryTemplate:
+    """A query rewritten once to the ? placeholder style of 4D.
+
+    The query is kept as the literal segments around each placeholder,
+    with the parameter key of each slot for named parameters, so that
+    binding a parameter set (including expanding list and tuple
+    parameters into (?,?,...) lists) is a single pass over the slots.
+    Lists following IN are padded to in_list_size by repeating their
+    last value.
+    """
+    __slots__ = ('query', 'segments', 'keys', 'in_lists')
+
+    def __init__(self, query, named=False):
+        self.keys = None
+        if named:
+            self.keys = [m.group(1) or m.group(2) for m in NAMED_PATTERN.finditer(query)]
+            query = NAMED_PATTERN.sub('?', query)
+        query = FORMAT_PATTERN.sub('?', query)
+        self.query = query
+        self.segments = query.split('?')
+        self.in_lists = [bool(IN_PATTERN.search(segment)) for segment in self.segments[:-1]]
+
+    def bind(self, params):
+        if self.keys is not None:
+            params = [params[key] for key in self.keys]
+        for param in params:
+            if type(param) is list or type(param) is tuple:
+                break
+        else:
+            return self.query, params
+        segments = self.segments
+        n_slots = len(segments)-1
+        parts = []
+        values = []
+        for index, param in enumerate(params):
+            is_sequence = type(param) is list or type(param) is tuple
+            if is_sequence:
+                param = list(param)
+                if index < n_slots and param and self.in_lists[index]:
+                    param.extend(param[-1:]*(in_list_size(len(param))-len(param)))
+                values.extend(param)
+            else:
+                values.append(param)
+            if index < n_slots:
+                parts.append(segments[index])
+                parts.append('({})'.format(','.join('?'*len(param))) if is_sequence else '?')
+        for index in range(len(parts)//2, n_slots):
+            parts.append(segments[index])
+            parts.append('?')
+        parts.append(segments[-1])
+        return ''.join(parts), values
+
+
+@lru_cache(maxsize=512)
+def compile_query(query, named=False):
+    return FourDQueryTemplate(query, named)
+
+NUMPY_TYPES = {
+    "VK_BOOLEAN":"bool",
+    "VK_WORD":"int16",
+    "VK_LONG":"int32",
+    "VK_LONG8":"int64",
+    "VK_REAL":"float64",
+    "VK_FLOAT":"float64",
+    "VK_TIMESTAMP":"datetime64[us]",
+    "VK_TIME":"datetime64[us]",
+}
+
+
+def numpy_column(numpy, dtype, values):
+    """Convert decoded column values to a masked array, nulls being masked"""
+    mask = numpy.fromiter((value is None for value in values), dtype=bool, count=len(values))
+    numpy_type = NUMPY_TYPES.get(dtype)
+    if numpy_type is None:
+        data = numpy.empty(len(values), dtype=object)
+        data[:] = values
+    else:
+        if mask.any() and not numpy_type.startswith('datetime64'):
+            values = [0 if value is None else value for value in values]
+        data = numpy.array(values, dtype=numpy_type)
+    return numpy.ma.masked_array(data, mask=mask)
+
+
+class FourDNumpyColumns:
+    """Masked arrays of the rows of a result set, filled a page at a time.
+
+    The arrays are allocated for size rows up front, and each page is
+    converted into them as soon as it is decoded, so that only the
+    Python values of one page are alive at a time.
+    """
+
+    def __init__(self, numpy, columns, size):
+        self.numpy = numpy
+        self.columns = columns
+        self.data = [numpy.empty(size, dtype=NUMPY_TYPES.get(column.dtype, object))
+            for column in columns]
+        self.masks = [numpy.zeros(size, dtype=bool) for column in columns]
+        self.size = 0
+
+    def add_page(self, page):
+        """Convert a page given as one list of values per column"""
+        start = self.size
+        end = start+(len(page[0]) if page else 0)
+        for data, mask, column, values in zip(self.data, self.masks, self.columns, page):
+            array = numpy_column(self.numpy, column.dtype, values)
+            data[start:end] = array.data
+            mask[start:end] = self.numpy.ma.getmaskarray(array)
+        self.size = end
+
+    def arrays(self):
+        """Dict of column name -> masked array of the rows added"""
+        return dict((column.name, self.numpy.ma.masked_array(data[:self.size], mask=mask[:self.size]))
+            for column, data, mask in zip(self.columns, self.data, self.masks))
+
 
 
 class FourD_cursor(object):
     arraysize = 1
-    pagesize = 100
+    pagesize = None
+    batchsize = 256
+    row_format = None
+    # result cache key of the current result set while it may still be stored
+    _cache_key = None
 
     @property
     def __result_type(self):
@@ -31,7 +166,7 @@ class FourD_cursor(object):
     @property
     def rowcount(self):
         """"""
-        return self.result.row_count if self.result else None
+        return self.result.row_count if self.result else self._rowcount
 
     #----------------------------------------------------------------------
     def setinputsizes(self):
@@ -51,10 +186,16 @@ class FourD_cursor(object):
         self.fourdconn = fourdconn
         self.connection = connection
         self._description = None
+        self._rowcount = None
 
-    def close(self):
+    def _release_result(self):
         if self.result is not None:
+            self.result.close()
             self.result = None
+
+    def close(self):
+        self._release_result()
+        self._cache_key = None
         self._closed = True
         self._description = None
 
@@ -84,57 +225,131 @@ class FourD_cursor(object):
             return (col.name, col.pytype, None, None, None, None, None)
         self._description = [col_description(c) for c in self.result.columns]
 
-    def execute(self, query, params=None, describe=True):
+    def _bind_query(self, query, params):
         params = params or []
+        template = compile_query(query, isinstance(params, dict))
+        return template.bind(params)
+
+    def execute(self, query, params=None, describe=True):
         self._check_connection()
-        query.replace('?', chr(1))
-        if isinstance(params, dict):
-            _params = []
-            for pattern in (PERCENT_PATTERN, COLON_PATTERN):
-                for key in re.findall(pattern, query):
-                    _params.append(params[key])
-                query = re.sub(pattern, '?', query)
-            params = _params
-        query = re.sub(FORMAT_PATTERN, '?', query)
-        query.replace('%%', '%')
-        
-        while True:
-            foundtuple = False
-            for idx, param in enumerate(params):
-                if type(param) == list or type(param) == tuple:
-                    foundtuple = True
-                    paramlen = len(param)
-                    query = self.replace_nth(query, "?",
-                                             "({})".format(",".join("?"*paramlen)),
-                                             idx+1)  #need 1 based count
-
-                    params = tuple(params[:idx]) + tuple(param) + tuple(params[idx+1:])
-                    break  #only handle one tuple at a time, otherwise the idx parameter is off.
-
-            if not foundtuple:
-                break
-        query.replace(chr(1), '?')
+        self._rowcount = None
+        query, params = self._bind_query(query, params)
+        self._cache_key = None
+        result_cache = self.connection.result_cache
+        if result_cache is not None:
+            self.connection._observe(query)
+        # a transaction that wrote reads its own uncommitted changes
+        if result_cache is not None and not self.connection._written_tables:
+            cache_key = result_cache.key(query, params, self.row_format or self.fourdconn.row_format,
+                self.fourdconn)
+            cached = result_cache.get(cache_key) if cache_key is not None else None
+            if cached is not None:
+                self._release_result()
+                self.result = FourDCachedResult(cached)
+                if describe:
+                    self._describe()
+                return
+            self._cache_key = cache_key
         if not self.connection.in_transaction:
             self.connection._start_transaction()
 
+        self._release_result()
         if not self._prepared:
-            if self.result is not None:
-                self.result = None
+            # a no-op for statements kept in the statement cache
             self.fourdconn.prepare_statement(query, statement_params=params)
         self.result = self.fourdconn.execute_statement(query, 
                         statement_params=params, 
-                        first_page_size= self.pagesize)
+                        first_page_size= self.pagesize or self.fourdconn.res_size,
+                        row_format=self.row_format)
         if describe:
             self._describe()
 
         
-    def executemany(self, query, params):
-        for execution_param in params:
-            self.execute(query, execution_param, describe=False)
-            self._prepared = self._prepared or True
+    def _bind_columns(self, query, columns):
+        named = isinstance(columns, dict)
+        if getattr(getattr(columns, 'dtype', None), 'names', None):
+            # NumPy structured array, one field per named parameter
+            columns = dict((name, columns[name]) for name in columns.dtype.names)
+            named = True
+        template = compile_query(query, named)
+        if named:
+            columns = [columns[key] for key in template.keys]
+        return [(template.query, statement_params) for statement_params in bind_parameter_columns(columns)]
+
+    def executemany(self, query, params=None, columns=None):
+        """Execute query once per parameter set of params.
+
+        Instead of rows, the parameters can be given as columns: a sequence
+        (or, for named parameters, a dict or NumPy structured array) of
+        equally long lists or NumPy arrays, which are serialized column by
+        column. List parameters are not expanded in that case.
+
+        Parameter sets are sent batchsize at a time. When one fails, the
+        server still executes the others of its batch, which are counted
+        in rowcount, and no further batch is sent. The error of the first
+        failing row is raised, with its index as row_index and the indexes
+        of every failed row as failed_rows.
+        """
+        self._check_connection()
+        if columns is not None:
+            bound = self._bind_columns(query, columns)
+        else:
+            bound = (self._bind_query(query, execution_params) for execution_params in params)
+        self._cache_key = None
+        if self.connection.result_cache is not None:
+            self.connection._observe(query)
+        if not self.connection.in_transaction:
+            self.connection._start_transaction()
+        self._release_result()
+        prepared = set()
+        statement_cache = self.fourdconn.statement_cache
+
+        def statements():
+            # runs between pipelined batches, when no response is pending
+            for statement, statement_params in bound:
+                cache_key = statement_cache.key(statement, statement_params)
+                if cache_key not in prepared:
+                    self.fourdconn.prepare_statement(statement, statement_params=statement_params)
+                    prepared.add(cache_key)
+                yield statement, statement_params
+
+        rowcount = 0
+        errors = []
+        index = -1
+        responses = self.fourdconn.execute_statements(statements(),
+                first_page_size=self.pagesize or self.fourdconn.res_size,
+                batch_size=self.batchsize, row_format=self.row_format, stop_on_error=True)
+        try:
+            for index, response in enumerate(responses):
+                if isinstance(response, FourDException):
+                    errors.append((index, response))
+                    continue
+                if response.is_update_count:
+                    rowcount += response.update_count or 0
+                self._release_result()
+                self.result = response
+        finally:
+            responses.close()
         self._describe()
-        self.result = None
+        self._release_result()
         self._prepared = False
+        self._rowcount = rowcount
+        if errors:
+            row_index, error = errors[0]
+            error.row_index = row_index
+            error.failed_rows = [row_index for row_index, e in errors]
+            description = 'Row {}: {}'.format(row_index, error.description)
+            if index>row_index:
+                # the server went on with the rest of the batch
+                later = 'row {}'.format(index) if index == row_index+1 else \
+                    'rows {} to {}'.format(row_index+1, index)
+                description += ' ({} of the same batch still executed'.format(later)
+                if len(errors)>1:
+                    description += ', of which {} failed'.format(
+                        ', '.join(map(str, error.failed_rows[1:])))
+                description += ')'
+            error.description = description
+            raise error
 
     def check_fetch(self):
         self._check_connection()
@@ -161,7 +376,67 @@ class FourD_cursor(object):
 
     def fetchall(self):
         self.check_fetch()
-        return list(self.result.rows())
+        complete = self._cache_key is not None and self.result.row_number == 0
+        rows = list(self.result.rows())
+        if complete:
+            self._cache_result(rows=rows)
+        return rows
+
+    def _cache_result(self, rows=None, column_values=None):
+        # another cursor may have written since the query ran
+        if not self.connection._written_tables and not holds_lobs(self.result, self.fourdconn):
+            self.connection.result_cache.put(self._cache_key,
+                FourDCachedRows(self.result, rows=rows, column_values=column_values))
+        self._cache_key = None
+
+    def fetch_columns(self):
+        """Fetch the remaining rows as a dict of column name -> list of values"""
+        self.check_fetch()
+        if self.result.is_update_count:
+            return {}
+        columns = self.result.columns
+        data = [[] for c in columns]
+        complete = self._cache_key is not None and self.result.row_number == 0
+        if self.rowcount:
+            for page in self.result.column_pages():
+                for values, page_values in zip(data, page):
+                    values.extend(page_values)
+        if complete:
+            self._cache_result(column_values=data)
+        return dict(zip([c.name for c in columns], data))
+
+    def export(self, path, format=None, **options):
+        """Write the remaining rows to a file without holding them all in memory.
+
+        format is 'csv', 'jsonl', 'arrow' or 'parquet' (the last two need
+        pyarrow), guessed from the file name when not given. Pages are
+        fetched while the previous one is written on a background thread;
+        see fourd.export.export_pages for the options. Returns the number
+        of rows written.
+        """
+        self.check_fetch()
+        return export_result(self.result, path, format, **options)
+
+    def fetchnumpy(self):
+        """Fetch the remaining rows as a dict of column name -> numpy masked array
+
+        Pages are converted as they arrive, see FourDNumpyColumns.
+        """
+        try:
+            import numpy
+        except ImportError:
+            raise NotSupportedError("fetchnumpy requires numpy")
+        self.check_fetch()
+        if self.result.is_update_count:
+            return {}
+        result = self.result
+        arrays = FourDNumpyColumns(numpy, result.columns, result.row_count-result.row_number)
+        if self.rowcount:
+            for page in result.column_pages():
+                arrays.add_page(page)
+        # arrays are not kept by the result cache
+        self._cache_key = None
+        return arrays.arrays()
         
 
     def __next__(self):
@@ -181,16 +456,50 @@ class FourD_cursor(object):
     def __exit__(self, ex_type, ex_val, tb):
         pass
 
+class FourD_tuple_cursor(FourD_cursor):
+    """Cursor returning rows as plain tuples"""
+    row_format = 'tuple'
+
+
+class FourD_dict_cursor(FourD_cursor):
+    """Cursor returning rows as dicts keyed by column internal name"""
+    row_format = 'dict'
+
+
+class FourD_record_cursor(FourD_cursor):
+    """Cursor returning rows as compact __slots__ records"""
+    row_format = 'record'
+
+
+class FourD_lazy_cursor(FourD_cursor):
+    """Cursor returning rows that decode their values on access"""
+    row_format = 'lazy'
+
+
 class FourD_connection:
     
-    in_transaction = False
+    _in_transaction = False
+    _begin_cmd = None
+
+    @property
+    def in_transaction(self):
+        # a START TRANSACTION that failed leaves no transaction to join
+        return self._in_transaction and getattr(self._begin_cmd, 'error', None) is None
+
+    @in_transaction.setter
+    def in_transaction(self, in_transaction):
+        self._in_transaction = in_transaction
 
     def __init__(self, host=None, user=None, password=None, 
-            database=None, port=None, cursor_factory=None):
+            database=None, port=None, cursor_factory=None, result_cache=None, **kwargs):
         self.cursor_factory = cursor_factory or FourD_cursor
+        # a fourd.cache.FourDResultCache, possibly shared with other connections
+        self.result_cache = result_cache
+        # tables written by the open transaction, see _observe
+        self._written_tables = set()
         self.cursors = []
         self.fourdconn = FourD(host=host, user=user, password=password, database=database,
-                port=port)
+                port=port, **kwargs)
         self.fourdconn.connect()
         self.connected = True
         self.manager_cursor = self.cursor()
@@ -199,28 +508,81 @@ class FourD_connection:
     def _start_transaction(self):
         if self.in_transaction:
             return;  
+        # nothing is lost reconnecting between transactions
+        self.fourdconn.ensure_alive()
         self.in_transaction = True
-        self.manager_cursor.execute("START TRANSACTION;")
+        # sent in the same write as the next PREPARE, or on its own ahead
+        # of a statement, which must not run if it fails
+        self._begin_cmd = self.fourdconn.defer_statement("START TRANSACTION;", guarded=True)
+
+    def _end_transaction(self, statement):
+        self.in_transaction = False
+        if self.fourdconn.cancel_deferred(self._begin_cmd):
+            return
+        if getattr(self._begin_cmd, 'error', None) is None:
+            self.fourdconn.execute_statement(statement).close()
+
+    def _observe(self, query):
+        """Let the result cache see a statement about to run"""
+        table = self.result_cache.observe(query, self.fourdconn)
+        if table is not None:
+            self._written_tables.add(table)
+
+    def _end_writes(self):
+        """Invalidate the tables written by the transaction that ended"""
+        written, self._written_tables = self._written_tables, set()
+        for table in written:
+            self.result_cache.invalidate(table, self.fourdconn)
 
     def close(self):
-        if self.in_transaction:
-            self.manager_cursor.execute("ROLLBACK;")
-        if self.connected:
-            self.fourdconn.close()
+        try:
+            if self.in_transaction:
+                self._end_transaction("ROLLBACK;")
+            if self.connected:
+                self.fourdconn.close()
+        finally:
+            self._end_writes()
         self.connected = False
 
+    def reconnect(self):
+        """Open a new session after a connection error; a pending transaction is lost"""
+        self.in_transaction = False
+        # a START TRANSACTION still queued went with the old session
+        self._begin_cmd = None
+        self._end_writes()
+        self.fourdconn.reconnect()
+
     def commit(self):
-        if self.in_transaction:
-            self.manager_cursor.execute("COMMIT;")
+        try:
+            if self.in_transaction:
+                self._end_transaction("COMMIT;")
+        finally:
+            self._end_writes()
         self.in_transaction = False
 
     def rollback(self):
-        if self.in_transaction:
-            self.manager_cursor.execute("ROLLBACK;")
+        try:
+            if self.in_transaction:
+                self._end_transaction("ROLLBACK;")
+        finally:
+            self._end_writes()
         self.in_transaction = False
 
-    def cursor(self):
-        cursor = self.cursor_factory(self, self.fourdconn)
+    @property
+    def statement_cache(self):
+        return self.fourdconn.statement_cache
+
+    @property
+    def tracer(self):
+        """The fourd.tracing.FourDTracer of the connection, None when tracing is off"""
+        return self.fourdconn.tracer
+
+    @tracer.setter
+    def tracer(self, tracer):
+        self.fourdconn.tracer = tracer
+
+    def cursor(self, cursor_factory=None):
+        cursor = (cursor_factory or self.cursor_factory)(self, self.fourdconn)
         self.cursors.append(cursor)
         return cursor
 
@@ -238,9 +600,9 @@ class FourD_connection:
 
 
 
-def connect(dsn=None, host=None, port=None, user=None, password=None, 
-    database=None, cursor_factory=None):
-    connect_kw = {'cursor_factory':cursor_factory}
+def connect_arguments(dsn=None, host=None, port=None, user=None, password=None, 
+    database=None, **kwargs):
+    connect_kw = dict(kwargs)
     dsn_args = {}
     if dsn is not None:
         dsn_args.update(dict(s.split("=") for s in dsn.split(';')))
@@ -248,6 +610,13 @@ def connect(dsn=None, host=None, port=None, user=None, password=None,
     for key in ('host','port', 'user', 'password', 'database'):
         connect_kw[key] = lc.get(key) or dsn_args.get(key) or ""
     connect_kw['port'] = connect_kw['port'] or 19812
+    return connect_kw
+
+
+def connect(dsn=None, host=None, port=None, user=None, password=None, 
+    database=None, cursor_factory=None, **kwargs):
+    connect_kw = connect_arguments(dsn=dsn, host=host, port=port, user=user,
+        password=password, database=database, cursor_factory=cursor_factory, **kwargs)
     connection = FourD_connection(**connect_kw)
     return connection
 
@@ -1,10 +1,18 @@
 import socket
+import select
 import base64
-from collections import namedtuple, defaultdict, deque
+import io
+from array import array
+from collections import namedtuple, defaultdict, deque, OrderedDict
 from datetime import datetime, time
 import logging
 import struct
+import tempfile
+from codecs import utf_16_le_decode
+from functools import lru_cache
+from time import perf_counter
 from .exceptions import *
+from .tracing import FourDTrace, NO_TRACE
 log = logging.getLogger('fourd')
 log.setLevel(logging.DEBUG)
 
@@ -36,6 +44,10 @@ FOURD_DATA_TYPES= {
     14:"VK_STRING",
     21:"VK_BLOB",}
 
+STATUS_NULL=ord('0')
+STATUS_VALUE=ord('1')
+STATUS_ERROR=ord('2')
+
 RESULT_SET='Result-Set'
 UPDATE_COUNT='Update-Count'
 OK='OK'
@@ -70,6 +82,146 @@ fourD_types_str = defaultdict(lambda:"VK_STRING",{
     type(None):"VK_UNKNOW"
 })
 
+PARAM_VK_BOOLEAN = struct.Struct('<BH')
+PARAM_VK_LONG8 = struct.Struct('<Bq')
+PARAM_VK_REAL = struct.Struct('<Bd')
+PARAM_VK_TIMESTAMP = struct.Struct('<BHBBL')
+PARAM_VK_DURATION = struct.Struct('<BQ')
+PARAM_LENGTH = struct.Struct('<Bl')
+PARAM_NULL = bytes([STATUS_NULL])
+
+def bind_VK_BOOLEAN(buffer, value):
+    buffer += PARAM_VK_BOOLEAN.pack(STATUS_VALUE, value)
+
+def bind_VK_LONG8(buffer, value):
+    buffer += PARAM_VK_LONG8.pack(STATUS_VALUE, value)
+
+def bind_VK_REAL(buffer, value):
+    buffer += PARAM_VK_REAL.pack(STATUS_VALUE, value)
+
+def bind_VK_TIMESTAMP(buffer, value):
+    milliseconds = (value.hour*3600+value.minute*60+value.second)*1000+value.microsecond//1000
+    buffer += PARAM_VK_TIMESTAMP.pack(STATUS_VALUE, value.year, value.month, value.day, milliseconds)
+
+def bind_VK_DURATION(buffer, value):
+    milliseconds = (value.hour*3600+value.minute*60+value.second)*1000+value.microsecond//1000
+    buffer += PARAM_VK_DURATION.pack(STATUS_VALUE, milliseconds)
+
+def bind_VK_STRING(buffer, value):
+    encoded_value = value.encode('UTF-16LE')
+    # the length is in UTF-16 code units, negative for UTF-16 text
+    buffer += PARAM_LENGTH.pack(STATUS_VALUE, -(len(encoded_value)//2))
+    buffer += encoded_value
+
+def bind_VK_BLOB(buffer, value):
+    buffer += PARAM_LENGTH.pack(STATUS_VALUE, len(value))
+    buffer += value
+
+def bind_VK_UNKNOW(buffer, value):
+    buffer += PARAM_NULL
+
+# python type -> (4D parameter type, function appending the status byte and value)
+PARAMETER_BINDERS = {
+    bool:('VK_BOOLEAN', bind_VK_BOOLEAN),
+    int:('VK_LONG8', bind_VK_LONG8),
+    float:('VK_REAL', bind_VK_REAL),
+    datetime:('VK_TIMESTAMP', bind_VK_TIMESTAMP),
+    time:('VK_DURATION', bind_VK_DURATION),
+    str:('VK_STRING', bind_VK_STRING),
+    bytes:('VK_BLOB', bind_VK_BLOB),
+    bytearray:('VK_BLOB', bind_VK_BLOB),
+    memoryview:('VK_BLOB', bind_VK_BLOB),
+    type(None):('VK_UNKNOW', bind_VK_UNKNOW),
+}
+
+def parameter_binder(value):
+    """Return the (parameter type, bind function) pair for a value.
+
+    Subclasses of the supported types are resolved once and added to
+    PARAMETER_BINDERS. Scalars with an item() method, such as NumPy ones,
+    are resolved on every value, as item() may return another type (None
+    for NaT).
+    """
+    pytype = type(value)
+    binder = PARAMETER_BINDERS.get(pytype)
+    if binder is not None:
+        return binder
+    for base, binder in list(PARAMETER_BINDERS.items()):
+        if isinstance(value, base):
+            break
+    else:
+        if not hasattr(value, 'item') or not hasattr(value, 'dtype'):
+            raise NotSupportedError("Unsupported parameter type: {}".format(pytype.__name__))
+        parameter_type, bind_item = parameter_binder(value.item())
+        return (parameter_type, lambda buffer, value: bind_item(buffer, value.item()))
+    PARAMETER_BINDERS[pytype] = binder
+    return binder
+
+def bind_parameters(statement_params, buffer):
+    """Append the binary form of statement_params to buffer and return their types"""
+    parameter_types = []
+    append = parameter_types.append
+    binders = PARAMETER_BINDERS
+    for value in statement_params:
+        binder = binders.get(type(value)) or parameter_binder(value)
+        append(binder[0])
+        binder[1](buffer, value)
+    return parameter_types
+
+class FourDParameters:
+    """Statement parameters already serialized, see bind_parameter_columns"""
+    __slots__ = ('parameter_types', 'binary_data')
+    def __init__(self, parameter_types, binary_data):
+        self.parameter_types = parameter_types
+        self.binary_data = binary_data
+
+    def __bool__(self):
+        return bool(self.parameter_types)
+
+def bind_parameter_columns(columns):
+    """Serialize columns of parameters, one value per execution of a statement.
+
+    columns is a sequence of equally long lists or NumPy arrays. Each column
+    is converted and packed in one pass, with the binder looked up again
+    only when the value type changes along the column. Returns a list of
+    FourDParameters, one per row.
+    """
+    columns = [column.tolist() if hasattr(column, 'tolist') else column for column in columns]
+    if not columns:
+        return []
+    row_count = len(columns[0])
+    if any(len(column) != row_count for column in columns):
+        raise ProgrammingError("Parameter columns must have the same length")
+    packed_columns = []
+    for column in columns:
+        types = []
+        chunks = []
+        pytype = binder = None
+        for value in column:
+            if type(value) is not pytype:
+                binder = parameter_binder(value)
+                # binders missing from PARAMETER_BINDERS only hold for their value
+                pytype = type(value) if type(value) in PARAMETER_BINDERS else None
+            buffer = bytearray()
+            binder[1](buffer, value)
+            types.append(binder[0])
+            chunks.append(buffer)
+        packed_columns.append((types, chunks))
+    rows = []
+    for index in range(row_count):
+        rows.append(FourDParameters(
+            ' '.join([types[index] for types, chunks in packed_columns]),
+            b''.join([chunks[index] for types, chunks in packed_columns])))
+    return rows
+
+def statement_parameter_types(statement_params):
+    if not statement_params:
+        return ''
+    if isinstance(statement_params, FourDParameters):
+        return statement_params.parameter_types
+    binders = PARAMETER_BINDERS
+    return ' '.join((binders.get(type(p)) or parameter_binder(p))[0] for p in statement_params)
+
 class FourDColumn:
     __slots__=('name','internal_name', 'dtype','pytype', 'updatable')
     def __init__(self, *args, **kwargs):
@@ -81,6 +233,11 @@ class FourDCommand:
     cmd_txt = ''
     cmd_suffix = ''
     cmd_params = []
+    # serialized form of a command sent unchanged many times, see login_command
+    payload = None
+    # False for commands that change no data, which guarded deferred
+    # statements may share a write with (see FourD.defer_statement)
+    side_effects = True
     def __init__(self, *args, **kwargs):
         self.params = []
         for cmd_param in self.cmd_params:
@@ -102,6 +259,8 @@ class FourDCommand:
             self.params.append('{}: {}'.format(cmd_param,value).encode())
 
     def __bytes__(self):
+        if self.payload is not None:
+            return self.payload
         return self.bytes()
         
 
@@ -133,6 +292,14 @@ class FourDLoginPlain(FourDCommand):
     cmd_params = ['USER-NAME', 'USER-PASSWORD', 
     'REPLY-WITH-BASE64-TEXT', 'PREFERRED-IMAGE-TYPES']  
 
+@lru_cache(maxsize=64)
+def login_command(login_class, user, password, reply_64):
+    """LOGIN command with its payload serialized once per set of credentials"""
+    command = login_class(user_name=user, user_password=password,
+        reply_with_base_64_text=reply_64)
+    command.payload = command.bytes()
+    return command
+
 class FourDLogout(FourDCommand):
     cmd_id = 4
     cmd_txt = 'LOGOUT'
@@ -143,8 +310,12 @@ class FourDQuit(FourDCommand):
 
 class FourDBaseStatement(FourDCommand):
     def __init__(self, statement=None, statement_params=None, **kwargs):
-        self.binary_data = b''
-        parameter_types =self.bind_statement_params(statement_params)
+        if isinstance(statement_params, FourDParameters):
+            self.binary_data = statement_params.binary_data
+            parameter_types = statement_params.parameter_types.split()
+        else:
+            self.binary_data = bytearray()
+            parameter_types = self.bind_statement_params(statement_params)
         statement_kwargs=dict(statement=statement)
         statement_kwargs.update(kwargs)
         if parameter_types:
@@ -152,67 +323,22 @@ class FourDBaseStatement(FourDCommand):
         super().__init__(**statement_kwargs)
 
     def bind_statement_params(self, statement_params):
-        parameter_types = []
         if not statement_params:
             return
-        for statement_param in statement_params:
-            parameter_type = fourD_types_str.get(type(statement_param))
-            serializer = getattr(self, 'serialize_%s'%parameter_type)
-            if statement_param is not None:
-                parameter_data = b'1'+serializer(statement_param)
-            else:
-                parameter_data = b'0'
-            self.binary_data += parameter_data
-            parameter_types.append(parameter_type)
-        return parameter_types
-
-    def serialize_VK_BOOLEAN(self, statement_param):
-        return struct.pack('<H', statement_param)
-
-    def serialize_VK_LONG8(self, statement_param):
-        return struct.pack('<q', statement_param)
-
-    def serialize_VK_REAL(self, statement_param):
-        return struct.pack('<d', statement_param)
-
-    def serialize_VK_TIMESTAMP(self, statement_param):
-        year = statement_param.year
-        month = statement_param.month
-        day = statement_param.day
-        milliseconds = (statement_param.hour*3600+statement_param.minute*60+statement_param.second)*1000
-        return struct.pack('<HBBL',year,month,day,milliseconds)
-
-    serialize_VK_TIME = serialize_VK_TIMESTAMP
-        
-
-    def serialize_VK_DURATION(self, statement_param):
-        hour = statement_param.hour
-        minute = statement_param.minute
-        second = statement_param.second
-        millisecond = statement_param.millisecond//1000
-        millisecond = millisecond + second*1000 + minute*60*1000 + hour*3600*1000
-        return struct.pack('<D', millisecond)
-
-    def serialize_VK_STRING(self, statement_param):
-        encoded_value=statement_param.encode('UTF-16LE')
-        return struct.pack('<l',-len(statement_param))+encoded_value
-
-    def serialize_VK_BLOB(self, statement_param):
-        return struct.pack('<l',len(statement_param))+statement_param
-
-    def serialize_VK_UNKNOW(self, statement_param):
-        pass
+        return bind_parameters(statement_params, self.binary_data)
 
 
 class FourDPrepareStatement(FourDBaseStatement):
     cmd_id = 3
     cmd_txt = 'PREPARE-STATEMENT'
     cmd_params = ['STATEMENT-BASE64','PARAMETER-TYPES']
+    side_effects = False
 
 class FourDPrepareStatementPlain(FourDBaseStatement):
     cmd_id = 3
     cmd_txt = 'PREPARE-STATEMENT'
     cmd_params = ['STATEMENT', 'PARAMETER-TYPES']
+    side_effects = False
 
 class FourDExecuteStatement(FourDBaseStatement):
     cmd_id = 6
@@ -231,26 +357,673 @@ class FourDFetchStatement(FourDBaseStatement):
     cmd_txt = 'FETCH-RESULT'
     cmd_params = ['STATEMENT-ID','COMMAND-INDEX','OUTPUT-MODE',
         'FIRST-ROW-INDEX', 'LAST-ROW-INDEX', 'FULL-ERROR-STACK']
+    side_effects = False
 
 class FourDCloseStatement(FourDCommand):
     cmd_id = 0
     cmd_txt = 'CLOSE-STATEMENT'
     cmd_params = ['STATEMENT-ID']
+    side_effects = False
+
+
+STRUCT_VK_BOOLEAN = struct.Struct('<H')
+STRUCT_VK_WORD = struct.Struct('<h')
+STRUCT_VK_LONG = struct.Struct('<l')
+STRUCT_VK_LONG8 = struct.Struct('<q')
+STRUCT_VK_REAL = struct.Struct('<d')
+STRUCT_VK_TIMESTAMP = struct.Struct('<HBBL')
+STRUCT_VK_DURATION = struct.Struct('<Q')
+
+
+def tune_socket(sock, nodelay=True, keepalive=True, keepalive_idle=60,
+        keepalive_interval=10, keepalive_count=5):
+    """Disable Nagle's algorithm and enable TCP keepalive probes on sock.
+
+    Small commands are then sent at once instead of waiting for the ACK
+    of the previous segment, and a connection dropped by the network is
+    noticed after keepalive_idle+keepalive_interval*keepalive_count
+    seconds of silence instead of on the next command. Options the
+    platform lacks are skipped.
+    """
+    if nodelay:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if not keepalive:
+        return
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # TCP_KEEPALIVE is the macOS name of TCP_KEEPIDLE
+    idle_option = getattr(socket, 'TCP_KEEPIDLE', getattr(socket, 'TCP_KEEPALIVE', None))
+    for option, value in ((idle_option, keepalive_idle),
+            (getattr(socket, 'TCP_KEEPINTVL', None), keepalive_interval),
+            (getattr(socket, 'TCP_KEEPCNT', None), keepalive_count)):
+        if option is not None and value:
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, option, value)
+            except OSError:
+                pass
+
+
+class FourDWireReader:
+    """Buffered reader over the connection socket.
+
+    Data is received in large chunks into a reusable bytearray; headers and
+    fixed-width fields are then served from the buffer, so decoding a page of
+    rows costs a handful of recv calls instead of one per value. The buffer
+    grows to hold a value larger than chunk_size, and shrinks back once
+    that value has been read.
+    """
+    chunk_size = 65536
+
+    def __init__(self, sock, chunk_size=None):
+        self.socket = sock
+        self.chunk_size = chunk_size or self.chunk_size
+        self.buffer = bytearray(self.chunk_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+        self.recv_calls = 0
+        self.bytes_received = 0
+        self._capture = None
+        self._capture_start = 0
+        # set to a clock function to time the waits on the socket
+        self.clock = None
+        self.wait_time = 0.0
+
+    @property
+    def available(self):
+        return self.end - self.start
+
+    def _reserve(self, size):
+        """Move the unread bytes to the front, making room for size of them"""
+        unread = self.end - self.start
+        if self.start:
+            if self._capture is not None:
+                self._capture.append(bytes(self.view[self._capture_start:self.start]))
+                self._capture_start = 0
+            self.view[:unread] = bytes(self.view[self.start:self.end])
+            self.start = 0
+            self.end = unread
+        if size > len(self.buffer):
+            self.view.release()
+            self.buffer.extend(bytes(size - len(self.buffer)))
+            self.view = memoryview(self.buffer)
+        elif len(self.buffer) > self.chunk_size and max(size, unread) <= self.chunk_size:
+            # the large value the buffer grew for has been consumed
+            self.view.release()
+            del self.buffer[self.chunk_size:]
+            self.view = memoryview(self.buffer)
+
+    def _fill(self, size):
+        """Receive from the socket until at least size unread bytes are buffered"""
+        self._reserve(size)
+        while self.end < size:
+            if self.clock is not None:
+                started = self.clock()
+                received = self.socket.recv_into(self.view[self.end:])
+                self.wait_time += self.clock()-started
+            else:
+                received = self.socket.recv_into(self.view[self.end:])
+            self.recv_calls += 1
+            if not received:
+                raise OperationalError("Connection closed by the server")
+            self.bytes_received += received
+            self.end += received
+
+    def read(self, size):
+        if self.end - self.start < size:
+            self._fill(size)
+        start = self.start
+        self.start = start + size
+        return bytes(self.view[start:self.start])
+
+    def tell(self):
+        """Number of bytes consumed from the stream so far"""
+        return self.bytes_received - (self.end - self.start)
+
+    def skip(self, size):
+        if self.end - self.start < size:
+            self._fill(size)
+        self.start += size
+
+    def begin_capture(self):
+        """Start recording the bytes consumed, until end_capture"""
+        self._capture = []
+        self._capture_start = self.start
+
+    def end_capture(self):
+        """Stop recording and return the bytes consumed since begin_capture"""
+        chunks = self._capture
+        chunks.append(bytes(self.view[self._capture_start:self.start]))
+        self._capture = None
+        return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+    def read_byte(self):
+        if self.end == self.start:
+            self._fill(1)
+        self.start += 1
+        return self.buffer[self.start - 1]
+
+    def unpack(self, packer):
+        if self.end - self.start < packer.size:
+            self._fill(packer.size)
+        start = self.start
+        self.start = start + packer.size
+        return packer.unpack_from(self.buffer, start)
+
+    def read_text(self):
+        """Read a UTF-16LE value prefixed by its negative length in characters"""
+        if self.end - self.start < 4:
+            self._fill(4)
+        size = -STRUCT_VK_LONG.unpack_from(self.buffer, self.start)[0]*2
+        if self.end - self.start < 4 + size:
+            self._fill(4 + size)
+        start = self.start + 4
+        self.start = start + size
+        # decoded straight from the buffer, without an intermediate bytes copy
+        return utf_16_le_decode(self.view[start:self.start], 'strict', True)[0]
+
+    def copy_to(self, fileobj, size):
+        """Copy the next size bytes of the stream to fileobj, one buffer at a time"""
+        while size:
+            if self.end == self.start:
+                self._fill(1)
+            count = min(size, self.end-self.start)
+            fileobj.write(self.view[self.start:self.start+count])
+            self.start += count
+            size -= count
+
+    def read_until(self, delimiter):
+        searched = 0
+        while True:
+            index = self.buffer.find(delimiter, self.start + searched, self.end)
+            if index != -1:
+                break
+            searched = max(0, self.end - self.start - len(delimiter) + 1)
+            self._fill(self.end - self.start + 1)
+        return self.read(index + len(delimiter) - self.start)
+
+
+def timestamp_value(year, month, day, millisecond):
+    second = millisecond//1000
+    millisecond = millisecond-second*1000
+    microsecond = millisecond*1000
+    minute = second//60
+    second = second-minute*60
+    hour = minute//60
+    minute = minute-hour*60
+    if not year:
+        return None
+    return datetime(year,month,day,hour,minute,second,microsecond)
+
+def duration_value(milliseconds):
+    second = milliseconds//1000
+    microsecond = (milliseconds-second*1000)*1000
+    minute = second//60
+    second = second - minute*60
+    hour = minute//60
+    minute = minute - hour*60
+    return time(hour, minute, second, microsecond)
+
+
+# size of the values of fixed width types; -1 for UTF-16 text with a
+# negative length in characters, -2 for binary data with a byte length
+LAZY_WIDTHS = {
+    'VK_BOOLEAN':2, 'VK_WORD':2, 'VK_LONG':4, 'VK_LONG8':8, 'VK_REAL':8,
+    'VK_TIMESTAMP':8, 'VK_TIME':8, 'VK_DURATION':8, 'VK_UNKNOW':0,
+    'VK_STRING':-1, 'VK_TEXT':-1, 'VK_BLOB':-2, 'VK_IMAGE':-2,
+}
+
+def _lazy_text(data, offset):
+    size = -STRUCT_VK_LONG.unpack_from(data, offset)[0]*2
+    return utf_16_le_decode(memoryview(data)[offset+4:offset+4+size], 'strict', True)[0]
+
+def _lazy_binary(data, offset):
+    size = STRUCT_VK_LONG.unpack_from(data, offset)[0]
+    return data[offset+4:offset+4+size]
+
+LAZY_DECODERS = {
+    'VK_BOOLEAN':lambda data, offset: bool(STRUCT_VK_BOOLEAN.unpack_from(data, offset)[0]),
+    'VK_WORD':lambda data, offset: STRUCT_VK_WORD.unpack_from(data, offset)[0],
+    'VK_LONG':lambda data, offset: STRUCT_VK_LONG.unpack_from(data, offset)[0],
+    'VK_LONG8':lambda data, offset: STRUCT_VK_LONG8.unpack_from(data, offset)[0],
+    'VK_REAL':lambda data, offset: STRUCT_VK_REAL.unpack_from(data, offset)[0],
+    'VK_TIMESTAMP':lambda data, offset: timestamp_value(*STRUCT_VK_TIMESTAMP.unpack_from(data, offset)),
+    'VK_DURATION':lambda data, offset: duration_value(STRUCT_VK_DURATION.unpack_from(data, offset)[0]),
+    'VK_STRING':_lazy_text,
+    'VK_TEXT':_lazy_text,
+    'VK_BLOB':_lazy_binary,
+    'VK_IMAGE':_lazy_binary,
+    'VK_UNKNOW':lambda data, offset: None,
+}
+LAZY_DECODERS['VK_TIME'] = LAZY_DECODERS['VK_TIMESTAMP']
+
+
+ROW_FORMATS = ('namedtuple', 'tuple', 'dict', 'record', 'lazy')
+
+@lru_cache(maxsize=1024)
+def row_class(names):
+    """namedtuple class for a tuple of column internal names.
+
+    Cached, so that result sets with the same columns share one class.
+    Names that are not valid identifiers are renamed to _index.
+    """
+    return namedtuple('row', names, rename=True)
+
+class FourDRecord:
+    """Base class of the compact rows of the 'record' row format.
+
+    Subclasses, made by record_class, store the values in __slots__ and
+    support access by attribute, by index and by iteration.
+    """
+    __slots__ = ()
+    _setters = ()
+
+    @classmethod
+    def _make(cls, values):
+        record = cls.__new__(cls)
+        for setter, value in zip(cls._setters, values):
+            setter(record, value)
+        return record
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(getattr(self, name) for name in self.__slots__[index])
+        return getattr(self, self.__slots__[index])
+
+    def __iter__(self):
+        for name in self.__slots__:
+            yield getattr(self, name)
+
+    def __eq__(self, other):
+        try:
+            return tuple(self) == tuple(other)
+        except TypeError:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def _asdict(self):
+        return dict(zip(self.__slots__, self))
+
+    def __repr__(self):
+        return 'record({})'.format(', '.join('{}={!r}'.format(name, value)
+            for name, value in zip(self.__slots__, self)))
+
+@lru_cache(maxsize=1024)
+def record_class(names):
+    """FourDRecord subclass for a tuple of column internal names, cached like row_class"""
+    fields = row_class(names)._fields
+    cls = type('record', (FourDRecord,), {'__slots__':fields})
+    cls._setters = tuple(getattr(cls, field).__set__ for field in fields)
+    return cls
+
+
+class FourDLazyPage:
+    """A page of rows kept as the bytes received, with the offset of every value"""
+    __slots__ = ('data', 'offsets', 'width', 'decoders', 'names')
+
+    def __init__(self, data, offsets, decoders, names):
+        self.data = data
+        self.offsets = offsets
+        self.width = len(decoders)
+        self.decoders = decoders
+        self.names = names
+
+    def value(self, index, column):
+        data = self.data
+        offset = self.offsets[index]
+        status = data[offset]
+        if status == STATUS_VALUE:
+            return self.decoders[column](data, offset+1)
+        if status == STATUS_ERROR:
+            error_code = STRUCT_VK_LONG8.unpack_from(data, offset+1)[0]
+            raise Exception("Error code: {:d}".format(error_code))
+        return None
+
+
+class FourDLazyRow:
+    """Row of a lazy result set, decoding its values only when accessed.
+
+    Values are read by index, by column internal name as an attribute,
+    or by iterating; each access decodes the value again from the page.
+    """
+    __slots__ = ('_page', '_base')
+
+    def __init__(self, page, base):
+        self._page = page
+        self._base = base
+
+    def __len__(self):
+        return self._page.width
+
+    def __getitem__(self, index):
+        page = self._page
+        if isinstance(index, slice):
+            return tuple(page.value(self._base+i, i) for i in range(*index.indices(page.width)))
+        if index < 0:
+            index += page.width
+        if not 0 <= index < page.width:
+            raise IndexError("row index out of range")
+        return page.value(self._base+index, index)
+
+    def __getattr__(self, name):
+        try:
+            index = self._page.names[name]
+        except KeyError:
+            raise AttributeError(name)
+        return self._page.value(self._base+index, index)
+
+    def __iter__(self):
+        page = self._page
+        base = self._base
+        for i in range(page.width):
+            yield page.value(base+i, i)
+
+    def __eq__(self, other):
+        try:
+            return tuple(self) == tuple(other)
+        except TypeError:
+            return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def _asdict(self):
+        return dict(zip(self._page.names, self))
+
+    def __repr__(self):
+        return 'row({})'.format(', '.join('{}={!r}'.format(name, value)
+            for name, value in zip(self._page.names, self)))
+
+
+class FourDLobSpool:
+    """Temporary file holding the spilled FourDLob values of a result set.
+
+    Values are appended one after the other and each FourDLob reads its
+    own range, so a result set takes one file descriptor instead of one
+    per value. The file is deleted once nothing refers to it anymore.
+    """
+    # a response starts a new spool once its current one holds that much
+    max_size = 64 << 20
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.size = 0
+
+    def append(self, reader, size):
+        """Copy the next size bytes of reader to the end of the file, returning their offset"""
+        offset = self.size
+        self.file.seek(offset)
+        reader.copy_to(self.file, size)
+        self.size += size
+        return offset
+
+
+class FourDSpoolRange:
+    """Read-only binary file over size bytes of a FourDLobSpool, from offset"""
+
+    def __init__(self, spool, offset, size):
+        self.spool = spool
+        self.offset = offset
+        self.size = size
+        self.position = 0
+
+    @property
+    def closed(self):
+        return self.spool is None
+
+    def _file(self, position):
+        if self.spool is None:
+            raise ValueError("I/O operation on closed file")
+        # the spool is shared: every read starts with a seek
+        self.spool.file.seek(self.offset+position)
+        return self.spool.file
+
+    def read(self, size=-1):
+        remaining = max(self.size-self.position, 0)
+        if size is None or size<0 or size>remaining:
+            size = remaining
+        data = self._file(self.position).read(size)
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        size = min(len(view), max(self.size-self.position, 0))
+        received = self._file(self.position).readinto(view[:size])
+        self.position += received
+        return received
+
+    def seek(self, offset, whence=0):
+        if self.spool is None:
+            raise ValueError("I/O operation on closed file")
+        position = (0, self.position, self.size)[whence]+offset
+        if position<0:
+            raise ValueError("negative seek position {}".format(position))
+        self.position = position
+        return position
+
+    def tell(self):
+        if self.spool is None:
+            raise ValueError("I/O operation on closed file")
+        return self.position
+
+    def close(self):
+        # the spool file closes once its last range and response are gone
+        self.spool = None
+
+
+class FourDLob:
+    """Large BLOB, IMAGE or TEXT value spooled off the wire.
+
+    The value is copied from the socket in buffer-sized chunks, into
+    memory when its size is up to the connection lob_threshold and into
+    a temporary file above it (so a threshold of 0 spills every non empty
+    value). Spilled values of a result set share the FourDLobSpool given
+    by spool, a function returning it. The object is a read-only binary
+    file; iterating over it yields chunks.
+    """
+    chunk_size = 65536
+
+    def __init__(self, dtype, size, reader, threshold, spool=FourDLobSpool):
+        self.dtype = dtype
+        self.size = size
+        # True when the value is held in a temporary file
+        self.spilled = size>threshold
+        if self.spilled:
+            spool = spool()
+            self.file = FourDSpoolRange(spool, spool.append(reader, size), size)
+        else:
+            self.file = io.BytesIO()
+            reader.copy_to(self.file, size)
+            self.file.seek(0)
+
+    def __len__(self):
+        return self.size
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def readinto(self, buffer):
+        return self.file.readinto(buffer)
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def chunks(self, chunk_size=None):
+        chunk_size = chunk_size or self.chunk_size
+        self.file.seek(0)
+        while True:
+            chunk = self.file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def __iter__(self):
+        return self.chunks()
+
+    def getvalue(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def text(self):
+        return self.getvalue().decode('UTF-16LE')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_val, tb):
+        self.close()
+
+    def __repr__(self):
+        return '<FourDLob {} {} bytes>'.format(self.dtype, self.size)
+
+
+class FourDPageSizer:
+    """Adaptive FETCH-RESULT page size controller for one result set.
+
+    After every page the size of the next one is adjusted from the bytes
+    per row and the round-trip time measured so far: it doubles while a
+    page comes back faster than half target_latency and halves when it
+    takes longer than target_latency, always within page_bytes of data
+    and the min_page_size/max_page_size bounds. Pass the class (or a
+    functools.partial of it) as the page_sizer of a FourD connection.
+    """
+    min_page_size = 10
+    max_page_size = 10000
+    page_bytes = 1 << 20
+    target_latency = 0.05
+
+    def __init__(self, page_size=100, min_page_size=None, max_page_size=None,
+            page_bytes=None, target_latency=None):
+        self.min_page_size = min_page_size or self.min_page_size
+        self.max_page_size = max_page_size or self.max_page_size
+        self.page_bytes = page_bytes or self.page_bytes
+        self.target_latency = target_latency or self.target_latency
+        self.row_bytes = None
+        self.latency = None
+        self.page_sizes = []
+        self.page_size = self._clamp(page_size)
+
+    def _clamp(self, page_size):
+        if self.row_bytes:
+            page_size = min(page_size, int(self.page_bytes // self.row_bytes))
+        return max(self.min_page_size, min(self.max_page_size, page_size))
+
+    def next_page_size(self):
+        self.page_sizes.append(self.page_size)
+        return self.page_size
+
+    def observe(self, rows, nbytes, elapsed=None):
+        if rows:
+            row_bytes = nbytes/rows
+            if self.row_bytes is not None:
+                row_bytes = (self.row_bytes+row_bytes)/2
+            self.row_bytes = row_bytes
+        page_size = self.page_size
+        if elapsed is not None:
+            self.latency = elapsed
+            if elapsed < self.target_latency/2:
+                page_size *= 2
+            elif elapsed > self.target_latency:
+                page_size //= 2
+        self.page_size = self._clamp(page_size)
+
+    def stats(self):
+        return dict(page_size=self.page_size, page_sizes=list(self.page_sizes),
+            row_bytes=self.row_bytes, latency=self.latency)
+
+
+class FourDStatementCache:
+    """LRU set of the statements a FourD connection has prepared.
+
+    Keys are the normalized SQL text and its PARAMETER-TYPES. A statement
+    found in the cache is executed without its PREPARE-STATEMENT round
+    trip. Only the fact that it was prepared is kept: EXECUTE-STATEMENT
+    sends the SQL text again and has no use for the Statement-ID, so the
+    server statement is released as soon as it has been prepared.
+    """
+    def __init__(self, connection, size=64):
+        self.connection = connection
+        self.size = size
+        self.statements = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.statements)
+
+    def key(self, statement, statement_params=None):
+        return (statement.strip(), statement_parameter_types(statement_params))
+
+    def get(self, key):
+        """True if the statement of key was prepared before"""
+        if key not in self.statements:
+            self.misses += 1
+            return False
+        self.hits += 1
+        self.statements.move_to_end(key)
+        return True
+
+    def put(self, key):
+        if self.size <= 0:
+            return
+        self.statements[key] = True
+        self.statements.move_to_end(key)
+        while len(self.statements) > self.size:
+            self.statements.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.statements.clear()
+
+    def stats(self):
+        return dict(size=self.size, entries=len(self.statements),
+            hits=self.hits, misses=self.misses, evictions=self.evictions)
 
 
 class FourDResponse:
+    _deserializers = None
+    _spool = None
+    _closed = False
+    # distinct values kept per interned column before it stops adding more
+    intern_limit = 4096
+
     def __init__(self, command=None,connection=None):
         self.connection = connection
-        self.socket = connection.socket
+        self.reader = connection.reader
         self.command = command
         self.headers = {}
         self.read_headers()
         if not self.OK:
             raise self.exception
+        if self.statement_id:
+            connection.statements_opened += 1
+        self.session = connection.session
         self.row_number = None
         #if self.is_result_set:
         self.row_count_received = 0
         self.row_number = 0
+        self.prefetch = connection.prefetch
+        self._pending_pages = deque()
+        # pages read off the wire by the dispatcher for another response
+        self._parked_pages = deque()
+        self._next_fetch_row = None
+        self.page_sizer = None
+        self.row_format = getattr(command, 'row_format', None) or connection.row_format or 'namedtuple'
+        self.lazy = self.row_format == 'lazy'
+        if connection.page_sizer is not None and self.is_result_set:
+            self.page_sizer = connection.page_sizer(page_size=connection.res_size)
         if isinstance(self.command, FourDExecuteStatement):
             #print('_initialize')
             self._initialize()
@@ -258,37 +1031,36 @@ class FourDResponse:
         #    self._update_count = self._read_update_count()
 
 
-    def dis__del__(self):
-        if self.is_result_set or self.is_update_count:
-            if self.connection.connected:
-                self.close()
+    def __del__(self):
+        # no I/O here: a response with pages in flight is still referenced
+        # by its connection, so only the CLOSE-STATEMENT is left to queue
+        if (not self._closed and self.statement_id and self.connection.connected
+                and self.session == self.connection.session):
+            self._closed = True
+            self.connection.release_statement(self.statement_id, leaked=True)
 
     def close(self):
-        if self.statement_id:
-            statement_cmd = FourDCloseStatement(statement_id=self.statement_id)
-            self.connection._socket_send(statement_cmd)
-            header_bytes = self._read_header_bytes()
-            status_line, header_lines = self._get_header_lines(header_bytes)
-            status_code, statement_code = self._decode_status(status_line)
-            self.__statement_id = None
+        """Release the server statement.
+
+        Prefetched pages are discarded; the CLOSE-STATEMENT itself is
+        queued on the connection and sent along with its next command.
+        """
+        if self._closed or not self.statement_id:
+            return
+        connection = self.connection
+        self._closed = True
+        # statements of a session lost to a reconnect are gone already
+        if connection.connected and self.session == connection.session:
+            self._drain_pages(keep=False)
+            connection.release_statement(self.statement_id)
+
+    def _release_if_complete(self):
+        """Close the statement once every row has been received"""
+        if self.row_count_received>=self.row_count and not self._pending_pages:
+            self.close()
 
     def _read_header_bytes(self):
-        header_bytes = bytearray()
-        header_found=False
-        data = self._recv(1)
-        while data and not header_found:
-            header_bytes.extend(data)
-            if header_bytes.endswith(b'\r\n\r\n'):
-                header_found = True
-                break
-            try:
-                data = self._recv(1)
-            except:
-                data = None
-        if not header_found:
-            print(header_bytes)
-            raise Exception("Error: Header-end not found\n")
-        return header_bytes
+        return self.reader.read_until(2*bCRLF)
 
     def _get_header_lines(self, header_bytes):
         header_bytes = header_bytes.strip(2*bCRLF)
@@ -380,7 +1152,8 @@ class FourDResponse:
             columns.append(FourDColumn(name=column_name, 
                 internal_name=internal_name, dtype=column_type,
                 updatable=column_updatable, pytype=pytype))
-        self._row_factory = namedtuple('row', internal_names)
+        self._row_factory = row_class(tuple(internal_names))
+        self._compile_row_decoder(columns)
         return columns
 
     def _initialize(self):
@@ -390,61 +1163,242 @@ class FourDResponse:
         if self.is_update_count:
             self.update_count
             #print('387',self.update_count)
+        self._release_if_complete()
 
     @property
     def _rows_cache(self):
         if not hasattr(self, '_rows_deque'): # cache the initial rows
             self._rows_deque = deque()
-            while self.row_count_received<self.initial_row_count_sent:
-                _row = self._read_row()
-                if _row:
-                    self._rows_deque.append(_row)
+            page_start = self.reader.tell()
+            if self.row_count_received<self.initial_row_count_sent:
+                self._rows_deque.extend(self._read_rows(
+                    self.initial_row_count_sent-self.row_count_received))
+            if self.page_sizer is not None:
+                self.page_sizer.observe(self.row_count_received,
+                    self.reader.tell()-page_start)
         return self._rows_deque
             
+    def _compile_row_decoder(self, columns):
+        """Bind the deserializer of every column once for the whole result set"""
+        deserializers = []
+        for column in columns:
+            deserializer = None
+            if column.dtype in fourD_str_types:
+                deserializer = getattr(self, 'deserialize_{}'.format(column.dtype), None)
+            if deserializer is None:
+                deserializer = self._missing_deserializer(column.dtype)
+            elif self._interned_column(column):
+                deserializer = self._interning(deserializer)
+            deserializers.append(deserializer)
+        self._deserializers = tuple(deserializers)
+        self._has_row_id = any(c.updatable for c in columns)
+        if self.row_format == 'tuple':
+            self._make_row = tuple
+        elif self.row_format == 'dict':
+            names = [column.internal_name for column in columns]
+            self._make_row = lambda values: dict(zip(names, values))
+        elif self.row_format == 'record':
+            self._make_row = record_class(tuple(column.internal_name for column in columns))._make
+        else:
+            self._make_row = self._row_factory._make
+        if self.lazy:
+            self._lazy_widths = tuple(LAZY_WIDTHS.get(column.dtype) for column in columns)
+            self._lazy_decoders = tuple(LAZY_DECODERS.get(column.dtype) for column in columns)
+            self._lazy_names = dict((column.internal_name, i) for i, column in enumerate(columns))
+
+    def _interned_column(self, column):
+        intern_strings = self.connection.intern_strings
+        if not intern_strings:
+            return False
+        if column.dtype != 'VK_STRING' and (column.dtype != 'VK_TEXT'
+                or self.connection.lob_threshold is not None):
+            return False
+        return intern_strings is True or column.name in intern_strings or \
+            column.internal_name in intern_strings
+
+    def _interning(self, deserializer):
+        """Wrap a string deserializer so that equal values share one str object"""
+        values = {}
+        limit = self.intern_limit
+        def deserialize():
+            value = deserializer()
+            interned = values.get(value)
+            if interned is not None:
+                return interned
+            if len(values)<limit:
+                values[value] = value
+            return value
+        return deserialize
+
+    def _missing_deserializer(self, dtype):
+        def deserializer():
+            raise Exception('Missing data value %s'%dtype)
+        return deserializer
+
+    def _read_values(self):
+        deserializers = self._deserializers
+        if deserializers is None:
+            self.columns
+            deserializers = self._deserializers
+        read_byte = self.reader.read_byte
+        if self._has_row_id:
+            read_byte()
+            self.deserialize_VK_LONG()
+        values = []
+        append = values.append
+        for deserializer in deserializers:
+            status = read_byte()
+            if status == STATUS_VALUE:
+                append(deserializer())
+            elif status == STATUS_NULL or status == 0:
+                append(None)
+            elif status == STATUS_ERROR:
+                error_code =  self.deserialize_VK_LONG8()
+                raise Exception("Error code: {:d}".format(error_code))
+            else:
+                raise Exception('Error in reading status byte')
+        return values
+
     def _read_row(self):
+        if self.lazy:
+            return self._read_lazy_rows(1)[0]
         self.row_count_received +=1 
-        row_id=None
-        if self.updatable:
-            status = self._recv(1)
-            row_id = self.deserialize_VK_LONG()
-        row_values = {}
-        value=None
+        values = self._read_values()
+        return self._make_row(values)
+
+    def _read_rows(self, count):
+        if self.lazy:
+            return self._read_lazy_rows(count)
+        return [self._read_row() for i in range(count)]
+
+    def _read_lazy_rows(self, count):
+        """Read count rows as FourDLazyRow views over one FourDLazyPage.
+
+        Only the status bytes and lengths are read; the page bytes are
+        captured as they are consumed.
+        """
+        self.columns
+        widths = self._lazy_widths
+        if None in widths:
+            dtype = self.columns[widths.index(None)].dtype
+            raise Exception('Missing data value %s'%dtype)
+        reader = self.reader
+        read_byte = reader.read_byte
+        skip = reader.skip
+        unpack = reader.unpack
+        has_row_id = self._has_row_id
+        offsets = array('L')
+        append = offsets.append
+        self.row_count_received += count
+        page_start = reader.tell()
+        reader.begin_capture()
         try:
-            for column in self.columns:
-                status = self._recv(1)
-                if status == b'\x00':
-                    status = 0
-                try:
-                    status = int(status)
-                except:
-                    raise Exception('Error in reading status byte')
-                if status == 0:
-                    value = None
-                elif status == 1:
-                    value = self._read_value(column)
-                elif status == 2:
-                    error_code =  self.deserialize_VK_LONG8()
-                    raise Exception("Error code: {:d}".format(error_code))
-                row_values[column.internal_name]=value
-            row = self._row_factory(**row_values)
-        except:
-            print(row_values)
-            print(column.internal_name)
-            raise
-        #print(row)
-        return row
+            for i in range(count):
+                if has_row_id:
+                    skip(5)
+                for width in widths:
+                    append(reader.tell()-page_start)
+                    status = read_byte()
+                    if status == STATUS_VALUE:
+                        if width>=0:
+                            skip(width)
+                        elif width == -1:
+                            skip(-2*unpack(STRUCT_VK_LONG)[0])
+                        else:
+                            skip(unpack(STRUCT_VK_LONG)[0])
+                    elif status == STATUS_ERROR:
+                        skip(8)
+                    elif status != STATUS_NULL and status != 0:
+                        raise Exception('Error in reading status byte')
+        finally:
+            data = reader.end_capture()
+        page = FourDLazyPage(data, offsets, self._lazy_decoders, self._lazy_names)
+        width = len(widths)
+        return [FourDLazyRow(page, i*width) for i in range(count)]
         
+    def _next_page(self):
+        first_row = self._next_fetch_row
+        if first_row is None:
+            first_row = self.row_count_received
+        if self.page_sizer is not None:
+            page_size = self.page_sizer.next_page_size()
+        else:
+            page_size = self.connection.res_size
+        last_row=min(first_row+page_size, self.row_count-1)
+        return first_row, last_row
+
     def rows(self):
+        if self.prefetch:
+            self._prefetch()
         while self.row_number<self.row_count:
             if not self._rows_cache:
-                first_row = self.row_count_received
-                page_size = self.connection.res_size
-                last_row=min(first_row+page_size, self.row_count-1)
-                self._fetch(first_row=first_row, 
-                    last_row=last_row)
+                self._fetch()
             yield self._rows_cache.popleft()
             self.row_number+=1
 
+    def column_pages(self):
+        """Yield the remaining rows page by page, as one list of values per column.
+
+        Pages are decoded straight into the column lists, without building
+        a row object for each row.
+        """
+        n_columns = len(self.columns)
+        if self.prefetch:
+            self._prefetch()
+        if self._rows_cache:
+            rows = list(self._rows_cache)
+            self._rows_cache.clear()
+            self.row_number += len(rows)
+            yield self._row_columns(rows)
+        while self.row_number<self.row_count:
+            if self._parked_pages:
+                first_row, last_row, rows = self._parked_pages.popleft()
+                self.row_number += len(rows)
+                yield self._row_columns(rows)
+                continue
+            with self.connection.trace('fetch', response=self):
+                first_row, last_row = self._request_page()
+                page = [[] for i in range(n_columns)]
+                appends = [values.append for values in page]
+                for i in range(last_row-first_row+1):
+                    self.row_count_received += 1
+                    for append, value in zip(appends, self._read_values()):
+                        append(value)
+            self._observe_page()
+            self._release_if_complete()
+            self.row_number += last_row-first_row+1
+            yield page
+
+    def _row_columns(self, rows):
+        if self.row_format == 'dict':
+            rows = [row.values() for row in rows]
+        return [list(values) for values in zip(*rows)]
+
+    def fetch_range(self, first_row, last_row, page_size=None):
+        """Yield the rows first_row to last_row (inclusive) page by page.
+
+        Rows of the initial page are used when in range; the others are
+        requested with pipelined FETCH-RESULT commands, keeping up to
+        prefetch pages (at least one) in flight. The statement is closed
+        once the range has been read.
+        """
+        page_size = page_size or self.connection.res_size
+        cached = list(self._rows_cache)
+        self._rows_cache.clear()
+        if first_row<len(cached):
+            yield cached[first_row:last_row+1]
+            first_row = len(cached)
+        next_row = first_row
+        depth = max(self.prefetch, 1)
+        while first_row<=last_row:
+            while self._pages_in_flight()<depth and next_row<=last_row:
+                self._send_fetch(next_row, min(next_row+page_size-1, last_row))
+                next_row = self._next_fetch_row
+            page_first, page_last, page = self._next_fetched_page()
+            first_row = page_last+1
+            yield page
+        self.close()
+
     def read_row(self):
         try:
             row = self.rows().__next__()
@@ -453,21 +1407,98 @@ class FourDResponse:
             row = None
         return row
 
-    def _fetch(self, command_index=None,first_row=None,last_row=None):
+    def _fetch(self):
+        if not self._pages_in_flight():
+            self._send_fetch(*self._next_page())
+        first_row, last_row, rows = self._next_fetched_page()
+        self._rows_cache.extend(rows)
+        if self.prefetch:
+            self._prefetch()
+
+    def _request_page(self):
+        """Read the header of the next page, requesting it first unless prefetched"""
+        if not self._pending_pages:
+            self._send_fetch(*self._next_page())
+        self.connection._dispatch_until(self)
+        first_row, last_row = self._receive_fetch()
+        if self.prefetch:
+            self._prefetch()
+        return first_row, last_row
+
+    def _pages_in_flight(self):
+        return len(self._pending_pages)+len(self._parked_pages)
+
+    def _prefetch(self):
+        """Pipeline FETCH-RESULT requests for up to prefetch pages ahead"""
+        while self._pages_in_flight()<self.prefetch:
+            first_row, last_row = self._next_page()
+            if first_row>=self.row_count:
+                break
+            self._send_fetch(first_row, last_row)
+
+    def _send_fetch(self, first_row, last_row, command_index=None):
+        connection = self.connection
+        if self.session != connection.session:
+            raise OperationalError("Result set lost when the connection was reset")
         statement_cmd = FourDFetchStatement(statement_id=self.statement_id,
             command_index=command_index or 0, 
             first_row_index=first_row, 
             last_row_index=last_row,
             output_mode='Release',
             full_error_stack=True)
-        self.connection._socket_send(statement_cmd)
+        connection._socket_send(statement_cmd)
+        connection.in_flight.append(self)
+        sent_at = perf_counter() if self.page_sizer is not None else None
+        self._pending_pages.append((first_row, last_row, sent_at))
+        self._next_fetch_row = last_row+1
+
+    def _receive_fetch(self):
+        first_row, last_row, sent_at = self._pending_pages.popleft()
+        self.connection.in_flight.popleft()
+        page_start = self.reader.tell()
         header_bytes = self._read_header_bytes()
         status_line, header_lines = self._get_header_lines(header_bytes)
         status_code, statement_code = self._decode_status(status_line)
         if not status_code == OK:
             raise Exception("Error: error in fetch\n")
-        for i in range(last_row-first_row+1):
-                self._rows_cache.append(self._read_row())
+        if sent_at is not None:
+            self._page_started = (last_row-first_row+1, page_start, perf_counter()-sent_at)
+        return first_row, last_row
+
+    def _observe_page(self):
+        if self.page_sizer is not None:
+            rows, page_start, elapsed = self._page_started
+            self.page_sizer.observe(rows, self.reader.tell()-page_start, elapsed)
+
+    def _next_fetched_page(self):
+        """(first row, last row, rows) of the oldest page requested"""
+        if self._parked_pages:
+            return self._parked_pages.popleft()
+        self.connection._dispatch_until(self)
+        with self.connection.trace('fetch', response=self):
+            first_row, last_row = self._receive_fetch()
+            rows = self._read_rows(last_row-first_row+1)
+        self._observe_page()
+        self._release_if_complete()
+        return first_row, last_row, rows
+
+    def _park_page(self):
+        """Read the page at the head of the wire and keep it for later"""
+        with self.connection.trace('fetch', response=self):
+            first_row, last_row = self._receive_fetch()
+            rows = self._read_rows(last_row-first_row+1)
+        self._parked_pages.append((first_row, last_row, rows))
+        self._observe_page()
+        self._release_if_complete()
+
+    def _drain_pages(self, keep=True):
+        """Read the pages still on the wire, parking their rows unless discarded"""
+        while self._pending_pages:
+            self.connection._dispatch_until(self)
+            self._park_page()
+            if not keep:
+                self._parked_pages.pop()
+        self._release_if_complete()
 
     def _read_value(self, column):
         if not column.dtype in fourD_str_types:
@@ -480,73 +1511,63 @@ class FourDResponse:
         return deserializer()
 
     def _recv(self, to_receive, not_full=None):
-        r =  self.socket.recv(to_receive,socket.MSG_WAITALL)
-        #print(r)
-        return r
+        return self.reader.read(to_receive)
 
     def deserialize_VK_BOOLEAN(self):
-        return bool(struct.unpack('<H', self._recv(2))[0])
+        return bool(self.reader.unpack(STRUCT_VK_BOOLEAN)[0])
 
     def deserialize_VK_LONG(self):
-        return struct.unpack('<l', self._recv(4))[0]
+        return self.reader.unpack(STRUCT_VK_LONG)[0]
 
     def deserialize_VK_WORD(self):
-        return struct.unpack('<h', self._recv(2))[0]
+        return self.reader.unpack(STRUCT_VK_WORD)[0]
 
     def deserialize_VK_LONG8(self):
-        read_bytes = self._recv(8)
-        #print(read_bytes)
-        return struct.unpack('<q', read_bytes)[0]
+        return self.reader.unpack(STRUCT_VK_LONG8)[0]
 
     def deserialize_VK_REAL(self):
-        return struct.unpack('<d', self._recv(8))[0]
+        return self.reader.unpack(STRUCT_VK_REAL)[0]
 
     def deserialize_VK_TIMESTAMP(self):
-        year,month,day,millisecond = struct.unpack('<HBBL',self._recv(8))
-        second = millisecond//1000
-        millisecond = millisecond-second*1000
-        microsecond = millisecond*1000
-        minute = second//60
-        second = second-minute*60
-        hour = minute//60
-        minute = minute-hour*60
-        if not year:
-            return None
-        return datetime(year,month,day,hour,minute,second,microsecond)
+        return timestamp_value(*self.reader.unpack(STRUCT_VK_TIMESTAMP))
 
 
     deserialize_VK_TIME = deserialize_VK_TIMESTAMP
 
     def deserialize_VK_DURATION(self):
-        milliseconds = struct.unpack('<Q', self._recv(8))[0]
-        second = milliseconds//1000
-        microsecond = (milliseconds-second*1000)*1000
-        minute = second//60
-        second = second - minute*60
-        hour = minute//60
-        minute = minute - hour*60
-        return time(hour, minute, second, microsecond)
+        return duration_value(self.reader.unpack(STRUCT_VK_DURATION)[0])
 
     def deserialize_VK_STRING(self):
-        str_len= -struct.unpack('<l',self._recv(4))[0]
-        str_len *= 2 # UTF-16LE Strings use 2 bytes per character
-        encoded_value=self._recv(str_len)
-        return encoded_value.decode('UTF-16LE').encode().decode()
+        return self.reader.read_text()
         
         
     def deserialize_VK_TEXT(self):
-        str_len= -struct.unpack('<l',self._recv(4))[0]
-        #print(str_len)
-        str_len *= 2 # UTF-16LE Strings use 2 bytes per character
-        encoded_value=self._recv(str_len)
-        return encoded_value.decode('UTF-16LE').encode().decode()
+        if self.connection.lob_threshold is not None:
+            str_len= -self.reader.unpack(STRUCT_VK_LONG)[0]
+            str_len *= 2 # UTF-16LE Strings use 2 bytes per character
+            return FourDLob('VK_TEXT', str_len, self.reader, self.connection.lob_threshold,
+                self._lob_spool)
+        return self.reader.read_text()
         
+    def _lob_spool(self):
+        """FourDLobSpool the spilled values of the result set are appended to"""
+        spool = self._spool
+        if spool is None or spool.size>=spool.max_size:
+            spool = self._spool = FourDLobSpool()
+        return spool
+
     def deserialize_VK_BLOB(self):
-        blob_len = struct.unpack('<l',self._recv(4))[0]
+        blob_len = self.reader.unpack(STRUCT_VK_LONG)[0]
+        if self.connection.lob_threshold is not None:
+            return FourDLob('VK_BLOB', blob_len, self.reader, self.connection.lob_threshold,
+                self._lob_spool)
         return self._recv(blob_len)
 
     def deserialize_VK_IMAGE(self):
-        blob_len = struct.unpack('<l',self._recv(4))[0]
+        blob_len = self.reader.unpack(STRUCT_VK_LONG)[0]
+        if self.connection.lob_threshold is not None:
+            return FourDLob('VK_IMAGE', blob_len, self.reader, self.connection.lob_threshold,
+                self._lob_spool)
         return self._recv(blob_len)
 
     def deserialize_VK_UNKNOW(self):
@@ -592,8 +1613,16 @@ class FourDFetchResponse(FourDResponse):
     pass
 
 class FourD:
+    pipeline_size = 256
+    pipeline_bytes = 1 << 20
+
     def __init__(self, host=None, user=None, password=None, 
-            database=None, port=None, res_size=None, reply_64=False):
+            database=None, port=None, res_size=None, reply_64=False,
+            statement_cache_size=64, prefetch=0, page_sizer=None,
+            lob_threshold=None, row_format=None, tracer=None, intern_strings=None,
+            connect_timeout=15, nodelay=True, keepalive=True, keepalive_idle=60,
+            keepalive_interval=10, keepalive_count=5, pipeline_login=False,
+            auto_reconnect=False):
         self.host=host
         self.user=user
         self.password=password
@@ -603,7 +1632,39 @@ class FourD:
         self.set_preferred_image_types(DEFAULT_IMAGE_TYPE)
         self.res_size = res_size or 100
         self.reply_64=reply_64
-        self.current_response = None
+        # the response owning each FETCH-RESULT page in flight, oldest first
+        self.in_flight = deque()
+        self.prefetch = prefetch
+        self.page_sizer = page_sizer
+        if lob_threshold is not None and lob_threshold<0:
+            raise ProgrammingError("lob_threshold must be None or at least 0")
+        self.lob_threshold = lob_threshold
+        if row_format is not None and row_format not in ROW_FORMATS:
+            raise ProgrammingError("Unknown row format {!r}".format(row_format))
+        self.row_format = row_format
+        # True, or the names of the string columns whose values are interned
+        self.intern_strings = intern_strings
+        self.send_calls = 0
+        self.bytes_sent = 0
+        self.send_time = 0.0
+        self.reader = None
+        self.tracer = tracer
+        self.statement_cache = FourDStatementCache(self, statement_cache_size)
+        self._deferred = []
+        self.statements_opened = 0
+        self.statements_closed = 0
+        self.statements_leaked = 0
+        self.connect_timeout = connect_timeout
+        self.socket_options = dict(nodelay=nodelay, keepalive=keepalive,
+            keepalive_idle=keepalive_idle, keepalive_interval=keepalive_interval,
+            keepalive_count=keepalive_count)
+        # send LOGIN along with the first command instead of waiting for its reply
+        self.pipeline_login = pipeline_login
+        self.auto_reconnect = auto_reconnect
+        self._login_cmd = None
+        # incremented by reconnect; responses of older sessions cannot fetch
+        self.session = 0
+        self.reconnects = 0
 
     def set_preferred_image_types(self, types):
         self.image_type = types
@@ -611,32 +1672,216 @@ class FourD:
     def connect(self):
         if self.connected:
             return
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.settimeout(15)
+        self.socket = socket.create_connection((self.host, self.port), self.connect_timeout)
         self.socket.setblocking(True)
-        self.socket.connect((self.host, self.port))
-        self.dblogin()
+        tune_socket(self.socket, **self.socket_options)
+        self.reader = FourDWireReader(self.socket)
+        self.reader.clock = perf_counter if self._tracer is not None else None
+        if self.pipeline_login:
+            # a failed login is raised by the first command
+            self._login_cmd = self._login_command()
+            self._deferred.insert(0, self._login_cmd)
+        else:
+            self.dblogin()
         self.connected=True
 
+    def reconnect(self):
+        """Replace a broken connection with a new session.
+
+        Statements and result sets of the old session are lost, and every
+        queued command of the old session, such as a START TRANSACTION not
+        sent yet, is dropped. The statement cache is kept, as the
+        statements it lists hold no server state.
+        """
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+        self.connected = False
+        self.session += 1
+        self.reconnects += 1
+        for response in self.in_flight:
+            response._pending_pages.clear()
+        self.in_flight.clear()
+        self._deferred = []
+        # the server released the statements of the old session
+        self.statements_closed = self.statements_opened-self.statements_leaked
+        self.connect()
+
+    def ensure_alive(self):
+        """With auto_reconnect, reconnect an idle connection found closed.
+
+        Meant to be called between transactions, when moving to a new
+        session loses nothing.
+        """
+        if self.auto_reconnect and self.connected and not self.in_flight and not self.is_alive():
+            log.warning("Connection to %s:%s lost, reconnecting", self.host, self.port)
+            self.reconnect()
+
+    @property
+    def tracer(self):
+        return self._tracer
+
+    @tracer.setter
+    def tracer(self, tracer):
+        """Set a FourDTracer, or None to disable tracing"""
+        self._tracer = tracer
+        if self.reader is not None:
+            self.reader.clock = perf_counter if tracer is not None else None
+
+    def trace(self, kind, statement=None, response=None):
+        """Context manager reporting an operation to the tracer, if any"""
+        if self._tracer is None:
+            return NO_TRACE
+        return FourDTrace(self, kind, statement, response)
+
+    def _dispatch_until(self, response=None):
+        """Read the pages in flight ahead of those of response (all when None)
+
+        Every page is handed to the response that requested it, which
+        parks its rows until read, so several cursors can share the
+        connection with their fetches pipelined.
+        """
+        in_flight = self.in_flight
+        while in_flight and in_flight[0] is not response:
+            in_flight[0]._park_page()
+
+    def is_alive(self):
+        """Check without blocking that the socket is still open and idle"""
+        if not self.connected or self.in_flight:
+            return False
+        if self.reader.available:
+            return False
+        try:
+            readable, _, _ = select.select([self.socket], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        # an idle connection has nothing to read: either the server closed
+        # it or unexpected data is pending
+        return not readable
+
+    def release_statement(self, statement_id, leaked=False):
+        """Queue a CLOSE-STATEMENT, sent along with the next command.
+
+        leaked counts statements released only because their response
+        was garbage collected while still open.
+        """
+        self._deferred.append(FourDCloseStatement(statement_id=statement_id))
+        if leaked:
+            self.statements_leaked += 1
+        else:
+            self.statements_closed += 1
+
+    def defer_statement(self, statement, guarded=False):
+        """Queue statement to be executed along with the next command, without PREPARE.
+
+        Returns the queued command, for cancel_deferred. An error of the
+        statement is raised by the command it was sent with. A guarded
+        statement, such as START TRANSACTION, only shares a write with
+        commands without side effects (PREPARE, FETCH, CLOSE): ahead of
+        any other it is sent on its own, and its error raised before the
+        command runs.
+        """
+        statement_cmd = self._execute_command(statement)
+        statement_cmd.guarded = guarded
+        self._deferred.append(statement_cmd)
+        return statement_cmd
+
+    def cancel_deferred(self, command):
+        """Drop a queued command, returning False if it was already sent"""
+        try:
+            self._deferred.remove(command)
+        except ValueError:
+            return False
+        return True
+
+    def _take_deferred(self):
+        """Take the queued commands, returning them and their serialized form"""
+        if not self._deferred:
+            return (), b''
+        commands, self._deferred = self._deferred, []
+        return commands, b''.join(bytes(command) for command in commands)
+
+    def _guards(self, command):
+        """True if a guarded deferred statement must not be sent along with command"""
+        return command.side_effects and any(getattr(deferred, 'guarded', False)
+            for deferred in self._deferred)
+
+    def _flush_deferred(self):
+        """Send the queued commands on their own, raising the first error"""
+        deferred, deferred_bytes = self._take_deferred()
+        self._socket_send(deferred_bytes)
+        self._dispatch_until()
+        error = self._read_deferred(deferred)
+        if error is not None:
+            raise error
+
+    def _read_deferred(self, commands):
+        """Read the responses of the deferred commands, returning the first error"""
+        error = None
+        for command in commands:
+            try:
+                FourDResponse(command=command, connection=self)
+            except FourDException as e:
+                # a KO to CLOSE-STATEMENT only means the statement is gone
+                if not isinstance(command, FourDCloseStatement):
+                    command.error = e
+                    error = error or e
+        return error
+
+    def statement_stats(self):
+        pending = sum(isinstance(command, FourDCloseStatement) for command in self._deferred)
+        return dict(opened=self.statements_opened, closed=self.statements_closed,
+            leaked=self.statements_leaked, pending=pending,
+            cached=len(self.statement_cache),
+            open=self.statements_opened-self.statements_closed-self.statements_leaked)
+
     def fourd_send(self, command, response_factory=None):
-        self._socket_send(command)
+        if self._guards(command):
+            self._flush_deferred()
+        deferred, deferred_bytes = self._take_deferred()
+        self._socket_send(deferred_bytes+bytes(command) if deferred else command)
+        # pages requested before the command are answered first
+        self._dispatch_until()
+        error = self._read_deferred(deferred)
         response_factory = response_factory or FourDResponse
-        response = FourDResponse(command=command, connection=self)
+        try:
+            response = FourDResponse(command=command, connection=self)
+        except FourDException:
+            if error is None:
+                raise
+            response = None
+        if error is not None:
+            if response is not None:
+                response.close()
+            raise error
         return response
 
     def _socket_send(self, bytes_value):
-        if not isinstance(bytes_value, bytes):
+        if not isinstance(bytes_value, (bytes, bytearray)):
             bytes_value = bytes(bytes_value)
-        self.socket.send(bytes_value)
+        if self._tracer is not None:
+            started = perf_counter()
+            self.socket.sendall(bytes_value)
+            self.send_time += perf_counter()-started
+        else:
+            self.socket.sendall(bytes_value)
+        self.send_calls += 1
+        self.bytes_sent += len(bytes_value)
 
     
-    def dblogin(self):
+    def _login_command(self):
         if __LOGIN_BASE64__:
             login_class = FourDLogin
         else:
             login_class = FourDLoginPlain
-        login_cmd = login_class(user_name=self.user, user_password=self.password, reply_with_base_64_text=self.reply_64)
-        self.fourd_send(login_cmd)
+        return login_command(login_class, self.user, self.password, self.reply_64)
+
+    def dblogin(self):
+        # sent on its own: queued commands only run once logged in
+        login_cmd = self._login_command()
+        self._socket_send(login_cmd)
+        FourDResponse(command=login_cmd, connection=self)
 
     def dblogout(self):
         self.fourd_send(FourDLogout())
@@ -645,20 +1890,47 @@ class FourD:
         self.fourd_send(FourDQuit())
 
     def close(self):
-        self.dblogout()
-        self.quit()
+        # logging out releases every statement of the connection
+        logged_in = not self.cancel_deferred(self._login_cmd)
+        self._deferred = []
+        with self.trace('close'):
+            if logged_in:
+                self.dblogout()
+                self.quit()
         self.socket.close()
         self.connected=False
+        self.statement_cache.clear()
 
     def prepare_statement(self, statement, statement_params=None):
+        """Prepare statement unless the statement cache lists it.
+
+        Returns the PREPARE-STATEMENT response, already closed: its
+        CLOSE-STATEMENT goes out with the next command. Returns None when
+        the statement was prepared before.
+        """
+        cache_key = self.statement_cache.key(statement, statement_params)
+        if self.statement_cache.get(cache_key):
+            return None
+        statement_cmd = self._prepare_command(statement, statement_params)
+        with self.trace('prepare', statement) as trace:
+            response = self.fourd_send(statement_cmd)
+            trace.set_response(response)
+        response.close()
+        self.statement_cache.put(cache_key)
+        return response
+
+    def _prepare_command(self, statement, statement_params=None, **kwargs):
         if __STATEMENT_BASE64__:
             statement_class = FourDPrepareStatement 
         else:
             statement_class = FourDPrepareStatementPlain
-        statement_cmd = statement_class(statement=statement, statement_params=statement_params)
-        return self.fourd_send(statement_cmd)
+        return statement_class(statement=statement, statement_params=statement_params, **kwargs)
 
-    def execute_statement(self, statement, statement_params=None, first_page_size=0):
+    def close_statement(self, statement_id):
+        return self.fourd_send(FourDCloseStatement(statement_id=statement_id))
+
+    def _execute_command(self, statement, statement_params=None, first_page_size=0,
+            row_format=None):
         if __STATEMENT_BASE64__:
             statement_class = FourDExecuteStatement 
         else:
@@ -667,9 +1939,80 @@ class FourD:
             first_page_size=first_page_size or 0,
             output_mode='Release',full_error_stack=True,
             statement_params=statement_params)
-        result = self.fourd_send(statement_cmd)
+        # read by the response, overriding the connection row_format
+        statement_cmd.row_format = row_format
+        statement_cmd.statement = statement
+        return statement_cmd
+
+    def execute_statement(self, statement, statement_params=None, first_page_size=0,
+            row_format=None):
+        statement_cmd = self._execute_command(statement, statement_params, first_page_size,
+            row_format)
+        with self.trace('execute', statement) as trace:
+            result = self.fourd_send(statement_cmd)
+            trace.set_response(result)
         return result
 
+    def execute_statements(self, statements, first_page_size=0,
+            batch_size=None, batch_bytes=None, row_format=None, stop_on_error=False):
+        """Pipeline EXECUTE-STATEMENT commands for (statement, params) pairs.
+
+        Up to batch_size commands (or batch_bytes of request data) are
+        written with a single send, then their responses are read in order.
+        Yields, for each statement, its response or the FourDException the
+        server answered with. With stop_on_error no batch is sent after
+        one in which a statement failed; the statements of that batch
+        have all been executed. Closing the generator early still drains
+        the responses of the batch in flight, so the connection stays usable.
+        """
+        batch_size = batch_size or self.pipeline_size
+        batch_bytes = batch_bytes or self.pipeline_bytes
+        statements = iter(statements)
+        while True:
+            batch = []
+            send_buffer = bytearray()
+            for statement, statement_params in statements:
+                statement_cmd = self._execute_command(statement, statement_params,
+                    first_page_size, row_format)
+                send_buffer += bytes(statement_cmd)
+                batch.append(statement_cmd)
+                if len(batch) >= batch_size or len(send_buffer) >= batch_bytes:
+                    break
+            if not batch:
+                return
+            if self._guards(batch[0]):
+                self._flush_deferred()
+            deferred, deferred_bytes = self._take_deferred()
+            if deferred:
+                send_buffer[:0] = deferred_bytes
+            self._socket_send(send_buffer)
+            self._dispatch_until()
+            error = self._read_deferred(deferred)
+            pending = deque(batch)
+            failed = False
+            try:
+                if error is not None:
+                    raise error
+                while pending:
+                    statement_cmd = pending.popleft()
+                    try:
+                        with self.trace('execute', statement_cmd.statement) as trace:
+                            response = FourDResponse(command=statement_cmd, connection=self)
+                            trace.set_response(response)
+                    except FourDException as e:
+                        response = e
+                        failed = True
+                    yield response
+                if failed and stop_on_error:
+                    return
+            finally:
+                while pending:
+                    statement_cmd = pending.popleft()
+                    try:
+                        FourDResponse(command=statement_cmd, connection=self).close()
+                    except FourDException:
+                        pass
+
     
 
 
@@ -0,0 +1,367 @@
+"""Local fake 4D SQL server for tests and benchmarks.
+
+It speaks the subset of the protocol used by this driver: LOGIN, LOGOUT,
+QUIT, PREPARE-STATEMENT, EXECUTE-STATEMENT, FETCH-RESULT and
+CLOSE-STATEMENT. SELECT statements return a synthetic result set, any
+other statement an update count. Run it standalone with
+
+    python -m fourd.mockserver --rows 100000 --columns VK_LONG,VK_STRING
+"""
+import argparse
+import base64
+import socket
+import socketserver
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from .lib import bCRLF, STRUCT_VK_BOOLEAN, STRUCT_VK_WORD, STRUCT_VK_LONG, \
+    STRUCT_VK_LONG8, STRUCT_VK_REAL, STRUCT_VK_TIMESTAMP, STRUCT_VK_DURATION
+
+PARAMETER_SIZES = {
+    "VK_BOOLEAN":2,
+    "VK_WORD":2,
+    "VK_LONG":4,
+    "VK_LONG8":8,
+    "VK_REAL":8,
+    "VK_FLOAT":8,
+    "VK_TIMESTAMP":8,
+    "VK_TIME":8,
+    "VK_DURATION":8,
+}
+
+DEFAULT_COLUMNS = (("id", "VK_LONG8"), ("name", "VK_STRING"), ("amount", "VK_REAL"),
+    ("created", "VK_TIMESTAMP"), ("active", "VK_BOOLEAN"))
+
+
+def encode_value(dtype, value):
+    """Encode a value with its status byte, as a row of a result set"""
+    if value is None:
+        return b'0'
+    if dtype == "VK_BOOLEAN":
+        data = STRUCT_VK_BOOLEAN.pack(value)
+    elif dtype == "VK_WORD":
+        data = STRUCT_VK_WORD.pack(value)
+    elif dtype == "VK_LONG":
+        data = STRUCT_VK_LONG.pack(value)
+    elif dtype == "VK_LONG8":
+        data = STRUCT_VK_LONG8.pack(value)
+    elif dtype in ("VK_REAL", "VK_FLOAT"):
+        data = STRUCT_VK_REAL.pack(value)
+    elif dtype in ("VK_TIMESTAMP", "VK_TIME"):
+        milliseconds = (value.hour*3600+value.minute*60+value.second)*1000+value.microsecond//1000
+        data = STRUCT_VK_TIMESTAMP.pack(value.year, value.month, value.day, milliseconds)
+    elif dtype == "VK_DURATION":
+        data = STRUCT_VK_DURATION.pack(int(value.total_seconds()*1000))
+    elif dtype in ("VK_STRING", "VK_TEXT"):
+        encoded_value = value.encode('UTF-16LE')
+        data = STRUCT_VK_LONG.pack(-(len(encoded_value)//2))+encoded_value
+    elif dtype in ("VK_BLOB", "VK_IMAGE"):
+        data = STRUCT_VK_LONG.pack(len(value))+value
+    else:
+        raise ValueError("Unsupported type %s"%dtype)
+    return b'1'+data
+
+
+class FourDMockResultSet:
+    """Synthetic result set.
+
+    columns is a sequence of (name, dtype) pairs; string and binary
+    values are width characters (bytes) long and every null_every-th row
+    holds nulls. Encoded rows are generated for distinct_rows rows and
+    then repeated, so serving large result sets stays cheap.
+    """
+
+    def __init__(self, columns=DEFAULT_COLUMNS, row_count=1000, width=16,
+            null_every=0, distinct_rows=1024):
+        self.columns = [tuple(column) for column in columns]
+        self.row_count = row_count
+        self.width = width
+        self.null_every = null_every
+        self.distinct_rows = distinct_rows
+        self._encoded_rows = {}
+
+    def value(self, row, dtype):
+        if self.null_every and row%self.null_every == self.null_every-1:
+            return None
+        if dtype == "VK_BOOLEAN":
+            return row%2 == 0
+        if dtype == "VK_WORD":
+            return row%32768
+        if dtype in ("VK_LONG", "VK_LONG8"):
+            return row
+        if dtype in ("VK_REAL", "VK_FLOAT"):
+            return row*1.5
+        if dtype in ("VK_TIMESTAMP", "VK_TIME"):
+            return datetime(2000, 1, 1)+timedelta(seconds=row*61)
+        if dtype == "VK_DURATION":
+            return timedelta(milliseconds=row)
+        if dtype in ("VK_STRING", "VK_TEXT"):
+            return ('%d-'%row).ljust(self.width, 'x')[:self.width]
+        return bytes([row%256])*self.width
+
+    def row(self, row):
+        return tuple(self.value(row, dtype) for name, dtype in self.columns)
+
+    def encoded_row(self, row):
+        key = row%self.distinct_rows
+        encoded = self._encoded_rows.get(key)
+        if encoded is None:
+            encoded = b''.join(encode_value(dtype, value)
+                for (name, dtype), value in zip(self.columns, self.row(key)))
+            self._encoded_rows[key] = encoded
+        return encoded
+
+    def encode_rows(self, first_row, last_row):
+        last_row = min(last_row, self.row_count-1)
+        return b''.join(self.encoded_row(row) for row in range(first_row, last_row+1))
+
+    def headers(self):
+        return [
+            'Result-Type:Result-Set',
+            'Column-Count:%d'%len(self.columns),
+            'Column-Aliases:'+' '.join('[%s]'%name for name, dtype in self.columns),
+            'Column-Types:'+' '.join(dtype for name, dtype in self.columns),
+            'Column-Updateability:'+' '.join('N' for column in self.columns),
+            'Row-Count:%d'%self.row_count,
+        ]
+
+
+class FourDMockHandler(socketserver.BaseRequestHandler):
+
+    def setup(self):
+        self.buffer = bytearray()
+        self.statements = {}
+        self.next_statement_id = 1
+        with self.server.lock:
+            self.server.handlers.add(self)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.handlers.discard(self)
+
+    def _receive(self):
+        data = self.request.recv(65536)
+        if not data:
+            raise EOFError
+        self.server.bytes_received += len(data)
+        self.buffer += data
+
+    def _read_until(self, delimiter):
+        while True:
+            index = self.buffer.find(delimiter)
+            if index != -1:
+                break
+            self._receive()
+        data = bytes(self.buffer[:index+len(delimiter)])
+        del self.buffer[:index+len(delimiter)]
+        return data
+
+    def _read(self, size):
+        while len(self.buffer)<size:
+            self._receive()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def _read_parameters(self, parameter_types):
+        params = []
+        for parameter_type in parameter_types:
+            if self._read(1) == b'0':
+                params.append(None)
+            elif parameter_type in PARAMETER_SIZES:
+                params.append(self._read(PARAMETER_SIZES[parameter_type]))
+            elif parameter_type in ("VK_STRING", "VK_TEXT"):
+                length = -STRUCT_VK_LONG.unpack(self._read(4))[0]
+                params.append(self._read(length*2).decode('UTF-16LE'))
+            elif parameter_type in ("VK_BLOB", "VK_IMAGE"):
+                length = STRUCT_VK_LONG.unpack(self._read(4))[0]
+                params.append(self._read(length))
+        return params
+
+    def _read_command(self):
+        header = self._read_until(2*bCRLF).decode().strip()
+        lines = header.split('\r\n')
+        command_id, _, command = lines[0].partition(' ')
+        headers = {}
+        for line in lines[1:]:
+            key, _, value = line.partition(':')
+            headers[key] = value.strip()
+        statement = headers.get('STATEMENT')
+        if 'STATEMENT-BASE64' in headers:
+            statement = base64.b64decode(headers['STATEMENT-BASE64']).decode()
+        params = []
+        if 'PARAMETER-TYPES' in headers:
+            params = self._read_parameters(headers['PARAMETER-TYPES'].split())
+        return command_id, command, headers, statement, params
+
+    def handle(self):
+        server = self.server
+        try:
+            while True:
+                command_id, command, headers, statement, params = self._read_command()
+                with server.lock:
+                    server.commands[command] += 1
+                if server.latency:
+                    time.sleep(server.latency)
+                response = self.respond(command_id, command, headers, statement, params)
+                self.request.sendall(response)
+                server.bytes_sent += len(response)
+                if command == 'QUIT':
+                    return
+        except (EOFError, ConnectionError):
+            pass
+
+    def _header(self, command_id, lines=(), status='OK'):
+        return ('\r\n'.join(['%s %s'%(command_id, status)]+list(lines))+'\r\n\r\n').encode()
+
+    def _statement_id(self, result):
+        statement_id = self.next_statement_id
+        self.next_statement_id += 1
+        self.statements[statement_id] = result
+        return statement_id
+
+    def respond(self, command_id, command, headers, statement, params):
+        if command in ('LOGIN', 'LOGOUT', 'QUIT'):
+            return self._header(command_id)
+        if command == 'CLOSE-STATEMENT':
+            self.statements.pop(int(headers.get('STATEMENT-ID', 0)), None)
+            return self._header(command_id)
+        error = self.server.error_for(statement, params)
+        if error is not None:
+            return self._header(command_id, ['Error-Code:%d'%error[0],
+                'Error-Component-Code:0', 'Error-Description:%s'%error[1]], status='KO')
+        if command == 'PREPARE-STATEMENT':
+            return self._header(command_id, ['Statement-ID:%d'%self._statement_id(None)])
+        if command == 'EXECUTE-STATEMENT':
+            result = self.server.result_for(statement)
+            statement_id = self._statement_id(result)
+            if result is None:
+                return (self._header(command_id, ['Statement-ID:%d'%statement_id,
+                    'Result-Type:Update-Count'])+STRUCT_VK_LONG8.pack(self.server.update_count))
+            sent = min(int(headers.get('FIRST-PAGE-SIZE') or 0), result.row_count)
+            lines = ['Statement-ID:%d'%statement_id]+result.headers()+['Row-Count-Sent:%d'%sent]
+            return self._header(command_id, lines)+result.encode_rows(0, sent-1)
+        if command == 'FETCH-RESULT':
+            result = self.statements.get(int(headers.get('STATEMENT-ID', 0)))
+            if result is None:
+                return self._header(command_id, ['Error-Code:1',
+                    'Error-Component-Code:0', 'Error-Description:Unknown statement'], status='KO')
+            first_row = int(headers['FIRST-ROW-INDEX'])
+            last_row = int(headers['LAST-ROW-INDEX'])
+            return self._header(command_id)+result.encode_rows(first_row, last_row)
+        return self._header(command_id, ['Error-Code:1', 'Error-Component-Code:0',
+            'Error-Description:Unsupported command %s'%command], status='KO')
+
+
+class FourDMockServer(socketserver.ThreadingTCPServer):
+    """Threaded localhost server answering like a 4D SQL server.
+
+    result_set is returned for every SELECT, unless result_sets maps the
+    exact statement text to another one; other statements report
+    update_count. latency seconds are slept before each response, and
+    statements listed in errors (or whose parameters contain one of them)
+    fail with a KO response.
+    """
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, result_set=None, result_sets=None, latency=0.0,
+            update_count=1, errors=(), host='127.0.0.1', port=0):
+        super().__init__((host, port), FourDMockHandler)
+        self.result_set = result_set or FourDMockResultSet()
+        self.result_sets = dict(result_sets or {})
+        self.latency = latency
+        self.update_count = update_count
+        self.errors = set(errors)
+        self.lock = threading.Lock()
+        self.commands = Counter()
+        self.handlers = set()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._thread = None
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def connect_kwargs(self):
+        return dict(host=self.host, port=self.port, user='mock', password='mock')
+
+    def result_for(self, statement):
+        if statement in self.result_sets:
+            return self.result_sets[statement]
+        if statement.lstrip().upper().startswith('SELECT'):
+            return self.result_set
+        return None
+
+    def error_for(self, statement, params):
+        if not self.errors:
+            return None
+        if statement in self.errors or any(p in self.errors for p in params if isinstance(p, str)):
+            return (1, 'Mock error')
+        return None
+
+    def drop_connections(self):
+        """Close every client connection, as a server restart would"""
+        with self.lock:
+            handlers = list(self.handlers)
+        for handler in handlers:
+            try:
+                handler.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, ex_type, ex_val, tb):
+        self.stop()
+
+
+def parse_columns(spec):
+    """Parse "VK_LONG,name:VK_STRING" into (name, dtype) pairs"""
+    columns = []
+    for i, column in enumerate(spec.split(',')):
+        name, _, dtype = column.rpartition(':')
+        columns.append((name or 'c%d'%i, dtype))
+    return columns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fake 4D SQL server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--columns', default=','.join(dtype for name, dtype in DEFAULT_COLUMNS))
+    parser.add_argument('--width', type=int, default=16)
+    parser.add_argument('--null-every', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args(argv)
+    result_set = FourDMockResultSet(parse_columns(args.columns), row_count=args.rows,
+        width=args.width, null_every=args.null_every)
+    server = FourDMockServer(result_set, latency=args.latency, host=args.host, port=args.port)
+    print(server.port, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
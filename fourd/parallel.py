@@ -0,0 +1,199 @@
+import multiprocessing
+import queue
+import re
+import threading
+from itertools import chain
+from .fourd import connect
+from .exceptions import *
+
+_DONE = None
+ORDER_BY_PATTERN = re.compile(r'\bORDER\s+BY\b', re.IGNORECASE)
+
+
+def key_ranges(low, high, partitions):
+    """Split the integer keys low <= key < high into contiguous (low, high) ranges.
+
+    The result is meant as the ranges of parallel_fetch, for a query
+    filtering with "WHERE key >= %s AND key < %s".
+    """
+    bounds = [low+(high-low)*i//partitions for i in range(partitions+1)]
+    return [(bounds[i], bounds[i+1]) for i in range(partitions) if bounds[i]<bounds[i+1]]
+
+
+def scan_partition(connection, sql, params=None, partition=0, partitions=1, page_size=None):
+    """Yield the pages of rows of one partition of a parallel scan.
+
+    The statement is executed in full on connection and only the
+    partition's share of its rows is fetched, by FETCH-RESULT row index;
+    see parallel_pages for why it must be ordered.
+    """
+    cursor = connection.cursor()
+    if partition:
+        # the first page belongs to partition 0
+        cursor.pagesize = 1
+    try:
+        cursor.execute(sql, params)
+        result = cursor.result
+        if not result.is_result_set:
+            raise ProgrammingError("parallel_fetch needs a query returning rows")
+        row_count = result.row_count
+        first_row = row_count*partition//partitions
+        last_row = row_count*(partition+1)//partitions-1
+        for page in result.fetch_range(first_row, last_row, page_size):
+            yield page
+    finally:
+        cursor.close()
+
+
+def _put(pages, item, stop):
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _run_partition(index, task, page_size, open_connection, close_connection,
+        pages, stop, as_tuples):
+    try:
+        connection = open_connection()
+        try:
+            for page in scan_partition(connection, *task, page_size=page_size):
+                if as_tuples:
+                    page = [tuple(row) for row in page]
+                if not _put(pages, (index, page), stop):
+                    break
+        finally:
+            close_connection(connection)
+    except Exception as e:
+        _put(pages, (index, e), stop)
+    else:
+        _put(pages, (index, _DONE), stop)
+
+
+def _process_partition(index, task, page_size, connect_kwargs, pages, stop):
+    # row classes are created per result set and cannot be pickled
+    _run_partition(index, task, page_size, lambda: connect(**connect_kwargs),
+        lambda connection: connection.close(), pages, stop, True)
+
+
+def _get(pages, workers):
+    while True:
+        try:
+            return pages.get(timeout=1)
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                raise OperationalError("Parallel scan worker exited without a result")
+
+
+def _merge(queues, workers, ordered):
+    if ordered:
+        for pages in queues:
+            while True:
+                index, page = _get(pages, workers)
+                if page is _DONE:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        return
+    pages = queues[0]
+    remaining = len(workers)
+    while remaining:
+        index, page = _get(pages, workers)
+        if page is _DONE:
+            remaining -= 1
+        elif isinstance(page, Exception):
+            raise page
+        else:
+            yield page
+
+
+def _shutdown(workers, queues, stop):
+    stop.set()
+    for worker in workers:
+        while True:
+            worker.join(0.1)
+            if not worker.is_alive():
+                break
+            # a process only exits once the pages it queued are read
+            for pages in queues:
+                try:
+                    while True:
+                        pages.get_nowait()
+                except queue.Empty:
+                    pass
+
+
+def parallel_pages(sql, partitions=4, params=None, ranges=None, ordered=True,
+        pool=None, executor='thread', page_size=None, queue_size=8, **connect_kwargs):
+    """Run a query over several connections and yield its pages of rows.
+
+    By default the statement is executed with params on each of the
+    partitions connections, and each one fetches a contiguous share of
+    the rows by row index. This is only correct if every execution
+    returns the same rows in the same order, so the query must have an
+    ORDER BY on a unique key, and the table must not change during the
+    scan, or rows are missed or duplicated. With ranges, a list of
+    parameter sets such as key_ranges() returns, every parameter set is
+    run on its own connection instead; prefer it for unordered queries
+    and for tables being written to.
+
+    Connections are taken from pool (a FourDPool) or opened with
+    connect_kwargs. executor is 'thread' or 'process'; process workers
+    open their own connections and yield plain tuples. Pages are merged
+    in partition order when ordered is set, else as they arrive; up to
+    queue_size decoded pages are buffered per partition.
+    """
+    if ranges is not None:
+        tasks = [(sql, range_params, 0, 1) for range_params in ranges]
+    else:
+        if partitions>1 and not ORDER_BY_PATTERN.search(sql):
+            raise ProgrammingError("Partitioning by row index needs a query with ORDER BY: "
+                "its executions may return rows in different orders; use ranges instead")
+        tasks = [(sql, params, partition, partitions) for partition in range(partitions)]
+    if executor == 'process':
+        if pool is not None:
+            raise ProgrammingError("Pooled connections cannot be used from worker processes")
+        context = multiprocessing.get_context()
+        make_queue, stop = context.Queue, context.Event()
+    elif executor == 'thread':
+        make_queue, stop = queue.Queue, threading.Event()
+        if pool is not None:
+            open_connection, close_connection = pool.getconn, pool.putconn
+        else:
+            open_connection = lambda: connect(**connect_kwargs)
+            close_connection = lambda connection: connection.close()
+    else:
+        raise ProgrammingError("executor must be 'thread' or 'process'")
+    if ordered:
+        queues = [make_queue(queue_size) for task in tasks]
+    else:
+        queues = [make_queue(queue_size*len(tasks))]
+    workers = []
+    try:
+        for index, task in enumerate(tasks):
+            pages = queues[index if ordered else 0]
+            if executor == 'process':
+                worker = context.Process(target=_process_partition, daemon=True,
+                    args=(index, task, page_size, connect_kwargs, pages, stop))
+            else:
+                worker = threading.Thread(target=_run_partition, daemon=True,
+                    args=(index, task, page_size, open_connection, close_connection,
+                        pages, stop, False))
+            worker.start()
+            workers.append(worker)
+        for page in _merge(queues, workers, ordered):
+            yield page
+    finally:
+        _shutdown(workers, queues, stop)
+
+
+def parallel_fetch(sql, partitions=4, **kwargs):
+    """Run a query over several connections and iterate over its rows.
+
+    Takes the arguments of parallel_pages.
+    """
+    return chain.from_iterable(parallel_pages(sql, partitions, **kwargs))
@@ -0,0 +1,246 @@
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
+from .fourd import connect
+from .exceptions import *
+
+
+class FourDPool:
+    """Thread-safe pool of FourD_connection objects.
+
+    The pool opens minconn connections up front, logging them in in
+    parallel (see warm), and never holds more than
+    maxconn. Connections are health checked on checkout, recycled once
+    older than max_lifetime or idle longer than idle_timeout (while the
+    pool is above minconn), and reset on return: open cursors are closed
+    and a pending transaction is rolled back. Remaining keyword arguments
+    are passed to fourd.connect.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=30, idle_timeout=600,
+            max_lifetime=3600, health_check=None, **connect_kwargs):
+        if maxconn < max(minconn, 1):
+            raise ProgrammingError("maxconn must be at least minconn and 1")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check = health_check
+        self.connect_kwargs = connect_kwargs
+        self._lock = threading.Condition()
+        self._idle = deque()
+        self._in_use = {}
+        self._opening = 0
+        self._closed = False
+        self.checkouts = 0
+        self.created = 0
+        self.recycled = 0
+        self.failed_checks = 0
+        self.timeouts = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        try:
+            self.warm()
+        except Exception:
+            self.closeall()
+            raise
+
+    @property
+    def size(self):
+        return len(self._idle)+len(self._in_use)+self._opening
+
+    def _connect(self):
+        return connect(**self.connect_kwargs)
+
+    def warm(self, count=None):
+        """Open connections in parallel until count (minconn by default) are idle.
+
+        Each connection is opened in its own thread, so warming up N
+        connections costs about one connect and login round trip instead
+        of N. The first connection error is raised once all have returned.
+        """
+        count = self.minconn if count is None else count
+        with self._lock:
+            missing = max(min(count-len(self._idle), self.maxconn-self.size), 0)
+            self._opening += missing
+        results = [None]*missing
+
+        def open_connection(index):
+            try:
+                results[index] = self._connect()
+            except Exception as e:
+                results[index] = e
+        threads = [threading.Thread(target=open_connection, args=(index,), daemon=True)
+            for index in range(missing)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        errors = [result for result in results if isinstance(result, Exception)]
+        now = monotonic()
+        with self._lock:
+            self._opening -= missing
+            for connection in results:
+                if not isinstance(connection, Exception):
+                    self.created += 1
+                    self._idle.append((connection, now, now))
+            self._lock.notify_all()
+        if errors:
+            raise errors[0]
+
+    def _expired(self, created_at, released_at, now):
+        if self.max_lifetime and now-created_at > self.max_lifetime:
+            return True
+        if self.idle_timeout and now-released_at > self.idle_timeout:
+            # the connection checked was popped and is not counted in size
+            return self.size >= self.minconn
+        return False
+
+    def _check(self, connection):
+        if not connection.connected or not connection.fourdconn.is_alive():
+            return False
+        if self.health_check is not None:
+            try:
+                return self.health_check(connection)
+            except Exception:
+                return False
+        return True
+
+    def _discard(self, connection):
+        try:
+            if connection.connected:
+                connection.fourdconn.close()
+        except Exception:
+            pass
+        connection.connected = False
+
+    def getconn(self, timeout=None):
+        """Check a connection out of the pool, waiting up to timeout seconds"""
+        timeout = self.timeout if timeout is None else timeout
+        started = monotonic()
+        deadline = started+timeout
+        while True:
+            connection = None
+            discarded = []
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise InterfaceError("Connection pool closed")
+                    now = monotonic()
+                    while self._idle:
+                        connection, created_at, released_at = self._idle.pop()
+                        if not self._expired(created_at, released_at, now):
+                            break
+                        discarded.append(connection)
+                        connection = None
+                    if connection is not None or self.size<self.maxconn:
+                        break
+                    if now>=deadline:
+                        self.timeouts += 1
+                        raise OperationalError("Timed out waiting for a pooled connection")
+                    self._lock.wait(deadline-now)
+                if connection is None:
+                    self._opening += 1
+                else:
+                    self._in_use[id(connection)] = created_at
+                self.recycled += len(discarded)
+            for expired in discarded:
+                self._discard(expired)
+            if connection is None:
+                try:
+                    connection = self._connect()
+                finally:
+                    with self._lock:
+                        self._opening -= 1
+                        if connection is None:
+                            self._lock.notify()
+                        else:
+                            self.created += 1
+                            self._in_use[id(connection)] = monotonic()
+            elif not self._check(connection):
+                with self._lock:
+                    self._in_use.pop(id(connection), None)
+                    self.failed_checks += 1
+                    self._lock.notify()
+                self._discard(connection)
+                continue
+            waited = monotonic()-started
+            with self._lock:
+                self.checkouts += 1
+                self.wait_time += waited
+                self.max_wait_time = max(self.max_wait_time, waited)
+            return connection
+
+    def _reset(self, connection):
+        for cursor in connection.cursors:
+            if cursor is not connection.manager_cursor:
+                cursor.close()
+        connection.cursors = [connection.manager_cursor]
+        if connection.in_transaction:
+            connection.rollback()
+
+    def putconn(self, connection, close=False):
+        """Return a connection to the pool, closing it when close is set"""
+        if not close and connection.connected:
+            try:
+                self._reset(connection)
+            except Exception:
+                close = True
+        with self._lock:
+            created_at = self._in_use.pop(id(connection), None)
+            if created_at is None:
+                raise ProgrammingError("Connection does not belong to this pool")
+            now = monotonic()
+            if (close or self._closed or not connection.connected
+                    or self.max_lifetime and now-created_at > self.max_lifetime):
+                self.recycled += 1
+                connection_to_close = connection
+            else:
+                self._idle.append((connection, created_at, now))
+                connection_to_close = None
+            self._lock.notify()
+        if connection_to_close is not None:
+            self._discard(connection_to_close)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        connection = self.getconn(timeout)
+        try:
+            yield connection
+        except Exception:
+            self.putconn(connection, close=not connection.connected)
+            raise
+        else:
+            if connection.in_transaction:
+                connection.commit()
+            self.putconn(connection)
+
+    def closeall(self):
+        """Close the idle connections; the checked out ones close on return"""
+        with self._lock:
+            self._closed = True
+            idle = [connection for connection, _, _ in self._idle]
+            self._idle.clear()
+            self._lock.notify_all()
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._lock:
+            in_use = len(self._in_use)
+            return dict(size=self.size, idle=len(self._idle), in_use=in_use,
+                minconn=self.minconn, maxconn=self.maxconn,
+                utilization=in_use/self.maxconn,
+                checkouts=self.checkouts, created=self.created,
+                recycled=self.recycled, failed_checks=self.failed_checks,
+                timeouts=self.timeouts, wait_time=self.wait_time,
+                max_wait_time=self.max_wait_time,
+                avg_wait_time=self.wait_time/self.checkouts if self.checkouts else 0.0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_val, tb):
+        self.closeall()
@@ -0,0 +1,205 @@
+import logging
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from time import perf_counter
+
+log = logging.getLogger('fourd')
+
+
+class FourDTraceEvent:
+    """One traced operation of a FourD connection.
+
+    kind is 'prepare', 'execute', 'fetch' (one page of rows) or 'close'.
+    elapsed is split into network_time, spent waiting on the socket, and
+    decode_time, the rest.
+    """
+    __slots__ = ('kind', 'statement', 'statement_id', 'started', 'elapsed',
+        'network_time', 'decode_time', 'bytes_received', 'bytes_sent', 'rows', 'error')
+
+    def __init__(self, kind, statement=None):
+        self.kind = kind
+        self.statement = statement
+        self.statement_id = None
+        self.started = None
+        self.elapsed = 0.0
+        self.network_time = 0.0
+        self.decode_time = 0.0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.rows = 0
+        self.error = None
+
+    def __repr__(self):
+        return '<FourDTraceEvent {} {:.6f}s rows={} statement_id={}>'.format(
+            self.kind, self.elapsed, self.rows, self.statement_id)
+
+
+class FourDTrace:
+    """Context manager measuring one operation for the connection tracer"""
+
+    def __init__(self, connection, kind, statement=None, response=None):
+        self.connection = connection
+        self.event = FourDTraceEvent(kind, statement)
+        self.response = response
+
+    def set_response(self, response):
+        self.response = response
+        self._rows = 0
+
+    def _counters(self):
+        connection = self.connection
+        reader = connection.reader
+        return (reader.wait_time+connection.send_time, reader.bytes_received,
+            connection.bytes_sent)
+
+    def __enter__(self):
+        self._rows = self.response.row_count_received if self.response is not None else 0
+        self._before = self._counters()
+        self.event.started = perf_counter()
+        self.connection.tracer.before(self.event)
+        return self
+
+    def __exit__(self, ex_type, ex_val, tb):
+        event = self.event
+        event.elapsed = perf_counter()-event.started
+        wait_time, bytes_received, bytes_sent = self._counters()
+        event.network_time = wait_time-self._before[0]
+        event.decode_time = max(event.elapsed-event.network_time, 0.0)
+        event.bytes_received = bytes_received-self._before[1]
+        event.bytes_sent = bytes_sent-self._before[2]
+        response = self.response
+        if response is not None:
+            event.statement_id = response.statement_id or None
+            event.rows = (response.row_count_received or 0)-self._rows
+            if event.statement is None:
+                event.statement = getattr(response.command, 'statement', None)
+        event.error = ex_val
+        self.connection.tracer.after(event)
+        return False
+
+
+class FourDNoTrace:
+    """Stand-in for FourDTrace while the connection has no tracer"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ex_type, ex_val, tb):
+        return False
+
+    def set_response(self, response):
+        pass
+
+NO_TRACE = FourDNoTrace()
+
+
+class FourDTracer:
+    """Base class of connection tracers.
+
+    before is called with a FourDTraceEvent when an operation starts and
+    after once it has completed, its timings, counters and error set.
+    """
+
+    def before(self, event):
+        pass
+
+    def after(self, event):
+        pass
+
+
+class FourDCallbackTracer(FourDTracer):
+    """Tracer calling the before and/or after functions given"""
+
+    def __init__(self, before=None, after=None):
+        if before is not None:
+            self.before = before
+        if after is not None:
+            self.after = after
+
+
+def latency_buckets(first=0.0001, factor=2, count=20):
+    """Upper bounds in seconds of exponentially growing histogram buckets"""
+    return tuple(first*factor**i for i in range(count))
+
+
+class FourDHistogramTracer(FourDTracer):
+    """Tracer recording latency histograms for slow query analysis.
+
+    Elapsed times are counted per event kind in buckets (upper bounds in
+    seconds, latency_buckets() by default) and aggregated per statement.
+    Events slower than slow_query_time are logged on the 'fourd' logger
+    and the slowest keep_slowest of them kept. One instance can be
+    shared by the connections of a pool.
+    """
+
+    def __init__(self, buckets=None, slow_query_time=None, keep_slowest=20):
+        self.buckets = tuple(buckets or latency_buckets())
+        self.slow_query_time = slow_query_time
+        self.keep_slowest = keep_slowest
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = defaultdict(lambda: [0]*(len(self.buckets)+1))
+            self.totals = defaultdict(lambda: dict(count=0, elapsed=0.0,
+                network_time=0.0, decode_time=0.0, bytes_received=0, rows=0, errors=0))
+            self.statements = defaultdict(lambda: dict(count=0, elapsed=0.0, max=0.0, rows=0))
+            self.slowest = []
+
+    def after(self, event):
+        with self._lock:
+            self.histograms[event.kind][bisect_left(self.buckets, event.elapsed)] += 1
+            totals = self.totals[event.kind]
+            totals['count'] += 1
+            totals['elapsed'] += event.elapsed
+            totals['network_time'] += event.network_time
+            totals['decode_time'] += event.decode_time
+            totals['bytes_received'] += event.bytes_received
+            totals['rows'] += event.rows
+            totals['errors'] += event.error is not None
+            if event.statement is not None:
+                statement = self.statements[event.statement]
+                statement['count'] += 1
+                statement['elapsed'] += event.elapsed
+                statement['max'] = max(statement['max'], event.elapsed)
+                statement['rows'] += event.rows
+            slow = self.slow_query_time is not None and event.elapsed>=self.slow_query_time
+            if slow and self.keep_slowest:
+                self.slowest.append(event)
+                self.slowest.sort(key=lambda event: -event.elapsed)
+                del self.slowest[self.keep_slowest:]
+        if slow:
+            log.warning("Slow %s (%.3fs, network %.3fs, %d rows): %s", event.kind,
+                event.elapsed, event.network_time, event.rows, event.statement)
+
+    def histogram(self, kind):
+        """(upper bound, count) pairs of the kind; the last bound is None"""
+        with self._lock:
+            counts = list(self.histograms[kind])
+        return list(zip(self.buckets+(None,), counts))
+
+    def percentile(self, kind, percent):
+        """Upper bound of the bucket holding the given percentile, None if above them all"""
+        histogram = self.histogram(kind)
+        total = sum(count for bound, count in histogram)
+        if not total:
+            return None
+        seen = 0
+        for bound, count in histogram:
+            seen += count
+            if seen*100>=total*percent:
+                return bound
+
+    def top_statements(self, count=10, key='elapsed'):
+        """The count statements with the largest key, as (statement, stats) pairs"""
+        with self._lock:
+            statements = [(statement, dict(stats)) for statement, stats in self.statements.items()]
+        statements.sort(key=lambda item: -item[1][key])
+        return statements[:count]
+
+    def stats(self):
+        with self._lock:
+            return dict((kind, dict(totals)) for kind, totals in self.totals.items())
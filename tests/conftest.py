@@ -0,0 +1,147 @@
+import socket
+import pytest
+import fourd
+from fourd.lib import FourD, FourDWireReader, STRUCT_VK_BOOLEAN, STRUCT_VK_LONG, \
+    STRUCT_VK_LONG8, STRUCT_VK_REAL
+from fourd.mockserver import FourDMockServer, FourDMockResultSet
+
+COLUMNS = [('id', 'VK_LONG8'), ('name', 'VK_STRING'), ('amount', 'VK_REAL'),
+    ('created', 'VK_TIMESTAMP'), ('active', 'VK_BOOLEAN'), ('data', 'VK_BLOB')]
+ROW_COUNT = 537
+
+
+class Wire:
+    """FourD connection over a socket pair, answered with canned responses.
+
+    Responses must be written with respond() before the driver reads
+    them. What the driver sends stays in the socket buffer until
+    commands() reads it, so keep the exchanges small.
+    """
+
+    def __init__(self, **kwargs):
+        client, self.server = socket.socketpair()
+        self.fourdconn = FourD(**kwargs)
+        self.fourdconn.socket = client
+        self.fourdconn.reader = FourDWireReader(client)
+        self.fourdconn.connected = True
+        self.server.setblocking(False)
+        self.received = bytearray()
+
+    def respond(self, *responses):
+        self.server.setblocking(True)
+        self.server.sendall(b''.join(responses))
+        self.server.setblocking(False)
+
+    def commands(self):
+        """Names of the commands received so far"""
+        try:
+            data = self.server.recv(65536)
+            while data:
+                self.received += data
+                data = self.server.recv(65536)
+        except BlockingIOError:
+            pass
+        return [line.split()[1].decode() for line in bytes(self.received).split(b'\r\n')
+            if line[:1].isdigit() and len(line.split()) == 2]
+
+    def close(self):
+        self.fourdconn.socket.close()
+        self.server.close()
+
+
+def ok(*lines):
+    return ('\r\n'.join(['0 OK']+list(lines))+'\r\n\r\n').encode()
+
+
+def ko(description='Mock error'):
+    return ok().replace(b'OK\r\n', ('KO\r\nError-Code:1\r\nError-Component-Code:0\r\n'
+        'Error-Description:%s\r\n'%description).encode())
+
+
+def update_count(count=1, statement_id=0):
+    return ok('Statement-ID:%d'%statement_id, 'Result-Type:Update-Count')+STRUCT_VK_LONG8.pack(count)
+
+
+def encode_value(dtype, value):
+    if value is None:
+        return b'0'
+    if dtype == 'VK_BOOLEAN':
+        return b'1'+STRUCT_VK_BOOLEAN.pack(value)
+    if dtype == 'VK_LONG8':
+        return b'1'+STRUCT_VK_LONG8.pack(value)
+    if dtype == 'VK_REAL':
+        return b'1'+STRUCT_VK_REAL.pack(value)
+    if dtype in ('VK_STRING', 'VK_TEXT'):
+        encoded_value = value.encode('UTF-16LE')
+        return b'1'+STRUCT_VK_LONG.pack(-(len(encoded_value)//2))+encoded_value
+    return b'1'+STRUCT_VK_LONG.pack(len(value))+value
+
+
+def result_set(columns, rows, row_count=None, statement_id=0, updatable=False):
+    """Response to EXECUTE-STATEMENT sending rows as the first page"""
+    headers = ok('Statement-ID:%d'%statement_id, 'Result-Type:Result-Set',
+        'Column-Count:%d'%len(columns),
+        'Column-Aliases:'+' '.join('[%s]'%name for name, dtype in columns),
+        'Column-Types:'+' '.join(dtype for name, dtype in columns),
+        'Column-Updateability:'+' '.join('Y' if updatable else 'N' for column in columns),
+        'Row-Count:%d'%(len(rows) if row_count is None else row_count),
+        'Row-Count-Sent:%d'%len(rows))
+    return headers+page(columns, rows, updatable)
+
+
+def page(columns, rows, updatable=False, first_row_id=0):
+    """Rows of a result set, as sent after the headers"""
+    data = bytearray()
+    for row_id, row in enumerate(rows, first_row_id):
+        if updatable:
+            data += b'1'+STRUCT_VK_LONG.pack(row_id)
+        for (name, dtype), value in zip(columns, row):
+            data += encode_value(dtype, value)
+    return bytes(data)
+
+
+@pytest.fixture
+def wire():
+    wire = Wire()
+    yield wire
+    wire.close()
+
+
+@pytest.fixture
+def mock_result_set():
+    return FourDMockResultSet(COLUMNS, row_count=ROW_COUNT, width=7, null_every=5)
+
+
+@pytest.fixture
+def expected(mock_result_set):
+    return [mock_result_set.row(i%mock_result_set.distinct_rows)
+        for i in range(mock_result_set.row_count)]
+
+
+@pytest.fixture
+def server(mock_result_set):
+    with FourDMockServer(mock_result_set, errors={'BAD'}) as server:
+        yield server
+
+
+@pytest.fixture
+def connect(server):
+    """Open connections to the mock server, closed at the end of the test"""
+    connections = []
+
+    def connect(**kwargs):
+        connection = fourd.connect(**server.connect_kwargs(), **kwargs)
+        connections.append(connection)
+        return connection
+    yield connect
+    for connection in connections:
+        if connection.connected:
+            try:
+                connection.close()
+            except (OSError, fourd.Error):
+                # dropped by the test
+                pass
+
+
+def rows_of(rows):
+    return [tuple(row) for row in rows]
@@ -0,0 +1,203 @@
+import asyncio
+import gc
+import pytest
+import fourd
+from fourd import aio
+from conftest import ko, ok, page, result_set, rows_of, update_count
+
+COLUMNS = [('id', 'VK_LONG8'), ('name', 'VK_STRING')]
+ROWS = [(i, 'n%d'%i) for i in range(5)]
+
+
+def run(coroutine):
+    return asyncio.run(asyncio.wait_for(coroutine, 10))
+
+
+async def canned_connection(*responses):
+    """Connect to a server writing the given responses after the login"""
+    async def handle(reader, writer):
+        writer.write(ok()+b''.join(responses))
+        while await reader.read(65536):
+            pass
+        writer.close()
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    connection = await aio.connect(host='127.0.0.1', port=server.sockets[0].getsockname()[1],
+        user='user', password='password', res_size=1)
+    return server, connection
+
+
+def test_buffer_reader():
+    reader = aio.FourDBufferReader(chunk_size=4)
+    reader.feed(b'0 OK\r\n')
+    assert not reader.has_header()
+    with pytest.raises(aio.FourDIncompleteRead):
+        reader.read_until(b'\r\n\r\n')
+    reader.feed(b'\r\nabcdef')
+    assert reader.has_header()
+    assert reader.read_until(b'\r\n\r\n') == b'0 OK\r\n\r\n'
+    assert reader.read(6) == b'abcdef'
+
+
+def test_execute_and_fetch():
+    async def main():
+        server, connection = await canned_connection(update_count(0),
+            result_set(COLUMNS, ROWS[:1], row_count=5),
+            ok()+page(COLUMNS, ROWS[1:3]), ok()+page(COLUMNS, ROWS[3:]),
+            update_count(4), ko(), update_count(0))
+        cursor = connection.cursor()
+        await cursor.execute("SELECT * FROM t")
+        assert connection.in_transaction
+        assert cursor.rowcount == 5
+        assert await cursor.fetchone() == ROWS[0]
+        assert await cursor.fetchall() == ROWS[1:]
+        await cursor.execute("UPDATE t SET id = 0")
+        assert cursor.result.update_count == 4
+        with pytest.raises(aio.ProgrammingError):
+            await cursor.execute("UPDATE t SET id = 'x'")
+        await connection.commit()
+        assert not connection.in_transaction
+        server.close()
+    run(main())
+
+
+def test_mock_server(server, expected):
+    async def main():
+        connection = await aio.connect(**server.connect_kwargs(), res_size=50)
+        cursor = connection.cursor()
+        await cursor.execute("SELECT * FROM t WHERE id = %s", (1,))
+        rows = [await cursor.fetchone()]+await cursor.fetchmany(10)
+        async for row in cursor:
+            rows.append(row)
+        assert rows_of(rows) == expected
+        await cursor.executemany("INSERT INTO t VALUES (%s)", [(1,), (2,)])
+        assert cursor.rowcount == 2
+        await connection.commit()
+        await connection.close()
+    run(main())
+
+
+def test_fetch_columns(server, expected):
+    async def main():
+        connection = await aio.connect(**server.connect_kwargs(), res_size=40)
+        cursor = connection.cursor()
+        await cursor.execute("SELECT * FROM t")
+        await cursor.fetchmany(5)
+        columns = await cursor.fetch_columns()
+        assert list(zip(*columns.values())) == expected[5:]
+        await cursor.execute("UPDATE t SET a = 1")
+        assert await cursor.fetch_columns() == {}
+        await connection.close()
+    run(main())
+
+
+def test_blocking_methods_refused(server, tmp_path):
+    async def main():
+        connection = await aio.connect(**server.connect_kwargs(), res_size=40)
+        cursor = connection.cursor()
+        await cursor.execute("SELECT * FROM t")
+        with pytest.raises(fourd.NotSupportedError):
+            cursor.export(tmp_path/'rows.csv')
+        with pytest.raises(fourd.NotSupportedError):
+            next(cursor)
+        # the stream is still in sync
+        assert len(await cursor.fetchall()) == 537
+        await connection.close()
+    run(main())
+
+
+def test_failed_start_transaction(server):
+    async def main():
+        connection = await aio.connect(**server.connect_kwargs())
+        cursor = connection.cursor()
+        server.errors.add("START TRANSACTION;")
+        with pytest.raises(fourd.ProgrammingError):
+            await cursor.execute("UPDATE t SET a = 1")
+        # only START TRANSACTION reached the server
+        assert server.commands['EXECUTE-STATEMENT'] == 1
+        assert not connection.in_transaction
+        server.errors.discard("START TRANSACTION;")
+        await cursor.execute("UPDATE t SET a = 1")
+        assert connection.in_transaction
+        await connection.commit()
+        await connection.close()
+    run(main())
+
+
+def test_pool(server):
+    async def main():
+        async with aio.AsyncFourDPool(minconn=1, maxconn=2, **server.connect_kwargs()) as pool:
+            async def work():
+                async with pool.connection() as connection:
+                    cursor = connection.cursor()
+                    await cursor.execute("SELECT * FROM t")
+                    return len(await cursor.fetchall())
+            assert await asyncio.gather(*[work() for i in range(5)]) == [537]*5
+            assert pool.stats()['size'] <= 2
+    run(main())
+
+
+@pytest.mark.parametrize('fetch', [False, True])
+def test_cancelled_command_aborts_the_connection(server, fetch):
+    async def main():
+        connection = await aio.connect(**server.connect_kwargs(), res_size=10)
+        cursor = connection.cursor()
+        if fetch:
+            await cursor.execute("SELECT * FROM t")
+        server.latency = 0.2
+        with pytest.raises(asyncio.TimeoutError):
+            if fetch:
+                await asyncio.wait_for(cursor.fetchall(), 0.05)
+            else:
+                await asyncio.wait_for(cursor.execute("SELECT * FROM t"), 0.05)
+        server.latency = 0
+        # the unread response would be taken for the next one
+        assert not connection.fourdconn.is_alive()
+        with pytest.raises(fourd.OperationalError):
+            await cursor.execute("SELECT * FROM t")
+        await connection.close()
+    run(main())
+
+
+def test_pool_drops_aborted_connections(server):
+    async def main():
+        async with aio.AsyncFourDPool(minconn=1, maxconn=1, **server.connect_kwargs()) as pool:
+            server.latency = 0.2
+            with pytest.raises(asyncio.TimeoutError):
+                async with pool.connection() as connection:
+                    aborted = connection
+                    await asyncio.wait_for(connection.cursor().execute("SELECT * FROM t"), 0.05)
+            server.latency = 0
+            assert pool.stats()['size'] == 0
+            async with pool.connection() as connection:
+                assert connection is not aborted
+                cursor = connection.cursor()
+                await cursor.execute("SELECT * FROM t")
+                assert len(await cursor.fetchall()) == 537
+    run(main())
+
+
+def test_blocking_connection_methods_refused(server):
+    async def main():
+        connection = await aio.connect(**server.connect_kwargs())
+        fourdconn = connection.fourdconn
+        for call in (lambda: fourdconn.prepare_statement("SELECT 1"),
+                lambda: fourdconn.close_statement(1),
+                lambda: fourdconn.execute_statements([("SELECT 1", None)])):
+            with pytest.raises(fourd.NotSupportedError):
+                call()
+        await connection.close()
+    run(main())
+
+
+def test_pool_release_closes_cursors(server):
+    async def main():
+        async with aio.AsyncFourDPool(minconn=1, maxconn=1, **server.connect_kwargs()) as pool:
+            async with pool.connection() as connection:
+                cursor = connection.cursor()
+                await cursor.execute("SELECT * FROM t")
+                await cursor.fetchone()
+            assert cursor._closed
+            del cursor
+            gc.collect()
+            assert connection.fourdconn.statement_stats()['leaked'] == 0
+    run(main())
@@ -0,0 +1,84 @@
+import struct
+from datetime import datetime, time
+import pytest
+import fourd
+from fourd.lib import bind_parameters, bind_parameter_columns
+
+
+class Flag(int):
+    pass
+
+
+class Scalar:
+    """Stand-in for a NumPy scalar"""
+    dtype = 'int64'
+
+    def __init__(self, value):
+        self.value = value
+
+    def item(self):
+        return self.value
+
+
+def test_values_are_packed_with_their_status():
+    buffer = bytearray()
+    types = bind_parameters([True, 7, 1.5, None, b'ab'], buffer)
+    assert types == ['VK_BOOLEAN', 'VK_LONG8', 'VK_REAL', 'VK_UNKNOW', 'VK_BLOB']
+    assert bytes(buffer) == (b'1'+struct.pack('<H', 1)+b'1'+struct.pack('<q', 7)
+        +b'1'+struct.pack('<d', 1.5)+b'0'+b'1'+struct.pack('<l', 2)+b'ab')
+
+
+def test_strings_use_utf16_code_units():
+    buffer = bytearray()
+    bind_parameters(['a\U0001F600'], buffer)
+    # a surrogate pair counts as two code units
+    assert bytes(buffer[:5]) == b'1'+struct.pack('<l', -3)
+    assert bytes(buffer[5:]).decode('UTF-16LE') == 'a\U0001F600'
+
+
+def test_timestamps_and_durations():
+    buffer = bytearray()
+    types = bind_parameters([datetime(2020, 1, 2, 0, 0, 1, 5000), time(1, 0, 0, 2000)], buffer)
+    assert types == ['VK_TIMESTAMP', 'VK_DURATION']
+    assert bytes(buffer) == (b'1'+struct.pack('<HBBL', 2020, 1, 2, 1005)
+        +b'1'+struct.pack('<Q', 3600002))
+
+
+def test_subclasses_and_scalars():
+    buffer = bytearray()
+    assert bind_parameters([Flag(3), Scalar(4)], buffer) == ['VK_LONG8', 'VK_LONG8']
+    assert bytes(buffer) == b'1'+struct.pack('<q', 3)+b'1'+struct.pack('<q', 4)
+
+
+def test_item_scalars_bound_per_value():
+    # NaT scalars give None, others a datetime
+    values = [Scalar(None), Scalar(datetime(2020, 1, 2)), Scalar(None)]
+    assert bind_parameters(values, bytearray()) == ['VK_UNKNOW', 'VK_TIMESTAMP', 'VK_UNKNOW']
+    assert [params.parameter_types for params in bind_parameter_columns([values])] == \
+        ['VK_UNKNOW', 'VK_TIMESTAMP', 'VK_UNKNOW']
+
+
+def test_unsupported_type():
+    with pytest.raises(fourd.NotSupportedError):
+        bind_parameters([object()], bytearray())
+
+
+def test_columns():
+    rows = bind_parameter_columns([[1, None, 3], ['a', 'b', None]])
+    assert [params.parameter_types for params in rows] == ['VK_LONG8 VK_STRING',
+        'VK_UNKNOW VK_STRING', 'VK_LONG8 VK_UNKNOW']
+    buffer = bytearray()
+    bind_parameters([1, 'a'], buffer)
+    assert bytes(rows[0].binary_data) == bytes(buffer)
+    with pytest.raises(fourd.ProgrammingError):
+        bind_parameter_columns([[1, 2], ['x']])
+
+
+def test_executemany_columns(connect, server):
+    cursor = connect().cursor()
+    cursor.executemany("INSERT INTO t VALUES (%(id)s, %(name)s)",
+        columns={'id': list(range(30)), 'name': ['x']*30})
+    assert cursor.rowcount == 30
+    with pytest.raises(fourd.ProgrammingError) as info:
+        cursor.executemany("INSERT INTO t VALUES (%s, %s)", columns=[[1, 2, 3], ['x', 'BAD', 'y']])
+    assert info.value.row_index == 1
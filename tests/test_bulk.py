@@ -0,0 +1,79 @@
+import pytest
+import fourd
+from fourd.bulk import FourDBulkLoader, bulk_load, parallel_load
+
+
+def test_multi_row_statements(connect, server):
+    connection = connect()
+    stats = bulk_load(connection, 'items', ['id', 'name'], [(i, 'n%d'%i) for i in range(1000)],
+        max_rows=256)
+    assert stats.rows == 1000
+    assert stats.commits == 1
+    # 256*3+128+64+32+8
+    assert stats.statements == 7
+    assert not connection.in_transaction
+
+
+def test_single_row_statements(connect):
+    stats = bulk_load(connect(), 'items', ['id'], [(i,) for i in range(50)], multi_row=False)
+    assert stats.statements == 50
+
+
+def test_columns_and_dicts(connect):
+    connection = connect()
+    assert bulk_load(connection, 'items', ['id', 'name'],
+        data={'id': list(range(30)), 'name': ['x']*30}).rows == 30
+    assert bulk_load(connection, 'items', ['id', 'name'],
+        [dict(id=i, name=None) for i in range(20)]).rows == 20
+
+
+def test_csv(connect, tmp_path):
+    path = tmp_path/'in.csv'
+    path.write_text('id,name\n'+''.join('%d,n%d\n'%(i, i) for i in range(100))+'100,\n')
+    loader = FourDBulkLoader(connect(), 'items', None)
+    assert loader.load_csv(path, types=[int, None]).rows == 101
+    assert loader.columns == ['id', 'name']
+
+
+def test_error_rolls_back_segment(connect, server):
+    connection = connect()
+    rows = [(str(i),) for i in range(100)]
+    rows[73] = ('BAD',)
+    loader = FourDBulkLoader(connection, 't', ['a'], commit_every=20, max_rows=4)
+    with pytest.raises(fourd.ProgrammingError) as info:
+        loader.load(rows, chunk_rows=10)
+    assert info.value.row_index == 70
+    # the segment of rows 60 to 79 was rolled back
+    assert loader.stats.rows == 60
+    assert loader.stats.commits == 3
+    assert not connection.in_transaction
+    assert server.commands['EXECUTE-STATEMENT'] > 0
+
+
+def test_refuses_open_transaction(connect):
+    connection = connect()
+    connection.cursor().execute("UPDATE t SET a = 1")
+    with pytest.raises(fourd.ProgrammingError):
+        bulk_load(connection, 'items', ['id'], [(1,)])
+    assert connection.in_transaction
+    connection.rollback()
+
+
+def test_progress(connect):
+    reports = []
+    bulk_load(connect(), 'items', ['id'], [(i,) for i in range(100)], max_rows=8,
+        progress=reports.append, progress_interval=0)
+    assert reports
+    assert reports[-1].rows == 100
+
+
+def test_parallel_load(server):
+    rows = [(i, 'n%d'%i) for i in range(5000)]
+    stats = parallel_load('items', ['id', 'name'], rows, connections=3, chunk_rows=500,
+        **server.connect_kwargs())
+    assert stats.rows == 5000
+    rows[4321] = (4321, 'BAD')
+    with pytest.raises(fourd.ProgrammingError) as info:
+        parallel_load('items', ['id', 'name'], rows, connections=3, chunk_rows=500,
+            max_rows=1, **server.connect_kwargs())
+    assert info.value.row_index == 4321
@@ -0,0 +1,152 @@
+import time
+import pytest
+import fourd
+from fourd.cache import FourDResultCache, query_tables, written_table
+from fourd.mockserver import FourDMockServer, FourDMockResultSet, parse_columns
+from conftest import rows_of
+
+
+def test_query_tables():
+    assert query_tables("SELECT * FROM a JOIN [B] ON a.x = b.x, c AS d") == {'a', 'b'}
+    assert query_tables("SELECT * FROM a x, b AS y LEFT JOIN c ON 1 ORDER BY 1") == {'a', 'b', 'c'}
+    assert written_table("insert into Items (a) values (?)") == 'items'
+    assert written_table("SELECT * FROM items") is None
+
+
+def test_hit_is_served_without_the_server(connect, server, expected):
+    cache = FourDResultCache()
+    cursor = connect(result_cache=cache).cursor()
+    cursor.execute("SELECT * FROM t WHERE id = %s", (1,))
+    assert rows_of(cursor.fetchall()) == expected
+    executed = server.commands['EXECUTE-STATEMENT']
+    cursor.execute("SELECT * FROM t WHERE id = %s", (1,))
+    assert rows_of(cursor.fetchall()) == expected
+    assert server.commands['EXECUTE-STATEMENT'] == executed
+    cursor.execute("SELECT * FROM t WHERE id = %s", (2,))
+    cursor.fetchall()
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['entries'] == 2
+
+
+def test_fetch_columns_entry(connect, expected):
+    cache = FourDResultCache()
+    cursor = connect(result_cache=cache).cursor()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetch_columns()
+    cursor.execute("SELECT * FROM t")
+    assert isinstance(cursor.result, fourd.fourd.FourDCachedResult)
+    assert rows_of(cursor.fetchall()) == expected
+
+
+def test_partial_reads_are_not_cached(connect):
+    cache = FourDResultCache()
+    cursor = connect(result_cache=cache).cursor()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchmany(3)
+    cursor.fetchall()
+    assert cache.stats()['entries'] == 0
+
+
+def test_write_invalidates_table(connect):
+    cache = FourDResultCache()
+    cursor = connect(result_cache=cache).cursor()
+    for query in ("SELECT * FROM t", "SELECT * FROM other"):
+        cursor.execute(query)
+        cursor.fetchall()
+    cursor.execute("UPDATE t SET a = 1")
+    assert cache.stats()['entries'] == 1
+    cursor.executemany("DELETE FROM other WHERE id = %s", [(1,), (2,)])
+    assert cache.stats()['entries'] == 0
+
+
+def test_ttl(connect):
+    cache = FourDResultCache(ttl=0.05)
+    cursor = connect(result_cache=cache).cursor()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchall()
+    time.sleep(0.1)
+    assert cache.get(next(iter(cache.entries))) is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_max_bytes_evicts(connect):
+    cache = FourDResultCache(max_bytes=200000)
+    cursor = connect(result_cache=cache).cursor()
+    for i in range(5):
+        cursor.execute("SELECT * FROM t WHERE id = %s", (i,))
+        cursor.fetchall()
+    assert cache.bytes <= cache.max_bytes
+    assert cache.stats()['evictions'] > 0
+
+
+
+def test_servers_sharing_a_cache_get_their_own_rows():
+    cache = FourDResultCache()
+    with FourDMockServer(FourDMockResultSet(row_count=3)) as first, \
+            FourDMockServer(FourDMockResultSet(row_count=7)) as second:
+        connections = [fourd.connect(**server.connect_kwargs(), result_cache=cache)
+            for server in (first, second)]
+        try:
+            for connection, row_count in zip(connections*2, (3, 7, 3, 7)):
+                cursor = connection.cursor()
+                cursor.execute("SELECT * FROM t")
+                assert len(cursor.fetchall()) == row_count
+            assert cache.stats()['hits'] == 2
+            # a write only invalidates the entries of its own database
+            connections[1].cursor().execute("DELETE FROM t")
+            assert cache.stats()['entries'] == 1
+        finally:
+            for connection in connections:
+                connection.close()
+
+
+def test_transaction_that_wrote_bypasses_the_cache(connect):
+    cache = FourDResultCache()
+    connection = connect(result_cache=cache)
+    cursor = connection.cursor()
+    cursor.execute("SELECT * FROM other")
+    cursor.fetchall()
+    cursor.execute("UPDATE t SET a = 1")
+    # the rows may hold the uncommitted update
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchall()
+    cursor.execute("SELECT * FROM other")
+    assert not isinstance(cursor.result, fourd.fourd.FourDCachedResult)
+    cursor.fetchall()
+    assert cache.stats()['entries'] == 1
+    connection.commit()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchall()
+    assert cache.stats()['entries'] == 2
+
+
+@pytest.mark.parametrize('end', ['commit', 'rollback'])
+def test_end_of_transaction_invalidates_written_tables(connect, end):
+    cache = FourDResultCache()
+    writer, reader = connect(result_cache=cache), connect(result_cache=cache)
+    writer.cursor().execute("UPDATE t SET a = 1")
+    cursor = reader.cursor()
+    for query in ("SELECT * FROM t", "SELECT * FROM other"):
+        cursor.execute(query)
+        cursor.fetchall()
+    assert cache.stats()['entries'] == 2
+    getattr(writer, end)()
+    assert [key[0] for key in cache.entries] == ["SELECT * FROM other"]
+
+
+def test_spooled_values_are_not_cached(connect, server, expected):
+    cache = FourDResultCache()
+    cursor = connect(result_cache=cache, lob_threshold=1024).cursor()
+    for i in range(2):
+        cursor.execute("SELECT * FROM t")
+        rows = cursor.fetchall()
+        assert [row.data and row.data.getvalue() for row in rows] == [row[5] for row in expected]
+        for row in rows:
+            if row.data is not None:
+                row.data.close()
+    assert cache.stats()['entries'] == 0
+    # other result sets of the connection are
+    server.result_sets["SELECT id FROM t"] = FourDMockResultSet(parse_columns('VK_LONG8'), row_count=3)
+    cursor.execute("SELECT id FROM t")
+    cursor.fetchall()
+    assert cache.stats()['entries'] == 1
@@ -0,0 +1,68 @@
+from collections import namedtuple
+import pytest
+from conftest import ok, page, result_set
+
+COLUMNS = [('id', 'VK_LONG8'), ('name', 'VK_STRING')]
+ROWS = [(i, None if i%3 == 2 else 'n%d'%i) for i in range(5)]
+Column = namedtuple('Column', 'name dtype')
+
+
+def test_column_pages(wire):
+    wire.respond(result_set(COLUMNS, ROWS[:2], row_count=5), ok()+page(COLUMNS, ROWS[2:]))
+    response = wire.fourdconn.execute_statement("SELECT * FROM t", first_page_size=2)
+    pages = list(response.column_pages())
+    # the rows sent with the response, then one page per FETCH-RESULT
+    assert pages == [[[0, 1], ['n0', 'n1']], [[2, 3, 4], [None, 'n3', 'n4']]]
+    assert response.row_number == 5
+    assert wire.commands().count('FETCH-RESULT') == 1
+
+
+def test_numpy_column():
+    numpy = pytest.importorskip('numpy')
+    from fourd.fourd import numpy_column
+    column = numpy_column(numpy, 'VK_LONG8', [1, None, 3])
+    assert column.dtype == numpy.int64
+    assert column.mask.tolist() == [False, True, False]
+    assert column.tolist() == [1, None, 3]
+    column = numpy_column(numpy, 'VK_STRING', ['a', None])
+    assert column.dtype == object
+    assert column.mask.tolist() == [False, True]
+
+
+def test_numpy_columns_filled_by_page():
+    numpy = pytest.importorskip('numpy')
+    from fourd.fourd import FourDNumpyColumns
+    columns = [Column('id', 'VK_LONG8'), Column('name', 'VK_STRING')]
+    arrays = FourDNumpyColumns(numpy, columns, 5)
+    arrays.add_page([[1, None], ['a', 'b']])
+    arrays.add_page([[3], [None]])
+    result = arrays.arrays()
+    assert result['id'].tolist() == [1, None, 3]
+    assert result['name'].tolist() == ['a', 'b', None]
+    assert result['id'].dtype == numpy.int64
+
+
+@pytest.mark.parametrize('options', [{}, {'prefetch': 2}, {'res_size': 13}])
+def test_fetch_columns(connect, expected, options):
+    cursor = connect(**options).cursor()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchmany(10)
+    columns = cursor.fetch_columns()
+    assert list(columns) == ['id', 'name', 'amount', 'created', 'active', 'data']
+    assert list(zip(*columns.values())) == expected[10:]
+    cursor.execute("UPDATE t SET a = 1")
+    assert cursor.fetch_columns() == {}
+
+
+def test_fetchnumpy(connect, expected):
+    numpy = pytest.importorskip('numpy')
+    cursor = connect(res_size=50).cursor()
+    cursor.execute("SELECT * FROM t")
+    arrays = cursor.fetchnumpy()
+    assert arrays['id'].dtype == numpy.int64
+    assert arrays['created'].dtype == numpy.dtype('datetime64[us]')
+    assert arrays['amount'].tolist() == [row[2] for row in expected]
+    assert arrays['name'].mask.tolist() == [row[1] is None for row in expected]
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchmany(10)
+    assert cursor.fetchnumpy()['id'].tolist() == [row[0] for row in expected[10:]]
@@ -0,0 +1,78 @@
+import pytest
+import fourd
+from fourd.exceptions import FourDException
+from conftest import ko, rows_of, update_count
+
+
+def statements(count):
+    return [("UPDATE t SET a = %d" % i, None) for i in range(count)]
+
+
+def test_batches_are_sent_at_once(wire, monkeypatch):
+    sends = []
+    send = wire.fourdconn._socket_send
+    monkeypatch.setattr(wire.fourdconn, '_socket_send', lambda data: sends.append(send(data)))
+    wire.respond(*[update_count(i) for i in range(5)])
+    responses = list(wire.fourdconn.execute_statements(statements(5), batch_size=2))
+    assert [response.update_count for response in responses] == list(range(5))
+    assert len(sends) == 3
+    assert wire.commands().count('EXECUTE-STATEMENT') == 5
+
+
+def test_errors_are_yielded_in_order(wire):
+    wire.respond(update_count(), ko('Row failed'), update_count(2))
+    responses = list(wire.fourdconn.execute_statements(statements(3)))
+    assert responses[0].update_count == 1
+    assert isinstance(responses[1], FourDException)
+    assert responses[2].update_count == 2
+
+
+def test_closing_early_drains_the_batch(wire):
+    wire.respond(*[update_count(1) for i in range(3)])
+    responses = wire.fourdconn.execute_statements(statements(3))
+    next(responses)
+    responses.close()
+    # the responses still in flight were read, the next one is in sync
+    wire.respond(update_count(7))
+    assert wire.fourdconn.execute_statement("UPDATE t SET a = 1").update_count == 7
+
+
+def test_executemany_rowcount(connect, server):
+    cursor = connect().cursor()
+    cursor.executemany("INSERT INTO t VALUES (%s, %s)", [(i, 's%d'%i) for i in range(40)])
+    assert cursor.rowcount == 40
+    # START TRANSACTION and one EXECUTE-STATEMENT per row
+    assert server.commands['EXECUTE-STATEMENT'] == 41
+
+
+def test_executemany_error_counts_the_rest_of_the_batch(connect, server):
+    cursor = connect().cursor()
+    with pytest.raises(fourd.ProgrammingError) as info:
+        cursor.executemany("INSERT INTO t VALUES (%s)", [('a',), ('b',), ('BAD',), ('c',)])
+    assert info.value.row_index == 2
+    assert info.value.failed_rows == [2]
+    assert 'row 3 of the same batch still executed' in str(info.value)
+    assert server.commands['EXECUTE-STATEMENT'] == 5
+    assert cursor.rowcount == 3
+
+
+def test_executemany_error_stops_later_batches(connect, server):
+    cursor = connect().cursor()
+    cursor.batchsize = 4
+    with pytest.raises(fourd.ProgrammingError) as info:
+        cursor.executemany("INSERT INTO t VALUES (%s)",
+            [('a',), ('BAD',), ('c',), ('BAD',), ('e',), ('f',)])
+    assert info.value.row_index == 1
+    assert info.value.failed_rows == [1, 3]
+    assert cursor.rowcount == 2
+    # START TRANSACTION and the first batch only
+    assert server.commands['EXECUTE-STATEMENT'] == 5
+
+
+def test_connection_usable_after_executemany_error(connect, expected):
+    cursor = connect(prefetch=2, res_size=20).cursor()
+    with pytest.raises(fourd.ProgrammingError):
+        cursor.executemany("INSERT INTO t VALUES (%s)", [(str(i) if i != 7 else 'BAD',)
+            for i in range(40)])
+    cursor.execute("SELECT * FROM t")
+    assert rows_of(cursor.fetchall()) == expected
@@ -0,0 +1,109 @@
+import base64
+import csv
+import gzip
+import io
+import json
+import pytest
+import fourd
+from fourd.export import WRITERS, FourDCSVWriter
+
+
+def test_csv(connect, expected, tmp_path):
+    cursor = connect(res_size=50).cursor()
+    cursor.execute("SELECT * FROM t")
+    path = tmp_path/'rows.csv'
+    assert cursor.export(path) == len(expected)
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['id', 'name', 'amount', 'created', 'active', 'data']
+    assert len(rows) == len(expected)+1
+    first = expected[0]
+    assert rows[1][0] == str(first[0])
+    assert rows[1][3] == first[3].isoformat()
+    assert rows[1][5] == base64.b64encode(first[5]).decode()
+    # nulls are empty fields
+    assert rows[5] == ['']*6
+
+
+def test_jsonl_gzip(connect, expected, tmp_path):
+    cursor = connect(res_size=50, prefetch=2).cursor()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchmany(7)
+    path = tmp_path/'rows.jsonl.gz'
+    assert cursor.export(path) == len(expected)-7
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f]
+    assert len(rows) == len(expected)-7
+    assert rows[0]['id'] == expected[7][0]
+    assert rows[0]['name'] == expected[7][1]
+
+
+def test_file_object_left_open(connect, expected):
+    cursor = connect().cursor()
+    cursor.execute("SELECT * FROM t")
+    out = io.BytesIO()
+    cursor.export(out, format='csv', header=False, delimiter=';')
+    assert not out.closed
+    assert out.getvalue().decode().count('\n') == len(expected)
+
+
+def test_unknown_format(connect, tmp_path):
+    cursor = connect().cursor()
+    cursor.execute("SELECT * FROM t")
+    with pytest.raises(fourd.ProgrammingError):
+        cursor.export(tmp_path/'rows.txt')
+    cursor.execute("UPDATE t SET a = 1")
+    with pytest.raises(fourd.ProgrammingError):
+        cursor.export(tmp_path/'rows.csv')
+
+
+def test_writer_error_stops_export(connect, tmp_path):
+    cursor = connect(res_size=20).cursor()
+    cursor.execute("SELECT * FROM t")
+
+    class Failing(io.RawIOBase):
+        def writable(self):
+            return True
+
+        def write(self, data):
+            raise OSError("disk full")
+    with pytest.raises(OSError):
+        cursor.export(Failing(), format='csv')
+    cursor.execute("SELECT * FROM t")
+    assert len(cursor.fetchall()) == 537
+
+
+def test_arrow(connect, expected, tmp_path):
+    try:
+        import pyarrow.ipc
+    except ImportError:
+        cursor = connect().cursor()
+        cursor.execute("SELECT * FROM t")
+        with pytest.raises(fourd.NotSupportedError):
+            cursor.export(tmp_path/'rows.arrow')
+        return
+    cursor = connect(res_size=100).cursor()
+    cursor.execute("SELECT * FROM t")
+    path = tmp_path/'rows.arrow'
+    cursor.export(path)
+    table = pyarrow.ipc.open_file(str(path)).read_all()
+    assert table.num_rows == len(expected)
+    assert table.column('id').to_pylist() == [row[0] for row in expected]
+
+
+def test_file_closed_after_writer_error(connect, tmp_path, monkeypatch):
+    writers = []
+
+    class Failing(FourDCSVWriter):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            writers.append(self)
+
+        def write_page(self, page):
+            raise OSError("disk full")
+    monkeypatch.setitem(WRITERS, 'csv', Failing)
+    cursor = connect(res_size=20).cursor()
+    cursor.execute("SELECT * FROM t")
+    with pytest.raises(OSError, match='disk full'):
+        cursor.export(tmp_path/'rows.csv')
+    assert writers[0]._owned.closed
@@ -0,0 +1,40 @@
+import pytest
+from conftest import Wire, result_set, rows_of
+
+COLUMNS = [('id', 'VK_LONG8'), ('name', 'VK_STRING'), ('amount', 'VK_REAL'),
+    ('active', 'VK_BOOLEAN'), ('data', 'VK_BLOB')]
+ROWS = [(1, 'one', 1.5, True, b'\x01'), (2, None, None, False, b''), (3, 'três', -2.0, None, None)]
+
+
+@pytest.mark.parametrize('updatable', [False, True])
+def test_values_decoded_on_access(updatable):
+    wire = Wire(row_format='lazy')
+    try:
+        wire.respond(result_set(COLUMNS, ROWS, updatable=updatable))
+        response = wire.fourdconn.execute_statement("SELECT * FROM t", first_page_size=10)
+        rows = list(response.rows())
+    finally:
+        wire.close()
+    assert rows == ROWS
+    row = rows[2]
+    assert (row[0], row[-1], row[1:3], row.name) == (3, None, ('três', -2.0), 'três')
+    assert len(row) == 5
+    assert row._asdict()['amount'] == -2.0
+    assert hash(row) == hash(ROWS[2])
+    with pytest.raises(IndexError):
+        row[5]
+    with pytest.raises(AttributeError):
+        row.missing
+
+
+@pytest.mark.parametrize('options', [{}, {'prefetch': 2, 'res_size': 20}])
+def test_fetch(connect, expected, options):
+    cursor = connect(row_format='lazy', **options).cursor()
+    cursor.execute("SELECT * FROM t")
+    rows = cursor.fetchmany(30)
+    assert rows_of(rows+cursor.fetchall()) == expected
+    # rows stay valid once their page is consumed
+    assert rows_of(rows) == expected[:30]
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchmany(3)
+    assert list(zip(*cursor.fetch_columns().values())) == expected[3:]
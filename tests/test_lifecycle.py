@@ -0,0 +1,51 @@
+import gc
+from conftest import rows_of
+
+
+def test_close_is_sent_with_the_next_command(connect, server):
+    fourdconn = connect(res_size=10).fourdconn
+    response = fourdconn.execute_statement("SELECT * FROM t", first_page_size=10)
+    response.close()
+    assert fourdconn.statement_stats()['pending'] == 1
+    sends = fourdconn.send_calls
+    fourdconn.execute_statement("UPDATE t SET a = 1")
+    assert fourdconn.send_calls == sends+1
+    assert server.commands['CLOSE-STATEMENT'] == 1
+    assert fourdconn.statement_stats()['pending'] == 1
+
+
+def test_cursor_close_and_reexecute(connect, expected):
+    connection = connect(res_size=10, prefetch=2)
+    cursor = connection.cursor()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchmany(25)
+    cursor.close()
+    cursor = connection.cursor()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchmany(5)
+    cursor.execute("SELECT * FROM t")
+    assert rows_of(cursor.fetchall()) == expected
+    stats = connection.fourdconn.statement_stats()
+    assert stats['leaked'] == 0
+    # prepared statements are released right away too
+    assert stats['open'] == 0
+
+
+def test_released_once_fully_received(connect):
+    fourdconn = connect(res_size=600).fourdconn
+    response = fourdconn.execute_statement("SELECT * FROM t", first_page_size=600)
+    # every row came with the response
+    assert fourdconn.statement_stats()['pending'] == 1
+    assert len(list(response.rows())) == 537
+    response.close()
+    assert fourdconn.statement_stats()['pending'] == 1
+
+
+def test_dropped_response_is_a_leak(connect):
+    fourdconn = connect(res_size=10).fourdconn
+    response = fourdconn.execute_statement("SELECT * FROM t", first_page_size=10)
+    del response
+    gc.collect()
+    stats = fourdconn.statement_stats()
+    assert stats['leaked'] == 1
+    assert stats['pending'] == 1
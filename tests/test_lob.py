@@ -0,0 +1,98 @@
+import pytest
+from fourd.lib import FourDLobSpool
+from conftest import Wire, result_set
+
+COLUMNS = [('id', 'VK_LONG8'), ('data', 'VK_BLOB')]
+SMALL = b'small'
+LARGE = bytes(range(256))*40
+# just above the threshold, so that the responses stay small
+SPILLED = bytes(range(256))*5
+
+
+@pytest.fixture
+def wire():
+    wire = Wire(lob_threshold=1024)
+    yield wire
+    wire.close()
+
+
+def fetch_lobs(wire):
+    wire.respond(result_set(COLUMNS, [(1, SMALL), (2, LARGE), (3, None)]))
+    response = wire.fourdconn.execute_statement("SELECT * FROM t", first_page_size=10)
+    return [row.data for row in response.rows()]
+
+
+def test_values_are_spooled(wire):
+    small, large, null = fetch_lobs(wire)
+    assert null is None
+    assert len(small) == len(SMALL) and small.getvalue() == SMALL
+    assert not small.spilled
+    assert large.spilled
+    assert b''.join(large.chunks(1000)) == LARGE
+    large.seek(10)
+    assert large.read(5) == LARGE[10:15]
+    assert large.tell() == 15
+    buffer = bytearray(3)
+    assert large.readinto(buffer) == 3 and buffer == LARGE[15:18]
+
+
+def fetch_spilled(wire, count):
+    rows = [(i, SPILLED[i:]) for i in range(count)]
+    wire.respond(result_set(COLUMNS, rows))
+    response = wire.fourdconn.execute_statement("SELECT * FROM t", first_page_size=count)
+    return [row.data for row in response.rows()]
+
+
+def test_spilled_values_share_one_file(wire):
+    lobs = fetch_spilled(wire, 30)
+    assert len(set(id(lob.file.spool) for lob in lobs)) == 1
+    # each value reads its own range of the file
+    assert lobs[3].read(4) == SPILLED[3:7]
+    assert lobs[7].getvalue() == SPILLED[7:]
+    assert lobs[3].read() == SPILLED[7:]
+    lobs[3].close()
+    with pytest.raises(ValueError):
+        lobs[3].read()
+    assert [lob.getvalue() for lob in lobs[4:]] == [SPILLED[i:] for i in range(4, 30)]
+
+
+def test_spool_size_limit(wire, monkeypatch):
+    monkeypatch.setattr(FourDLobSpool, 'max_size', 3*len(SPILLED)-100)
+    lobs = fetch_spilled(wire, 10)
+    assert len(set(id(lob.file.spool) for lob in lobs)) == 4
+    assert [lob.getvalue() for lob in lobs] == [SPILLED[i:] for i in range(10)]
+
+
+def test_text():
+    wire = Wire(lob_threshold=4)
+    try:
+        wire.respond(result_set([('t', 'VK_STRING')], [('çà va',)]).replace(b'VK_STRING', b'VK_TEXT'))
+        response = wire.fourdconn.execute_statement("SELECT t FROM t", first_page_size=10)
+        with next(response.rows()).t as lob:
+            assert lob.dtype == 'VK_TEXT'
+            assert lob.text() == 'çà va'
+    finally:
+        wire.close()
+
+
+def test_lob_threshold(connect, expected):
+    cursor = connect(lob_threshold=1024).cursor()
+    cursor.execute("SELECT * FROM t")
+    for row, expected_row in zip(cursor.fetchmany(6), expected):
+        if expected_row[5] is None:
+            assert row.data is None
+        else:
+            assert not row.data.spilled
+            assert row.data.getvalue() == expected_row[5]
+
+
+def test_lob_threshold_zero_spills(connect, expected):
+    cursor = connect(lob_threshold=0).cursor()
+    cursor.execute("SELECT * FROM t")
+    rows = cursor.fetchmany(6)
+    for row, expected_row in zip(rows, expected):
+        if expected_row[5] is None:
+            assert row.data is None
+        else:
+            assert row.data.spilled
+            assert row.data.getvalue() == expected_row[5]
@@ -0,0 +1,51 @@
+import functools
+import pytest
+import fourd
+from fourd.lib import FourDPageSizer
+from fourd.mockserver import FourDMockResultSet, parse_columns
+from conftest import rows_of
+
+OPTIONS = [{}, {'prefetch': 2}, {'res_size': 13}, {'res_size': 13, 'prefetch': 3},
+    {'page_sizer': functools.partial(FourDPageSizer, min_page_size=3)},
+    {'statement_cache_size': 0}]
+
+
+@pytest.mark.parametrize('options', OPTIONS)
+def test_fetchall(connect, expected, options):
+    cursor = connect(**options).cursor()
+    cursor.execute("SELECT * FROM t WHERE id = %s", (1,))
+    assert rows_of(cursor.fetchall()) == expected
+
+
+@pytest.mark.parametrize('options', OPTIONS)
+def test_fetchone_fetchmany_and_iteration(connect, expected, options):
+    cursor = connect(**options).cursor()
+    cursor.execute("SELECT * FROM t")
+    rows = [cursor.fetchone() for i in range(3)]+cursor.fetchmany(200)
+    rows += list(cursor)
+    assert rows_of(rows) == expected
+    assert cursor.fetchone() is None
+
+
+def test_update_count(connect, server):
+    cursor = connect().cursor()
+    cursor.execute("UPDATE t SET a = %(a)s WHERE b = %(b)s", {'a': 1, 'b': 'x'})
+    assert cursor.result.update_count == server.update_count
+
+
+def test_error_keeps_connection_usable(connect, expected):
+    connection = connect()
+    cursor = connection.cursor()
+    with pytest.raises(fourd.ProgrammingError):
+        cursor.execute("SELECT * FROM t WHERE a = %s", ('BAD',))
+    cursor.execute("SELECT * FROM t")
+    assert rows_of(cursor.fetchall()) == expected
+
+
+def test_result_sets_by_statement(server, connect):
+    server.result_sets["SELECT * FROM small"] = FourDMockResultSet(parse_columns('VK_LONG'),
+        row_count=3)
+    cursor = connect().cursor()
+    cursor.execute("SELECT * FROM small")
+    assert rows_of(cursor.fetchall()) == [(0,), (1,), (2,)]
+    assert server.commands['LOGIN'] == 1
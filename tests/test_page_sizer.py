@@ -0,0 +1,32 @@
+from fourd.lib import FourDPageSizer
+
+
+def test_grows_while_fast_and_shrinks_when_slow():
+    sizer = FourDPageSizer(page_size=100, target_latency=0.1)
+    assert sizer.next_page_size() == 100
+    sizer.observe(100, 1000, elapsed=0.01)
+    assert sizer.next_page_size() == 200
+    sizer.observe(200, 2000, elapsed=0.07)
+    assert sizer.next_page_size() == 200
+    sizer.observe(200, 2000, elapsed=0.2)
+    assert sizer.next_page_size() == 100
+    assert sizer.stats()['page_sizes'] == [100, 200, 200, 100]
+
+
+def test_bounds():
+    sizer = FourDPageSizer(page_size=1, min_page_size=5, max_page_size=50)
+    assert sizer.page_size == 5
+    for i in range(10):
+        sizer.observe(10, 100, elapsed=0)
+    assert sizer.page_size == 50
+    for i in range(10):
+        sizer.observe(10, 100, elapsed=10)
+    assert sizer.page_size == 5
+
+
+def test_page_bytes_caps_wide_rows():
+    sizer = FourDPageSizer(page_size=1000, page_bytes=10000)
+    sizer.observe(10, 1000, elapsed=0)
+    # 100 bytes per row
+    assert sizer.page_size == 100
+    assert sizer.row_bytes == 100
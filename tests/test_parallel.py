@@ -0,0 +1,46 @@
+from collections import Counter
+import pytest
+import fourd
+from fourd.parallel import key_ranges, parallel_fetch, parallel_pages
+from fourd.pool import FourDPool
+from conftest import rows_of
+
+
+def test_key_ranges():
+    assert key_ranges(0, 10, 3) == [(0, 3), (3, 6), (6, 10)]
+    assert key_ranges(0, 2, 4) == [(0, 1), (1, 2)]
+
+
+def test_fetch_range(connect, expected):
+    cursor = connect(res_size=10).cursor()
+    cursor.execute("SELECT * FROM t")
+    pages = list(cursor.result.fetch_range(100, 134, 10))
+    assert [len(page) for page in pages] == [10, 10, 10, 5]
+    assert rows_of(row for page in pages for row in page) == expected[100:135]
+
+
+@pytest.mark.parametrize('partitions', [1, 3])
+def test_row_index_partitions(server, expected, partitions):
+    rows = parallel_fetch("SELECT * FROM t ORDER BY id", partitions, page_size=50,
+        **server.connect_kwargs())
+    assert rows_of(rows) == expected
+
+
+def test_row_index_partitions_need_order_by(server):
+    with pytest.raises(fourd.ProgrammingError):
+        list(parallel_fetch("SELECT * FROM t", 3, **server.connect_kwargs()))
+
+
+def test_unordered_with_pool(server, expected):
+    pool = FourDPool(minconn=0, maxconn=3, **server.connect_kwargs())
+    pages = list(parallel_pages("SELECT * FROM t ORDER BY id", 3, ordered=False, pool=pool))
+    assert Counter(rows_of(row for page in pages for row in page)) == Counter(expected)
+    assert pool.stats()['checkouts'] == 3
+    pool.closeall()
+
+
+def test_ranges(server, expected):
+    rows = parallel_fetch("SELECT * FROM t WHERE id >= %s AND id < %s",
+        ranges=key_ranges(0, 100, 4), **server.connect_kwargs())
+    # the mock server answers every range with the whole result set
+    assert rows_of(rows) == expected*4
@@ -0,0 +1,151 @@
+import threading
+import time
+import pytest
+import fourd
+from fourd.pool import FourDPool
+
+
+class Cursor:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class Connection:
+    """Stand-in for a FourD_connection, the pool only manages its lifecycle"""
+    alive = True
+
+    def __init__(self):
+        self.connected = True
+        self.in_transaction = False
+        self.rolled_back = False
+        self.manager_cursor = Cursor()
+        self.cursors = [self.manager_cursor]
+        self.fourdconn = self
+
+    def is_alive(self):
+        return self.alive
+
+    def close(self):
+        self.connected = False
+
+    def commit(self):
+        self.in_transaction = False
+
+    def rollback(self):
+        self.in_transaction = False
+        self.rolled_back = True
+
+
+class Pool(FourDPool):
+    def _connect(self):
+        return Connection()
+
+
+def test_threads_share_the_pool():
+    pool = Pool(minconn=1, maxconn=3)
+    barrier = threading.Barrier(3)
+    seen = []
+
+    def work():
+        with pool.connection() as connection:
+            seen.append(connection)
+            barrier.wait(5)
+    threads = [threading.Thread(target=work) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(map(id, seen))) == 3
+    assert pool.stats()['size'] == 3
+    assert pool.stats()['in_use'] == 0
+    pool.closeall()
+
+
+def test_timeout():
+    pool = Pool(minconn=0, maxconn=1)
+    connection = pool.getconn()
+    with pytest.raises(fourd.OperationalError):
+        pool.getconn(timeout=0.05)
+    assert pool.stats()['timeouts'] == 1
+    pool.putconn(connection)
+    assert pool.getconn(timeout=0.05) is connection
+
+
+def test_reset_on_return():
+    pool = Pool(minconn=1, maxconn=1)
+    connection = pool.getconn()
+    cursor = Cursor()
+    connection.cursors.append(cursor)
+    connection.in_transaction = True
+    pool.putconn(connection)
+    assert cursor.closed and not connection.manager_cursor.closed
+    assert connection.cursors == [connection.manager_cursor]
+    assert connection.rolled_back
+
+
+def test_dead_connection_is_replaced():
+    pool = Pool(minconn=1, maxconn=1)
+    connection = pool.getconn()
+    pool.putconn(connection)
+    connection.alive = False
+    replacement = pool.getconn()
+    assert replacement is not connection
+    assert not connection.connected
+    assert pool.stats()['failed_checks'] == 1
+
+
+def test_max_lifetime():
+    pool = Pool(minconn=0, maxconn=1, max_lifetime=1e-9)
+    connection = pool.getconn()
+    pool.putconn(connection)
+    assert not connection.connected
+    assert pool.stats()['recycled'] == 1
+
+
+def test_idle_timeout_keeps_minconn():
+    pool = Pool(minconn=1, maxconn=3, idle_timeout=0.05)
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    assert pool.stats()['size'] == 2
+    time.sleep(0.1)
+    connection = pool.getconn()
+    assert pool.stats()['size'] == 1
+    pool.putconn(connection)
+    time.sleep(0.1)
+    assert pool.getconn() is connection
+
+
+def test_foreign_connection():
+    pool = Pool(minconn=0, maxconn=1)
+    with pytest.raises(fourd.ProgrammingError):
+        pool.putconn(Connection())
+    with pytest.raises(fourd.ProgrammingError):
+        Pool(minconn=2, maxconn=1)
+
+
+def test_is_alive(wire):
+    assert wire.fourdconn.is_alive()
+    wire.respond(b'0 OK\r\n\r\n')
+    assert not wire.fourdconn.is_alive()
+
+
+def test_pool_of_connections(server):
+    pool = FourDPool(minconn=1, maxconn=2, **server.connect_kwargs())
+    counts = []
+
+    def work():
+        with pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT * FROM t")
+            counts.append(len(cursor.fetchall()))
+    threads = [threading.Thread(target=work) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counts == [537]*4
+    assert pool.stats()['size'] <= 2
+    pool.closeall()
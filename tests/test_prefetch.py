@@ -0,0 +1,74 @@
+import pytest
+from conftest import Wire, ok, page, result_set, rows_of, update_count
+
+COLUMNS = [('id', 'VK_LONG8')]
+ROWS = [(i,) for i in range(7)]
+
+
+@pytest.fixture
+def wire():
+    # pages of two rows, two of them requested ahead
+    wire = Wire(prefetch=2, res_size=1)
+    yield wire
+    wire.close()
+
+
+def responses():
+    return [result_set(COLUMNS, ROWS[:1], row_count=7)]+[ok()+page(COLUMNS, ROWS[first:first+2])
+        for first in (1, 3, 5)]
+
+
+def test_rows(wire):
+    wire.respond(*responses())
+    response = wire.fourdconn.execute_statement("SELECT id FROM t", first_page_size=1)
+    assert list(response.rows()) == ROWS
+    assert wire.commands().count('FETCH-RESULT') == 3
+
+
+def test_column_pages(wire):
+    wire.respond(*responses())
+    response = wire.fourdconn.execute_statement("SELECT id FROM t", first_page_size=1)
+    assert [page[0] for page in response.column_pages()] == [[0], [1, 2], [3, 4], [5, 6]]
+
+
+def test_other_command_drains_prefetched_pages(wire):
+    wire.respond(*responses(), update_count(3))
+    response = wire.fourdconn.execute_statement("SELECT id FROM t", first_page_size=1)
+    rows = response.rows()
+    assert [next(rows), next(rows)] == ROWS[:2]
+    # the pages requested ahead are read before the response to the update
+    assert wire.fourdconn.execute_statement("UPDATE t SET id = 0").update_count == 3
+    assert list(rows) == ROWS[2:]
+    assert wire.commands().count('FETCH-RESULT') == 3
+
+
+def test_prefetch_pipelines_fetches(connect, server, expected):
+    connection = connect(res_size=10, prefetch=4)
+    cursor = connection.cursor()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchmany(15)
+    # the next pages were requested before the first was read
+    assert len(cursor.result._pending_pages)+len(cursor.result._parked_pages) == 4
+    other = connection.cursor()
+    other.execute("UPDATE t SET a = 1")
+    assert rows_of(cursor.fetchall()) == expected[15:]
+
+
+@pytest.mark.parametrize('options', [{}, {'prefetch': 2}, {'res_size': 20, 'prefetch': 4}])
+def test_cursors_sharing_a_connection(connect, expected, options):
+    connection = connect(**options)
+    first, second, third = connection.cursor(), connection.cursor(), connection.cursor()
+    first.execute("SELECT * FROM t")
+    second.execute("SELECT * FROM t")
+    first_rows, second_rows, third_rows = [], [], []
+    for page in first.result.fetch_range(100, 399, 30):
+        first_rows += rows_of(page)
+        second_rows += rows_of(second.fetchmany(7))
+    third.execute("SELECT * FROM t")
+    third_rows = rows_of(third.fetchmany(50))
+    second_rows += rows_of(second.fetchall())
+    third_rows += rows_of(third.fetchall())
+    assert first_rows == expected[100:400]
+    assert second_rows == expected
+    assert third_rows == expected
+    assert not connection.fourdconn.in_flight
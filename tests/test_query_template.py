@@ -0,0 +1,42 @@
+import pytest
+from fourd.fourd import compile_query, in_list_size
+
+
+@pytest.mark.parametrize('count, size', [(1, 1), (3, 4), (4, 4), (1000, 1024), (1025, 2048)])
+def test_in_list_size(count, size):
+    assert in_list_size(count) == size
+
+
+def test_format_style():
+    template = compile_query("SELECT * FROM t WHERE a = %s AND b = %d")
+    assert template.bind((1, 2)) == ("SELECT * FROM t WHERE a = ? AND b = ?", (1, 2))
+    assert compile_query("SELECT * FROM t WHERE a = %s AND b = %d") is template
+
+
+def test_named_styles_bound_in_text_order():
+    template = compile_query("UPDATE t SET a = :a WHERE b = %(b)s AND c = :a", named=True)
+    query, params = template.bind({'a': 1, 'b': 2})
+    assert query == "UPDATE t SET a = ? WHERE b = ? AND c = ?"
+    assert params == [1, 2, 1]
+
+
+def test_in_lists_are_padded():
+    template = compile_query("SELECT * FROM t WHERE a IN %s AND b = %s")
+    query, params = template.bind(([1, 2, 3], 'x'))
+    assert query == "SELECT * FROM t WHERE a IN (?,?,?,?) AND b = ?"
+    assert params == [1, 2, 3, 3, 'x']
+
+
+def test_other_sequences_are_expanded_as_is():
+    template = compile_query("INSERT INTO t VALUES %s")
+    assert template.bind(((1, 2, 3),)) == ("INSERT INTO t VALUES (?,?,?)", [1, 2, 3])
+
+
+def test_cursor_binds_through_the_template(connect, server):
+    cursor = connect().cursor()
+    statement_cache = cursor.fourdconn.statement_cache
+    cursor.execute("SELECT * FROM t WHERE id IN %s", ([1, 2, 3],))
+    misses = statement_cache.stats()['misses']
+    # padded to the same length, so the prepared statement is reused
+    cursor.execute("SELECT * FROM t WHERE id IN %s", ([4, 5, 6, 7],))
+    assert statement_cache.stats()['misses'] == misses
@@ -0,0 +1,66 @@
+import socket
+import struct
+import pytest
+import fourd
+from fourd.lib import FourDWireReader, STRUCT_VK_LONG, STRUCT_VK_REAL
+
+
+@pytest.fixture
+def pair():
+    client, server = socket.socketpair()
+    yield client, server
+    client.close()
+    server.close()
+
+
+def test_headers_and_values_share_the_buffer(pair):
+    client, server = pair
+    server.sendall(b'000 OK\r\nRow-Count:2\r\n\r\n' + struct.pack('<ld', 7, 1.5) + b'tail')
+    reader = FourDWireReader(client)
+    assert reader.read_until(b'\r\n\r\n') == b'000 OK\r\nRow-Count:2\r\n\r\n'
+    assert reader.unpack(STRUCT_VK_LONG) == (7,)
+    assert reader.unpack(STRUCT_VK_REAL) == (1.5,)
+    assert reader.read(4) == b'tail'
+    assert reader.recv_calls == 1
+    assert reader.available == 0
+
+
+def test_values_across_chunks(pair):
+    client, server = pair
+    data = bytes(range(256))*8
+    server.sendall(b'H\r\n\r\n' + data)
+    reader = FourDWireReader(client, chunk_size=16)
+    assert reader.read_until(b'\r\n\r\n') == b'H\r\n\r\n'
+    assert reader.read(10) == data[:10]
+    assert reader.read(1000) == data[10:1010]
+    assert reader.read(len(data)-1010) == data[1010:]
+    assert reader.bytes_received == len(data)+5
+
+
+def test_delimiter_split_between_receives(pair):
+    client, server = pair
+    reader = FourDWireReader(client, chunk_size=8)
+    server.sendall(b'000 OK\r\nA:1\r')
+    server.sendall(b'\n\r\nrest')
+    assert reader.read_until(b'\r\n\r\n') == b'000 OK\r\nA:1\r\n\r\n'
+    assert reader.read(4) == b'rest'
+
+
+def test_closed_connection(pair):
+    client, server = pair
+    server.sendall(b'abc')
+    server.close()
+    reader = FourDWireReader(client)
+    with pytest.raises(fourd.OperationalError):
+        reader.read(4)
+
+
+def test_buffer_shrinks_after_a_large_value(pair):
+    client, server = pair
+    large = bytes(range(256))*4
+    server.sendall(large + b'small')
+    reader = FourDWireReader(client, chunk_size=16)
+    assert reader.read(len(large)) == large
+    assert len(reader.buffer) >= len(large)
+    assert reader.read(5) == b'small'
+    assert len(reader.buffer) == 16
@@ -0,0 +1,50 @@
+import pytest
+import fourd
+from fourd.fourd import FourD_dict_cursor, FourD_record_cursor
+from fourd.lib import record_class, row_class
+from conftest import rows_of
+
+
+def test_row_classes_are_shared():
+    assert row_class(('a', 'b')) is row_class(('a', 'b'))
+    assert row_class(('count(*)', 'b'))._fields == ('_0', 'b')
+    record = record_class(('a', 'b'))._make([1, 2])
+    assert (record.a, record[1], record[:], len(record)) == (1, 2, (1, 2), 2)
+    assert record == (1, 2) and record._asdict() == {'a': 1, 'b': 2}
+    assert not hasattr(record, '__dict__')
+
+
+@pytest.mark.parametrize('row_format', ['namedtuple', 'tuple', 'dict', 'record', 'lazy'])
+def test_row_formats(connect, expected, row_format):
+    cursor = connect(row_format=row_format, res_size=50).cursor()
+    cursor.execute("SELECT * FROM t")
+    rows = cursor.fetchall()
+    if row_format == 'dict':
+        assert list(rows[0]) == ['id', 'name', 'amount', 'created', 'active', 'data']
+        rows = [row.values() for row in rows]
+    elif row_format == 'tuple':
+        assert type(rows[0]) is tuple
+    assert rows_of(rows) == expected
+
+
+def test_result_sets_share_the_row_class(connect):
+    cursor = connect().cursor()
+    cursor.execute("SELECT * FROM t")
+    first = cursor.fetchone()
+    cursor.execute("SELECT * FROM t")
+    assert type(cursor.fetchone()) is type(first)
+
+
+def test_cursor_formats(connect, expected):
+    connection = connect()
+    cursor = connection.cursor(FourD_dict_cursor)
+    cursor.execute("SELECT * FROM t")
+    assert cursor.fetchone()['id'] == expected[0][0]
+    cursor = connection.cursor(FourD_record_cursor)
+    cursor.execute("SELECT * FROM t")
+    assert cursor.fetchone().name == expected[0][1]
+    cursor.row_format = 'tuple'
+    cursor.execute("SELECT * FROM t")
+    assert type(cursor.fetchone()) is tuple
+    with pytest.raises(fourd.ProgrammingError):
+        connect(row_format='xml')
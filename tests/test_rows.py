@@ -0,0 +1,22 @@
+import pytest
+from conftest import result_set
+
+COLUMNS = [('id', 'VK_LONG8'), ('name', 'VK_STRING'), ('amount', 'VK_REAL'),
+    ('active', 'VK_BOOLEAN'), ('data', 'VK_BLOB')]
+ROWS = [(1, 'one', 1.5, True, b'\x01'), (2, None, None, False, b''), (3, 'três', -2.0, None, None)]
+
+
+@pytest.mark.parametrize('updatable', [False, True])
+def test_rows_are_decoded(wire, updatable):
+    wire.respond(result_set(COLUMNS, ROWS, updatable=updatable))
+    response = wire.fourdconn.execute_statement("SELECT * FROM t", first_page_size=10)
+    assert [column.name for column in response.columns] == [name for name, dtype in COLUMNS]
+    rows = list(response.rows())
+    assert rows == ROWS
+    assert rows[2].name == 'três'
+
+
+def test_unknown_type(wire):
+    wire.respond(result_set([('x', 'VK_LONG8')], [(1,)]).replace(b'VK_LONG8', b'VK_NOPE'))
+    with pytest.raises(Exception, match='VK_NOPE'):
+        wire.fourdconn.execute_statement("SELECT x FROM t", first_page_size=10)
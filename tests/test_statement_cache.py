@@ -0,0 +1,57 @@
+from datetime import datetime
+from fourd.lib import FourDStatementCache
+
+
+def test_key_normalizes_text_and_types():
+    cache = FourDStatementCache(None)
+    assert cache.key(" SELECT 1 ") == cache.key("SELECT 1")
+    assert cache.key("SELECT ?", (1,)) == cache.key("SELECT ?", (2,))
+    assert cache.key("SELECT ?", (1,)) != cache.key("SELECT ?", ('1',))
+    assert cache.key("SELECT ?", (datetime.now(),)) != cache.key("SELECT ?", (None,))
+
+
+def test_hits_misses_and_evictions():
+    cache = FourDStatementCache(None, size=2)
+    for i in range(3):
+        key = cache.key("SELECT %d" % i)
+        assert not cache.get(key)
+        cache.put(key)
+    assert cache.get(cache.key("SELECT 2"))
+    # the least recently used statement was dropped
+    assert not cache.get(cache.key("SELECT 0"))
+    assert cache.stats() == dict(size=2, entries=2, hits=1, misses=4, evictions=1)
+
+
+def test_get_refreshes_entry():
+    cache = FourDStatementCache(None, size=2)
+    cache.put('a')
+    cache.put('b')
+    cache.get('a')
+    cache.put('c')
+    assert list(cache.statements) == ['a', 'c']
+
+
+def test_size_zero_disables_caching():
+    cache = FourDStatementCache(None, size=0)
+    cache.put('a')
+    assert not cache.get('a')
+    assert len(cache) == 0
+
+
+def test_cursor_counts_hits_and_misses(connect, server):
+    connection = connect()
+    cache = connection.fourdconn.statement_cache
+    cursor = connection.cursor()
+    cursor.execute("SELECT * FROM t WHERE id = %s", (1,))
+    cursor.fetchall()
+    misses = cache.misses
+    server.commands.clear()
+    cursor.execute("SELECT * FROM t WHERE id = %s", (2,))
+    cursor.fetchall()
+    assert (cache.hits, cache.misses) == (1, misses)
+    assert server.commands['PREPARE-STATEMENT'] == 0
+    # another parameter type is another statement
+    cursor.execute("SELECT * FROM t WHERE id = %s", ('2',))
+    cursor.fetchall()
+    assert cache.misses == misses+1
+    assert server.commands['PREPARE-STATEMENT'] == 1
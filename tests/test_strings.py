@@ -0,0 +1,63 @@
+import socket
+import pytest
+from fourd.lib import FourDResponse, FourDWireReader
+from conftest import Wire, encode_value, result_set
+
+COLUMNS = [('code', 'VK_STRING'), ('label', 'VK_TEXT'), ('id', 'VK_LONG8')]
+ROWS = [(['ab', 'cd'][i%2], ['été', 'hiver', 'automne'][i%3], i) for i in range(12)]
+
+
+def fetch(rows=ROWS, **kwargs):
+    wire = Wire(**kwargs)
+    try:
+        wire.respond(result_set(COLUMNS, rows))
+        response = wire.fourdconn.execute_statement("SELECT * FROM t", first_page_size=len(rows))
+        return list(response.rows())
+    finally:
+        wire.close()
+
+
+def test_read_text_across_chunks():
+    client, server = socket.socketpair()
+    try:
+        values = ['', 'a', 'hé'*20, '\U0001f600']
+        server.sendall(b''.join(encode_value('VK_STRING', value)[1:] for value in values))
+        reader = FourDWireReader(client, chunk_size=8)
+        assert [reader.read_text() for value in values] == values
+    finally:
+        client.close()
+        server.close()
+
+
+def test_strings_are_not_interned_by_default():
+    rows = fetch()
+    assert rows == ROWS
+    assert rows[0].code is not rows[2].code
+
+
+def test_intern_strings():
+    rows = fetch(intern_strings=True)
+    assert rows == ROWS
+    assert rows[0].code is rows[2].code
+    assert rows[3].label is rows[6].label
+
+
+def test_intern_named_columns():
+    rows = fetch(intern_strings={'label'})
+    assert rows[0].code is not rows[2].code
+    assert rows[3].label is rows[6].label
+
+
+def test_text_spooled_through_lob_threshold_is_not_interned():
+    rows = fetch(intern_strings=True, lob_threshold=1024)
+    assert rows[0].code is rows[2].code
+    assert rows[3].label.text() == rows[6].label.text() == 'été'
+
+
+def test_intern_limit(monkeypatch):
+    monkeypatch.setattr(FourDResponse, 'intern_limit', 2)
+    rows = fetch([('v%d'%(i%3), 'x', i) for i in range(6)], intern_strings={'code'})
+    assert rows[0].code is rows[3].code
+    assert rows[1].code is rows[4].code
+    # the third distinct value came after the limit
+    assert rows[2].code is not rows[5].code
@@ -0,0 +1,89 @@
+import logging
+import pytest
+import fourd
+from fourd.lib import FourD
+from fourd.mockserver import FourDMockServer
+from fourd.tracing import FourDCallbackTracer, FourDHistogramTracer, FourDTraceEvent, \
+    NO_TRACE, latency_buckets
+
+
+def traced(connect, **kwargs):
+    events = []
+    connection = connect(tracer=FourDCallbackTracer(after=events.append), **kwargs)
+    return connection, events
+
+
+def test_no_tracer():
+    assert FourD().trace('execute') is NO_TRACE
+
+
+def test_execute_and_fetch_events(connect, expected):
+    connection, events = traced(connect, res_size=100)
+    cursor = connection.cursor()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchall()
+    execute = [event for event in events if event.kind == 'execute'][-1]
+    assert execute.statement == "SELECT * FROM t"
+    assert execute.statement_id is not None
+    assert execute.rows == 100
+    assert execute.bytes_received > 0 and execute.bytes_sent > 0
+    assert execute.elapsed >= execute.network_time >= 0
+    fetches = [event for event in events if event.kind == 'fetch']
+    assert sum(event.rows for event in fetches)+execute.rows == len(expected)
+    assert {event.statement_id for event in fetches} == {execute.statement_id}
+    assert 'prepare' in [event.kind for event in events]
+    connection.close()
+    assert events[-1].kind == 'close'
+
+
+def test_error_event(connect):
+    connection, events = traced(connect)
+    with pytest.raises(fourd.ProgrammingError):
+        connection.cursor().execute("SELECT * FROM t WHERE a = %s", ('BAD',))
+    assert isinstance(events[-1].error, fourd.ProgrammingError)
+
+
+def test_before_and_after(connect):
+    calls = []
+    connection = connect()
+    connection.tracer = FourDCallbackTracer(before=lambda event: calls.append(('before', event.kind)),
+        after=lambda event: calls.append(('after', event.kind)))
+    connection.cursor().executemany("UPDATE t SET a = %s", [(1,), (2,)])
+    assert calls.count(('before', 'execute')) == calls.count(('after', 'execute')) >= 2
+    connection.tracer = None
+    calls.clear()
+    connection.cursor().execute("UPDATE t SET a = 1")
+    assert calls == []
+
+
+def test_histogram_tracer(mock_result_set, caplog):
+    tracer = FourDHistogramTracer(slow_query_time=0.01, keep_slowest=2)
+    with FourDMockServer(mock_result_set, latency=0.02) as server:
+        connection = fourd.connect(**server.connect_kwargs(), tracer=tracer)
+        cursor = connection.cursor()
+        with caplog.at_level(logging.WARNING, logger='fourd'):
+            for i in range(3):
+                cursor.execute("UPDATE t SET a = %s", (i,))
+        connection.close()
+    stats = tracer.stats()
+    assert stats['execute']['count'] >= 3
+    assert len(tracer.slowest) == 2
+    assert tracer.percentile('execute', 50) >= 0.02
+    statement, statement_stats = tracer.top_statements(1)[0]
+    assert statement_stats['count'] >= 3
+    assert 'Slow execute' in caplog.text
+
+
+def test_histogram_buckets():
+    tracer = FourDHistogramTracer(buckets=[0.1, 1])
+    for elapsed in (0.05, 0.5, 0.5, 5):
+        event = FourDTraceEvent('fetch')
+        event.elapsed = elapsed
+        tracer.after(event)
+    assert tracer.histogram('fetch') == [(0.1, 1), (1, 2), (None, 1)]
+    assert tracer.percentile('fetch', 50) == 1
+    assert tracer.percentile('fetch', 100) is None
+    assert tracer.percentile('execute', 50) is None
+    assert latency_buckets(1, 10, 3) == (1, 10, 100)
+    tracer.reset()
+    assert tracer.stats() == {}
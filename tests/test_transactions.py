@@ -0,0 +1,153 @@
+import base64
+import time
+import pytest
+import fourd
+from conftest import rows_of
+
+
+def test_start_transaction_pipelined_with_prepare(connect, server):
+    connection = connect()
+    fourdconn = connection.fourdconn
+    sends = fourdconn.send_calls
+    connection.cursor().execute("UPDATE t SET a = 1")
+    # START TRANSACTION with the PREPARE, then the EXECUTE
+    assert fourdconn.send_calls-sends == 2
+    assert connection.in_transaction
+    connection.commit()
+    assert not connection.in_transaction
+    assert server.commands['EXECUTE-STATEMENT'] == 3
+    # COMMIT is not prepared
+    assert server.commands['PREPARE-STATEMENT'] == 1
+
+
+def test_empty_transaction_sends_nothing(connect, server):
+    connection = connect()
+    sends = connection.fourdconn.send_calls
+    connection._start_transaction()
+    connection.commit()
+    connection.rollback()
+    assert connection.fourdconn.send_calls == sends
+
+
+def test_failed_start_does_not_run_cached_statement(connect, server):
+    connection = connect()
+    cursor = connection.cursor()
+    cursor.execute("UPDATE t SET a = 1")
+    connection.commit()
+    server.errors.add("START TRANSACTION;")
+    server.commands.clear()
+    with pytest.raises(fourd.ProgrammingError):
+        cursor.execute("UPDATE t SET a = 1")
+    # only START TRANSACTION reached the server
+    assert server.commands['EXECUTE-STATEMENT'] == 1
+    assert not connection.in_transaction
+    server.errors.discard("START TRANSACTION;")
+    cursor.execute("UPDATE t SET a = 1")
+    assert connection.in_transaction
+    connection.commit()
+
+
+def test_failed_start_with_prepare(connect, server, expected):
+    connection = connect()
+    server.errors.add("START TRANSACTION;")
+    cursor = connection.cursor()
+    with pytest.raises(fourd.ProgrammingError):
+        cursor.execute("SELECT * FROM t")
+    assert not connection.in_transaction
+    server.errors.discard("START TRANSACTION;")
+    cursor.execute("SELECT * FROM t")
+    assert rows_of(cursor.fetchall()) == expected
+
+
+def test_context_manager(connect, server):
+    connection = connect()
+    with connection:
+        connection.cursor().execute("UPDATE t SET a = 1")
+    assert not connection.in_transaction
+    with pytest.raises(fourd.ProgrammingError):
+        with connection:
+            connection.cursor().execute("UPDATE t SET a = %s", ('BAD',))
+    assert not connection.in_transaction
+
+
+def test_auto_reconnect_between_transactions(server, connect, expected):
+    connection = connect(auto_reconnect=True)
+    cursor = connection.cursor()
+    cursor.execute("SELECT * FROM t")
+    cursor.fetchall()
+    connection.commit()
+    server.drop_connections()
+    time.sleep(0.05)
+    cursor.execute("SELECT * FROM t")
+    assert rows_of(cursor.fetchall()) == expected
+    assert connection.fourdconn.reconnects == 1
+
+
+def test_no_reconnect_by_default(server, connect):
+    connection = connect()
+    connection.cursor().execute("SELECT * FROM t")
+    connection.commit()
+    server.drop_connections()
+    time.sleep(0.05)
+    with pytest.raises((fourd.OperationalError, OSError)):
+        connection.cursor().execute("SELECT * FROM t")
+
+
+def test_reconnect_keeps_the_statement_cache(server, connect, expected):
+    connection = connect(res_size=10)
+    cursor = connection.cursor()
+    cursor.execute("SELECT * FROM t WHERE id = %s", (1,))
+    rows = cursor.result.rows()
+    next(rows)
+    server.commands.clear()
+    connection.fourdconn.reconnect()
+    assert server.commands['LOGIN'] == 1
+    # no PREPARE is replayed
+    assert server.commands['PREPARE-STATEMENT'] == 0
+    with pytest.raises(fourd.OperationalError):
+        list(rows)
+    cursor.execute("SELECT * FROM t WHERE id = %s", (2,))
+    assert rows_of(cursor.fetchall()) == expected
+    assert server.commands['PREPARE-STATEMENT'] == 0
+
+
+def test_pipeline_login(server, connect):
+    connection = connect(pipeline_login=True)
+    assert connection.fourdconn.send_calls == 0
+    connection.cursor().execute("UPDATE t SET a = 1")
+    connection.commit()
+    assert server.commands['LOGIN'] == 1
+
+
+def sent_commands(fourdconn, monkeypatch):
+    """Record the commands fourdconn writes, as (command, statement) pairs"""
+    commands = []
+    send = fourdconn._socket_send
+
+    def record(data):
+        for block in bytes(data).split(b'\r\n\r\n'):
+            lines = block.split(b'\r\n')
+            if lines[0][:1].isdigit():
+                headers = dict(line.split(b': ', 1) for line in lines[1:] if b': ' in line)
+                statement = headers.get(b'STATEMENT-BASE64')
+                commands.append((lines[0].split()[1].decode(),
+                    statement and base64.b64decode(statement).decode()))
+        send(data)
+    monkeypatch.setattr(fourdconn, '_socket_send', record)
+    return commands
+
+
+@pytest.mark.parametrize('pipeline_login', [False, True])
+def test_reconnect_drops_queued_start_transaction(connect, server, monkeypatch, pipeline_login):
+    connection = connect(pipeline_login=pipeline_login)
+    connection.cursor().execute("UPDATE t SET a = 1")
+    connection.commit()
+    commands = sent_commands(connection.fourdconn, monkeypatch)
+    connection._start_transaction()
+    connection.reconnect()
+    assert not connection.in_transaction
+    connection.cursor().execute("UPDATE t SET a = 1")
+    connection.commit()
+    assert commands[0] == ('LOGIN', None)
+    assert commands.count(('EXECUTE-STATEMENT', 'START TRANSACTION;')) == 1
+    assert commands[-1] == ('EXECUTE-STATEMENT', 'COMMIT;')